@@ -1,11 +1,14 @@
-from typing import List, Optional
+from typing import Any, Dict, List, Optional
 
 from fastapi import APIRouter, Depends, HTTPException, Query, status
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.api import deps
+from app.core.config import settings
 from app.db import crud
 from app.schemas.movie import Movie, MovieCreate, MovieInList, MovieUpdate
+from app.services.popularity import get_trending_recommendations
+from app.services.recommender.predict import get_similar_movies
 
 router = APIRouter()
 
@@ -36,6 +39,19 @@ async def create_movie(
     return await crud.movie.get(db, id=created_movie_orm.id)
 
 
+@router.get("/trending", response_model=List[Dict[str, Any]])
+async def read_trending_movies(
+    db: AsyncSession = Depends(deps.get_db),
+    genre: Optional[str] = None,
+    count: int = Query(10, ge=1, le=100),
+):
+    """
+    Get the movies trending right now (most rated in the recent time window),
+    optionally restricted to a single genre.
+    """
+    return await get_trending_recommendations(db, count=count, genre=genre)
+
+
 @router.get("/{movie_id}", response_model=Movie)
 async def read_movie(
     *,
@@ -51,6 +67,25 @@ async def read_movie(
     return movie_with_details
 
 
+@router.get("/{movie_id}/similar", response_model=List[Dict[str, Any]])
+async def read_similar_movies(
+    *,
+    db: AsyncSession = Depends(deps.get_db),
+    movie_id: int,
+    count: int = Query(10, ge=1, le=settings.SIMILAR_MOVIES_K),
+):
+    """
+    Get the movies most similar to the given one, according to the trained
+    model's movie embeddings (precomputed after each training run).
+    """
+    similar = await get_similar_movies(db, movie_id=movie_id, count=count)
+    if similar is None:
+        raise HTTPException(
+            status_code=503, detail="Similar movies are not available yet."
+        )
+    return similar
+
+
 @router.get("/", response_model=List[MovieInList])
 async def read_movies(
     db: AsyncSession = Depends(deps.get_db),
@@ -1,14 +1,26 @@
-from typing import List
+import json
+from typing import Any, AsyncIterator, List, Tuple
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from pydantic import ValidationError
+from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.api import deps
 from app.db import crud, models
-from app.schemas.rating import Rating, RatingCreate
+from app.schemas.rating import (
+    Rating,
+    RatingBulkItemResult,
+    RatingBulkResult,
+    RatingCreate,
+)
+from app.services.catalog import movie_ids
 
 router = APIRouter()
 
+BULK_CHUNK_SIZE = 1000
+NDJSON_MEDIA_TYPES = {"application/x-ndjson", "application/ndjson", "application/jsonl"}
+
 
 @router.post("/", response_model=Rating, status_code=status.HTTP_201_CREATED)
 async def create_rating(
@@ -20,8 +32,8 @@ async def create_rating(
     """
     Create a new rating for a movie by the current user.
     """
-    movie = await crud.movie.get(db, id=rating_in.movie_id)
-    if not movie:
+    # Existence check against the in-memory id set instead of loading the movie
+    if await movie_ids.find_unknown(db, [rating_in.movie_id]):
         raise HTTPException(
             status_code=404,
             detail=f"Movie with ID {rating_in.movie_id} not found. Cannot add rating.",
@@ -37,6 +49,151 @@ async def create_rating(
     return rating
 
 
+async def _iter_bulk_items(request: Request) -> AsyncIterator[Tuple[int, Any]]:
+    """Yields (index, raw item) from a JSON array body or an NDJSON stream."""
+    content_type = request.headers.get("content-type", "").split(";")[0].strip()
+    if content_type.lower() in NDJSON_MEDIA_TYPES:
+        index = 0
+        buffer = b""
+        async for body_chunk in request.stream():
+            buffer += body_chunk
+            *lines, buffer = buffer.split(b"\n")
+            for line in lines:
+                if line.strip():
+                    yield index, line
+                    index += 1
+        if buffer.strip():
+            yield index, buffer
+        return
+
+    try:
+        payload = await request.json()
+    except json.JSONDecodeError:
+        raise HTTPException(status_code=400, detail="Request body is not valid JSON.")
+    if not isinstance(payload, list):
+        raise HTTPException(
+            status_code=422, detail="Expected a JSON array of ratings or NDJSON."
+        )
+    for index, item in enumerate(payload):
+        yield index, item
+
+
+async def _ingest_chunk(
+    db: AsyncSession,
+    chunk: List[Tuple[int, RatingCreate]],
+    user_id: int,
+    results: List[RatingBulkItemResult],
+) -> None:
+    unknown_movie_ids = await movie_ids.find_unknown(
+        db, (rating_in.movie_id for _, rating_in in chunk)
+    )
+    to_insert = []
+    for index, rating_in in chunk:
+        if rating_in.movie_id in unknown_movie_ids:
+            results.append(
+                RatingBulkItemResult(
+                    index=index,
+                    status="movie_not_found",
+                    movie_id=rating_in.movie_id,
+                    detail=f"Movie with ID {rating_in.movie_id} not found.",
+                )
+            )
+        else:
+            to_insert.append((index, rating_in))
+
+    try:
+        rating_ids = await crud.rating.create_multi_with_owner(
+            db, objs_in=[rating_in for _, rating_in in to_insert], user_id=user_id
+        )
+    except SQLAlchemyError as e:
+        await db.rollback()
+        for index, rating_in in to_insert:
+            results.append(
+                RatingBulkItemResult(
+                    index=index,
+                    status="error",
+                    movie_id=rating_in.movie_id,
+                    detail=f"Database error while inserting chunk: {type(e).__name__}",
+                )
+            )
+        return
+
+    for (index, rating_in), rating_id in zip(to_insert, rating_ids):
+        results.append(
+            RatingBulkItemResult(
+                index=index,
+                status="created",
+                rating_id=rating_id,
+                movie_id=rating_in.movie_id,
+            )
+        )
+
+
+@router.post(
+    "/bulk",
+    response_model=RatingBulkResult,
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {
+                "application/json": {
+                    "schema": {
+                        "type": "array",
+                        "items": {"$ref": "#/components/schemas/RatingCreate"},
+                    }
+                },
+                "application/x-ndjson": {
+                    "schema": {"$ref": "#/components/schemas/RatingCreate"}
+                },
+            },
+        }
+    },
+)
+async def create_ratings_bulk(
+    request: Request,
+    db: AsyncSession = Depends(deps.get_db),
+    current_user: models.User = Depends(deps.get_current_active_user),
+):
+    """
+    Create many ratings for the current user in one request.
+    Accepts a JSON array or an NDJSON stream (Content-Type: application/x-ndjson).
+    Movie ids are validated against an in-memory id set and ratings are inserted
+    with one multi-row INSERT per chunk. Returns a status for every item.
+    """
+    results: List[RatingBulkItemResult] = []
+    chunk: List[Tuple[int, RatingCreate]] = []
+
+    async for index, raw_item in _iter_bulk_items(request):
+        try:
+            if isinstance(raw_item, bytes):
+                rating_in = RatingCreate.model_validate_json(raw_item)
+            else:
+                rating_in = RatingCreate.model_validate(raw_item)
+        except ValidationError as e:
+            results.append(
+                RatingBulkItemResult(
+                    index=index,
+                    status="invalid",
+                    detail=str(e.errors(include_url=False)),
+                )
+            )
+            continue
+
+        chunk.append((index, rating_in))
+        if len(chunk) >= BULK_CHUNK_SIZE:
+            await _ingest_chunk(db, chunk, current_user.id, results)
+            chunk = []
+
+    if chunk:
+        await _ingest_chunk(db, chunk, current_user.id, results)
+
+    results.sort(key=lambda item: item.index)
+    created = sum(1 for item in results if item.status == "created")
+    return RatingBulkResult(
+        created=created, failed=len(results) - created, results=results
+    )
+
+
 @router.get("/user/me", response_model=List[Rating])
 async def read_my_ratings(
     db: AsyncSession = Depends(deps.get_db),
@@ -1,38 +1,93 @@
-from typing import Any, Dict, List
+import json
+import logging
+from typing import Any, AsyncIterator, Dict, List, Optional, Set
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.api import deps
-from app.db import models
-from app.services.recommender.predict import get_recommendations_for_user
+from app.core.config import settings
+from app.db import crud, models
+from app.db.session import AsyncSessionLocal
+from app.schemas.recommendation import RecommendationBatchRequest
+from app.services.popularity import get_trending_recommendations
+from app.services.recommender.predict import (
+    get_recommendations_for_user,
+    recommend_for_histories,
+    refresh_model_in_background,
+)
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
 
+GENRES_QUERY = Query(
+    None,
+    description="Comma-separated genres; only movies matching ALL are recommended",
+)
+
+
+def _parse_genres(genres: Optional[str]) -> Optional[List[str]]:
+    if not genres:
+        return None
+    parsed_genres = [genre.strip() for genre in genres.split(",") if genre.strip()]
+    return parsed_genres or None
+
+
+async def _fill_with_trending(
+    db: AsyncSession,
+    user: models.User,
+    recommendations: List[Dict[str, Any]],
+    count: int,
+    genres: Optional[List[str]] = None,
+    exclude_watched: bool = True,
+) -> List[Dict[str, Any]]:
+    """Cold-start / fallback: top up personalised results with trending movies."""
+    if len(recommendations) >= count:
+        return recommendations
+    # Trending lists exist overall and per single genre only
+    if genres and len(genres) > 1:
+        return recommendations
+    excluded = [rec["movie_id"] for rec in recommendations]
+    if exclude_watched:
+        excluded += await crud.rating.get_rated_movie_ids(db, user_id=user.id)
+    trending = await get_trending_recommendations(
+        db,
+        count=count - len(recommendations),
+        genre=genres[0] if genres else None,
+        exclude_movie_ids=excluded,
+    )
+    return recommendations + trending
+
+
 @router.get("/user/me", response_model=List[Dict[str, Any]])
 async def get_my_recommendations(
     db: AsyncSession = Depends(deps.get_db),
     current_user: models.User = Depends(deps.get_current_active_user),
     exclude_watched: bool = True,
     count: int = 10,
+    genres: Optional[str] = GENRES_QUERY,
 ):
     """
     Get movie recommendations for the currently authenticated user.
     """
     if count <= 0 or count > 50:
         count = 10
+    parsed_genres = _parse_genres(genres)
 
     recommendations = await get_recommendations_for_user(
         db=db,
         user=current_user,
         exclude_watched=exclude_watched,
         num_recommendations=count,
+        genres=parsed_genres,
+    )
+    return await _fill_with_trending(
+        db, current_user, recommendations, count, parsed_genres, exclude_watched
     )
-    if not recommendations:
-
-        pass
-    return recommendations
 
 
 @router.get("/user/{user_id}", response_model=List[Dict[str, Any]])
@@ -42,6 +97,7 @@ async def get_user_recommendations(
     # current_user: models.User = Depends(deps.get_current_active_user), # Optional: admin check
     exclude_watched: bool = True,
     count: int = 10,
+    genres: Optional[str] = GENRES_QUERY,
 ):
     """
     Get movie recommendations for a specific user ID.
@@ -53,11 +109,157 @@ async def get_user_recommendations(
 
     if count <= 0 or count > 50:
         count = 10
+    parsed_genres = _parse_genres(genres)
 
     recommendations = await get_recommendations_for_user(
         db=db,
         user=target_user,
         exclude_watched=exclude_watched,
         num_recommendations=count,
+        genres=parsed_genres,
+    )
+    return await _fill_with_trending(
+        db, target_user, recommendations, count, parsed_genres, exclude_watched
+    )
+
+
+async def _iter_target_user_ids(
+    db: AsyncSession, request_in: RecommendationBatchRequest, batch_size: int
+) -> AsyncIterator[List[int]]:
+    """Yields the requested user ids in batches; explicit ids keep their order."""
+    if request_in.user_ids is not None:
+        unique_ids = list(dict.fromkeys(request_in.user_ids))
+        for start in range(0, len(unique_ids), batch_size):
+            yield unique_ids[start : start + batch_size]
+        return
+
+    user_filter = request_in.filter
+    remaining = user_filter.max_users
+    after_id = 0
+    while remaining is None or remaining > 0:
+        limit = batch_size if remaining is None else min(batch_size, remaining)
+        user_ids = await crud.user.get_ids(
+            db,
+            after_id=after_id,
+            limit=limit,
+            active_only=user_filter.active_only,
+            rated_since=user_filter.rated_since,
+            min_ratings=user_filter.min_ratings,
+        )
+        if not user_ids:
+            return
+        yield user_ids
+        after_id = user_ids[-1]
+        if remaining is not None:
+            remaining -= len(user_ids)
+
+
+async def _top_up_from_trending(
+    db: AsyncSession,
+    recommendations: List[Dict[str, Any]],
+    trending: List[Dict[str, Any]],
+    rated_ids: Set[int],
+    count: int,
+    genre: Optional[str],
+    trending_depth: int,
+) -> List[Dict[str, Any]]:
+    """Tops up from the shared trending list, querying only if it runs dry."""
+    excluded = rated_ids | {rec["movie_id"] for rec in recommendations}
+    missing = count - len(recommendations)
+    filler = [rec for rec in trending if rec["movie_id"] not in excluded][:missing]
+    if len(filler) < missing and len(trending) >= trending_depth:
+        # Heavy raters can exclude the whole shared list; a shorter list
+        # already holds every trending movie, so re-querying cannot help
+        filler = await get_trending_recommendations(
+            db, count=missing, genre=genre, exclude_movie_ids=list(excluded)
+        )
+    return recommendations + filler
+
+
+async def _stream_batch_recommendations(
+    request_in: RecommendationBatchRequest,
+    batch_size: int = settings.RECOMMENDATION_BATCH_SIZE,
+) -> AsyncIterator[str]:
+    # The stream outlives the request dependencies, so it uses its own session
+    async with AsyncSessionLocal() as db:
+        refresh_model_in_background()
+        trending: List[Dict[str, Any]] = []
+        genres = request_in.genres or None
+        trending_depth = request_in.count + settings.MAX_CONTEXT_LENGTH * 2
+        if request_in.fill_with_trending and not (genres and len(genres) > 1):
+            # Non-personalised, so fetched once and shared by every user in the job;
+            # deep enough to fill up after dropping a whole (recent) history
+            trending = await get_trending_recommendations(
+                db,
+                count=trending_depth,
+                genre=genres[0] if genres else None,
+            )
+
+        async for user_ids in _iter_target_user_ids(db, request_in, batch_size):
+            known_ids = set(user_ids)
+            if request_in.user_ids is not None:
+                known_ids = set(await crud.user.get_existing_ids(db, ids=user_ids))
+            histories = await crud.rating.get_recent_histories(
+                db,
+                user_ids=list(known_ids),
+                limit_per_user=settings.MAX_CONTEXT_LENGTH * 2,
+            )
+            results = await run_in_threadpool(
+                recommend_for_histories,
+                {user_id: histories.get(user_id, []) for user_id in known_ids},
+                exclude_watched=request_in.exclude_watched,
+                num_recommendations=request_in.count,
+                genres=genres,
+            )
+
+            short_ids = [
+                user_id
+                for user_id in known_ids
+                if len(results[user_id]) < request_in.count
+            ]
+            rated: Dict[int, Set[int]] = {}
+            if trending and short_ids and request_in.exclude_watched:
+                # Full rating sets, not just the loaded histories, in one query
+                rated = await crud.rating.get_rated_movie_ids_for_users(
+                    db, user_ids=short_ids
+                )
+
+            lines = []
+            for user_id in user_ids:
+                if user_id not in known_ids:
+                    lines.append(json.dumps({"user_id": user_id, "error": "not_found"}))
+                    continue
+                recommendations = results[user_id]
+                if len(recommendations) < request_in.count and trending:
+                    recommendations = await _top_up_from_trending(
+                        db,
+                        recommendations,
+                        trending,
+                        rated.get(user_id, set()),
+                        request_in.count,
+                        genres[0] if genres else None,
+                        trending_depth,
+                    )
+                lines.append(
+                    json.dumps({"user_id": user_id, "recommendations": recommendations})
+                )
+            yield "\n".join(lines) + "\n"
+
+
+@router.post("/batch", response_class=StreamingResponse)
+async def get_batch_recommendations(
+    request_in: RecommendationBatchRequest,
+    current_user: models.User = Depends(deps.get_current_active_user),
+):
+    """
+    Recommendations for many users, streamed as NDJSON (one line per user).
+    Target users are given as explicit user_ids or selected with a filter.
+    Histories are loaded with one grouped query per batch of
+    RECOMMENDATION_BATCH_SIZE users and inference runs once per batch, so
+    memory stays flat however many users are requested.
+    """
+    logger.info(f"User {current_user.id} requested batch recommendations.")
+    return StreamingResponse(
+        _stream_batch_recommendations(request_in),
+        media_type="application/x-ndjson",
     )
-    return recommendations
@@ -10,7 +10,7 @@ from app.core.config import settings
 from app.db import crud, models
 from app.schemas.token import Token
 from app.schemas.user import User, UserCreate
-from app.security import create_access_token, verify_password
+from app.security import create_access_token, verify_password_async
 
 router = APIRouter()
 
@@ -49,7 +49,11 @@ async def login_for_access_token(
             detail="Incorrect email: user not found",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    elif not verify_password(form_data.password, user.hashed_password):
+
+    password_valid, new_hashed_password = await verify_password_async(
+        form_data.password, user.hashed_password
+    )
+    if not password_valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect password: please check your password",
@@ -58,6 +62,12 @@ async def login_for_access_token(
     elif not user.is_active:
         raise HTTPException(status_code=400, detail="Inactive user")
 
+    # Stored hash was made with an outdated cost factor; upgrade it while we have the password
+    if new_hashed_password:
+        user = await crud.user.update_password_hash(
+            db, db_obj=user, hashed_password=new_hashed_password
+        )
+
     access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
         data={"sub": user.email}, expires_delta=access_token_expires
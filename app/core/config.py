@@ -22,6 +22,35 @@ class Settings:
         "DATABASE_URL",
         f"postgresql+asyncpg://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{POSTGRES_SERVER}:{POSTGRES_PORT}/{POSTGRES_DB}",
     )
+    # Optional read replica; when set, read-only queries are routed to it
+    DATABASE_REPLICA_URL: str = os.getenv("DATABASE_REPLICA_URL", "")
+
+    # Connection pool settings (applied to both primary and replica engines)
+    DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", 10))
+    DB_MAX_OVERFLOW: int = int(os.getenv("DB_MAX_OVERFLOW", 20))
+    DB_POOL_TIMEOUT: float = float(os.getenv("DB_POOL_TIMEOUT", 30))
+    DB_POOL_RECYCLE: int = int(os.getenv("DB_POOL_RECYCLE", 1800))
+    DB_POOL_PRE_PING: bool = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+
+    # Ratings table partitioning (PostgreSQL only, see app/db/partitions.py)
+    RATINGS_PARTITIONING: bool = (
+        os.getenv("RATINGS_PARTITIONING", "false").lower() == "true"
+    )
+    RATINGS_PARTITION_MONTHS_AHEAD: int = int(
+        os.getenv("RATINGS_PARTITION_MONTHS_AHEAD", 3)
+    )
+    # 0 keeps every partition attached
+    RATINGS_PARTITION_RETAIN_MONTHS: int = int(
+        os.getenv("RATINGS_PARTITION_RETAIN_MONTHS", 0)
+    )
+    RATINGS_ARCHIVE_SCHEMA: str = os.getenv("RATINGS_ARCHIVE_SCHEMA", "ratings_archive")
+    RATINGS_COLD_TABLESPACE: str = os.getenv("RATINGS_COLD_TABLESPACE", "")
+    # Detaching waits at most this long for its lock on ratings (then retries later)
+    RATINGS_DETACH_LOCK_TIMEOUT_MS: int = int(
+        os.getenv("RATINGS_DETACH_LOCK_TIMEOUT_MS", 2000)
+    )
+    # Rating timestamps further in the future than this are rejected
+    RATING_MAX_FUTURE_SECONDS: int = int(os.getenv("RATING_MAX_FUTURE_SECONDS", 86400))
 
     # Redis and Celery settings
     REDIS_HOST: str = os.getenv("REDIS_HOST", "localhost")
@@ -32,6 +61,26 @@ class Settings:
     CELERY_RESULT_BACKEND: str = os.getenv(
         "CELERY_RESULT_BACKEND", f"redis://{REDIS_HOST}:{REDIS_PORT}/0"
     )
+    # Application data (event streams, derived state) lives in its own Redis DB
+    REDIS_URL: str = os.getenv("REDIS_URL", f"redis://{REDIS_HOST}:{REDIS_PORT}/1")
+
+    # Rating event stream (see app/services/events.py)
+    RATING_EVENTS_ENABLED: bool = (
+        os.getenv("RATING_EVENTS_ENABLED", "true").lower() == "true"
+    )
+    RATING_EVENTS_STREAM: str = os.getenv("RATING_EVENTS_STREAM", "rating-events")
+    RATING_EVENTS_MAXLEN: int = int(os.getenv("RATING_EVENTS_MAXLEN", 1000000))
+    RATING_EVENTS_GROUP: str = os.getenv("RATING_EVENTS_GROUP", "derived-state")
+    RATING_EVENTS_BATCH_SIZE: int = int(os.getenv("RATING_EVENTS_BATCH_SIZE", 500))
+    RATING_EVENTS_MAX_DELIVERIES: int = int(
+        os.getenv("RATING_EVENTS_MAX_DELIVERIES", 5)
+    )
+
+    # Trending / popularity counters (see app/services/popularity.py)
+    POPULARITY_BUCKET_SECONDS: int = int(os.getenv("POPULARITY_BUCKET_SECONDS", 3600))
+    POPULARITY_WINDOW_BUCKETS: int = int(os.getenv("POPULARITY_WINDOW_BUCKETS", 24))
+    POPULARITY_DECAY: float = float(os.getenv("POPULARITY_DECAY", 0.9))
+    POPULARITY_CACHE_SECONDS: int = int(os.getenv("POPULARITY_CACHE_SECONDS", 60))
 
     # FastAPI settings
     SECRET_KEY: str = os.getenv(
@@ -40,29 +89,133 @@ class Settings:
     ALGORITHM: str = os.getenv("ALGORITHM", "HS256")
     ACCESS_TOKEN_EXPIRE_MINUTES: int = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 30))
 
+    # Password hashing settings
+    # Changing BCRYPT_ROUNDS rehashes existing passwords transparently on next login.
+    BCRYPT_ROUNDS: int = int(os.getenv("BCRYPT_ROUNDS", 12))
+    PASSWORD_HASH_WORKERS: int = int(os.getenv("PASSWORD_HASH_WORKERS", 2))
+    PASSWORD_HASH_MAX_CONCURRENCY: int = int(
+        os.getenv("PASSWORD_HASH_MAX_CONCURRENCY", 4)
+    )
+
     # Recommender settings
     MAX_CONTEXT_LENGTH: int = int(os.getenv("MAX_CONTEXT_LENGTH", 10))
     MIN_SEQUENCE_LENGTH: int = int(os.getenv("MIN_SEQUENCE_LENGTH", 3))
     EMBEDDING_DIM: int = int(os.getenv("EMBEDDING_DIM", 32))
+    # Movie vocabulary (see app/services/recommender/vocabulary.py): movies
+    # rated fewer than VOCAB_MIN_COUNT times in the training data share the
+    # out-of-vocabulary row; VOCAB_MAX_SIZE keeps only the most rated (0 = all)
+    VOCAB_MIN_COUNT: int = int(os.getenv("VOCAB_MIN_COUNT", 1))
+    VOCAB_MAX_SIZE: int = int(os.getenv("VOCAB_MAX_SIZE", 0))
+    # Embedding tables (see app/services/recommender/embeddings.py): "full",
+    # "hash" (hashing trick) or "qr" (quotient-remainder), sized to fit
+    # EMBEDDING_MEMORY_BUDGET_MB per table; "full" ignores the budget
+    EMBEDDING_BACKEND: str = os.getenv("EMBEDDING_BACKEND", "full")
+    EMBEDDING_MEMORY_BUDGET_MB: float = float(
+        os.getenv("EMBEDDING_MEMORY_BUDGET_MB", 64)
+    )
     MODEL_PATH: str = os.getenv("MODEL_PATH", "./models_store/gru4rec_model.keras")
+    # Two-stage recommendation pipeline (see app/services/recommender/pipeline.py)
+    RETRIEVAL_CANDIDATES: int = int(os.getenv("RETRIEVAL_CANDIDATES", 300))
+    RETRIEVAL_BUDGET_MS: float = float(os.getenv("RETRIEVAL_BUDGET_MS", 20))
+    RANKING_BUDGET_MS: float = float(os.getenv("RANKING_BUDGET_MS", 10))
+    RANKING_WEIGHTS: str = os.getenv(
+        "RANKING_WEIGHTS", "similarity=1.0,popularity=0.2,rating=0.2,recency=0.1"
+    )
+    RANKING_RECENCY_HALF_LIFE_DAYS: float = float(
+        os.getenv("RANKING_RECENCY_HALF_LIFE_DAYS", 30)
+    )
+    # POST /recommendations/batch: users per history query + forward pass
+    RECOMMENDATION_BATCH_SIZE: int = int(os.getenv("RECOMMENDATION_BATCH_SIZE", 512))
+    # "keras": each API worker loads the model file itself.
+    # "segment": workers attach to the memory-mapped serving segment published
+    # by the model registry (app/services/recommender/registry.py) and run
+    # inference on numpy; use this with several uvicorn/gunicorn workers.
+    SERVING_MODE: str = os.getenv("SERVING_MODE", "keras")
+    # Embedding tables in the serving segment: float32, float16 or int8 (per-row
+    # scales). Quantized tables are only published if recall@K on held-out
+    # examples is within the tolerance of float32.
+    SERVING_EMBEDDING_DTYPE: str = os.getenv("SERVING_EMBEDDING_DTYPE", "float32")
+    QUANTIZATION_RECALL_K: int = int(os.getenv("QUANTIZATION_RECALL_K", 10))
+    QUANTIZATION_RECALL_TOLERANCE: float = float(
+        os.getenv("QUANTIZATION_RECALL_TOLERANCE", 0.01)
+    )
+    QUANTIZATION_EVAL_USERS: int = int(os.getenv("QUANTIZATION_EVAL_USERS", 2000))
+    # Sharded retrieval: "host:port" of each shard server, in shard order
+    # (python -m app.services.recommender.sharding serve ...); empty = local.
+    # Only used with SERVING_MODE=segment
+    RETRIEVAL_SHARD_ADDRESSES: str = os.getenv("RETRIEVAL_SHARD_ADDRESSES", "")
+    # Required for sharding: shard servers refuse to start without it
+    RETRIEVAL_SHARD_AUTHKEY: str = os.getenv("RETRIEVAL_SHARD_AUTHKEY", "")
+    # Interface shard servers listen on (0.0.0.0 to serve other nodes)
+    RETRIEVAL_SHARD_HOST: str = os.getenv("RETRIEVAL_SHARD_HOST", "127.0.0.1")
+    # How long the coordinator waits for a shard's answer
+    RETRIEVAL_SHARD_TIMEOUT_SECONDS: float = float(
+        os.getenv("RETRIEVAL_SHARD_TIMEOUT_SECONDS", 5)
+    )
+    # Query-tower warm-up: inference batches are padded to these bucket sizes,
+    # each traced (and optionally jit-compiled) before a model starts serving
+    WARMUP_BATCH_SIZES: str = os.getenv("WARMUP_BATCH_SIZES", "1,8,32,128,512")
+    WARMUP_JIT_COMPILE: bool = (
+        os.getenv("WARMUP_JIT_COMPILE", "false").lower() == "true"
+    )
+    # Precomputed "similar movies" (see app/services/recommender/similarity.py)
+    SIMILAR_MOVIES_K: int = int(os.getenv("SIMILAR_MOVIES_K", 50))
+    SIMILARITY_BLOCK_MEMORY_MB: int = int(os.getenv("SIMILARITY_BLOCK_MEMORY_MB", 64))
+    # Only train on ratings from the last N days (0 = all history)
+    TRAINING_LOOKBACK_DAYS: int = int(os.getenv("TRAINING_LOOKBACK_DAYS", 0))
+    # Training scheduler (see app/worker/scheduler.py): runs are skipped when
+    # the ratings are unchanged since the last model; RETRAIN_MIN_NEW_RATINGS
+    # new ratings trigger a run before midnight (0 = only the nightly run)
+    RETRAIN_MIN_NEW_RATINGS: int = int(os.getenv("RETRAIN_MIN_NEW_RATINGS", 10000))
+    RETRAIN_CHECK_MINUTES: int = int(os.getenv("RETRAIN_CHECK_MINUTES", 15))
+    # Longest training run: the broker redelivers a run not acked by then
+    TRAINING_LOCK_TIMEOUT_SECONDS: int = int(
+        os.getenv("TRAINING_LOCK_TIMEOUT_SECONDS", 6 * 3600)
+    )
+    # The running task renews its lock every TRAINING_LOCK_HEARTBEAT_SECONDS;
+    # the lock expires TRAINING_LOCK_TTL_SECONDS after the last renewal
+    TRAINING_LOCK_TTL_SECONDS: int = int(os.getenv("TRAINING_LOCK_TTL_SECONDS", 300))
+    TRAINING_LOCK_HEARTBEAT_SECONDS: int = int(
+        os.getenv("TRAINING_LOCK_HEARTBEAT_SECONDS", 60)
+    )
+    TRAINING_LOCK_RETRY_SECONDS: int = int(os.getenv("TRAINING_LOCK_RETRY_SECONDS", 60))
+    # Epoch checkpoints kept per run (see app/services/recommender/checkpoints.py)
+    TRAINING_CHECKPOINTS_TO_KEEP: int = int(
+        os.getenv("TRAINING_CHECKPOINTS_TO_KEEP", 2)
+    )
+    # Reuse extracted ratings and examples across runs, regenerating only the
+    # users with new ratings (see app/services/recommender/training_data.py)
+    TRAINING_DATA_CACHE: bool = (
+        os.getenv("TRAINING_DATA_CACHE", "true").lower() == "true"
+    )
+    # Example generation is sharded by user over this many processes
+    # (0 = one per CPU) once a run rebuilds at least the given number of ratings
+    PREPROCESSING_WORKERS: int = int(os.getenv("PREPROCESSING_WORKERS", 0))
+    PREPROCESSING_PARALLEL_MIN_RATINGS: int = int(
+        os.getenv("PREPROCESSING_PARALLEL_MIN_RATINGS", 1_000_000)
+    )
+    # Data-parallel training over local processes (see
+    # app/services/recommender/distributed.py); 1 = fit in the Celery worker.
+    # Workers listen on consecutive ports from TRAINING_WORKER_PORT.
+    TRAINING_WORKERS: int = int(os.getenv("TRAINING_WORKERS", 1))
+    TRAINING_WORKER_PORT: int = int(os.getenv("TRAINING_WORKER_PORT", 23456))
 
     # Set Keras backend (tensorflow, jax, torch)
     # This needs to be set before Keras is imported for the first time.
     KERAS_BACKEND: str = os.getenv("KERAS_BACKEND", "tensorflow")
     os.environ["KERAS_BACKEND"] = KERAS_BACKEND
 
-    # Ensure models_store directory exists
-    Path("./models_store").mkdir(parents=True, exist_ok=True)
-    Path("./data").mkdir(
-        parents=True, exist_ok=True
-    )  # For Movielens data if downloaded
-
 
 settings = Settings()
 
-if settings.KERAS_BACKEND:
-    print(f"Keras backend set to: {settings.KERAS_BACKEND}")
-else:
-    print(
-        "Warning: KERAS_BACKEND environment variable not found. Keras will use its default backend."
-    )
+
+def ensure_storage_dirs() -> None:
+    """Creates models_store and the MovieLens data directory if missing.
+
+    Called by the processes that write there, rather than as an import side
+    effect of loading settings.
+    """
+    Path(settings.MODEL_PATH).parent.mkdir(parents=True, exist_ok=True)
+    Path("./data").mkdir(
+        parents=True, exist_ok=True
+    )  # For Movielens data if downloaded
@@ -1,9 +1,9 @@
-from typing import Any, Generic, List, Optional, Type, TypeVar
+from typing import Any, Dict, Generic, List, Optional, Sequence, Set, Type, TypeVar
 
 from sqlalchemy import Float as SQLFloat
 from sqlalchemy import cast
 from sqlalchemy import delete as sqlalchemy_delete
-from sqlalchemy import desc, func
+from sqlalchemy import desc, func, insert
 from sqlalchemy import update as sqlalchemy_update
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
@@ -15,7 +15,8 @@ from app.db.models import Movie, Rating, User
 from app.schemas.movie import MovieCreate, MovieUpdate
 from app.schemas.rating import RatingCreate, RatingUpdate
 from app.schemas.user import UserCreate
-from app.security import get_password_hash
+from app.security import get_password_hash_async
+from app.services.events import encode_rating_event, publish_rating_events
 
 ModelType = TypeVar("ModelType", bound=Base)
 CreateSchemaType = TypeVar("CreateSchemaType", bound=Any)
@@ -38,6 +39,12 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
         )
         return result.scalars().all()
 
+    async def get_existing_ids(
+        self, db: AsyncSession, *, ids: Sequence[int]
+    ) -> List[int]:
+        result = await db.execute(select(self.model.id).filter(self.model.id.in_(ids)))
+        return result.scalars().all()
+
     async def create(self, db: AsyncSession, *, obj_in: CreateSchemaType) -> ModelType:
         obj_in_data = obj_in.model_dump()
         db_obj = self.model(**obj_in_data)
@@ -75,7 +82,7 @@ class CRUDUser(CRUDBase[User, UserCreate, Any]):
     async def create(self, db: AsyncSession, *, obj_in: UserCreate) -> User:
         db_obj = User(
             email=obj_in.email,
-            hashed_password=get_password_hash(obj_in.password),
+            hashed_password=await get_password_hash_async(obj_in.password),
             is_active=True,
         )
         db.add(db_obj)
@@ -83,6 +90,47 @@ class CRUDUser(CRUDBase[User, UserCreate, Any]):
         await db.refresh(db_obj)
         return db_obj
 
+    async def get_ids(
+        self,
+        db: AsyncSession,
+        *,
+        after_id: int = 0,
+        limit: int = 1000,
+        active_only: bool = True,
+        rated_since: Optional[int] = None,
+        min_ratings: int = 0,
+    ) -> List[int]:
+        """One keyset page of user ids matching a filter, in ascending id order."""
+        stmt = (
+            select(self.model.id)
+            .filter(self.model.id > after_id)
+            .order_by(self.model.id)
+            .limit(limit)
+        )
+        if active_only:
+            stmt = stmt.filter(self.model.is_active.is_(True))
+        if rated_since is not None or min_ratings > 0:
+            rating_filter = select(Rating.user_id)
+            if rated_since is not None:
+                rating_filter = rating_filter.filter(Rating.timestamp >= rated_since)
+            rating_filter = rating_filter.group_by(Rating.user_id)
+            if min_ratings > 0:
+                rating_filter = rating_filter.having(
+                    func.count(Rating.id) >= min_ratings
+                )
+            stmt = stmt.filter(self.model.id.in_(rating_filter))
+        result = await db.execute(stmt)
+        return result.scalars().all()
+
+    async def update_password_hash(
+        self, db: AsyncSession, *, db_obj: User, hashed_password: str
+    ) -> User:
+        db_obj.hashed_password = hashed_password
+        db.add(db_obj)
+        await db.commit()
+        await db.refresh(db_obj)
+        return db_obj
+
 
 class CRUDMovie(CRUDBase[Movie, MovieCreate, MovieUpdate]):
 
@@ -141,6 +189,45 @@ class CRUDMovie(CRUDBase[Movie, MovieCreate, MovieUpdate]):
         result = await db.execute(select(func.max(self.model.id)))
         return result.scalar_one_or_none()
 
+    async def get_all_ids(self, db: AsyncSession) -> List[int]:
+        result = await db.execute(select(self.model.id))
+        return result.scalars().all()
+
+    async def get_genres_map(self, db: AsyncSession) -> List[Any]:
+        """(id, genres) pairs for every movie."""
+        result = await db.execute(select(self.model.id, self.model.genres))
+        return result.all()
+
+    async def get_catalog(self, db: AsyncSession) -> List[Any]:
+        """(id, movie_lens_id, title, resource_url, genres) rows for every movie."""
+        result = await db.execute(
+            select(
+                self.model.id,
+                self.model.movie_lens_id,
+                self.model.title,
+                self.model.resource_url,
+                self.model.genres,
+            ).order_by(self.model.id)
+        )
+        return result.all()
+
+    async def get_by_ids(self, db: AsyncSession, ids: Sequence[int]) -> List[Movie]:
+        """Plain movie rows (no aggregates) for the given ids, in any order."""
+        if not ids:
+            return []
+        result = await db.execute(select(self.model).filter(self.model.id.in_(ids)))
+        return result.scalars().all()
+
+    async def get_most_rated_ids(self, db: AsyncSession, *, limit: int) -> List[int]:
+        """All-time most rated movie ids (uses the movie_id covering index)."""
+        result = await db.execute(
+            select(Rating.movie_id)
+            .group_by(Rating.movie_id)
+            .order_by(desc(func.count(Rating.id)))
+            .limit(limit)
+        )
+        return result.scalars().all()
+
     async def get_multi_with_rating_summary(
         self,
         db: AsyncSession,
@@ -209,10 +296,86 @@ class CRUDRating(CRUDBase[Rating, RatingCreate, RatingUpdate]):
         db.add(db_obj)
         await db.commit()
         await db.refresh(db_obj)
+        await publish_rating_events(
+            [
+                encode_rating_event(
+                    db_obj.id, user_id, db_obj.movie_id, db_obj.rating, db_obj.timestamp
+                )
+            ]
+        )
         return db_obj
 
+    async def create_multi_with_owner(
+        self, db: AsyncSession, *, objs_in: Sequence[RatingCreate], user_id: int
+    ) -> List[int]:
+        """Inserts ratings with a multi-row INSERT and returns their ids in order."""
+        if not objs_in:
+            return []
+        rows = [{**obj_in.model_dump(), "user_id": user_id} for obj_in in objs_in]
+        stmt = insert(self.model).returning(self.model.id, sort_by_parameter_order=True)
+        result = await db.execute(stmt, rows)
+        rating_ids = result.scalars().all()
+        await db.commit()
+        await publish_rating_events(
+            [
+                encode_rating_event(
+                    rating_id, user_id, obj_in.movie_id, obj_in.rating, obj_in.timestamp
+                )
+                for rating_id, obj_in in zip(rating_ids, objs_in)
+            ]
+        )
+        return rating_ids
+
+    async def get_recent_histories(
+        self, db: AsyncSession, *, user_ids: Sequence[int], limit_per_user: int
+    ) -> Dict[int, List[int]]:
+        """Latest `limit_per_user` movie ids per user, oldest first, in one query."""
+        if not user_ids:
+            return {}
+        position = (
+            func.row_number()
+            .over(
+                partition_by=self.model.user_id,
+                order_by=desc(self.model.timestamp),
+            )
+            .label("position")
+        )
+        ranked = (
+            select(self.model.user_id, self.model.movie_id, position)
+            .filter(self.model.user_id.in_(user_ids))
+            .subquery()
+        )
+        stmt = (
+            select(ranked.c.user_id, ranked.c.movie_id)
+            .filter(ranked.c.position <= limit_per_user)
+            .order_by(ranked.c.user_id, ranked.c.position.desc())
+        )
+        result = await db.execute(stmt)
+        histories: Dict[int, List[int]] = {}
+        for user_id, movie_id in result.all():
+            histories.setdefault(user_id, []).append(movie_id)
+        return histories
+
+    async def get_item_aggregates(self, db: AsyncSession) -> List[Any]:
+        """(movie_id, num_ratings, avg_rating, last_timestamp) for every rated movie."""
+        result = await db.execute(
+            select(
+                self.model.movie_id,
+                func.count(self.model.id),
+                cast(func.avg(self.model.rating), SQLFloat),
+                func.max(self.model.timestamp),
+            ).group_by(self.model.movie_id)
+        )
+        return result.all()
+
     async def get_ratings_by_user(
-        self, db: AsyncSession, *, user_id: int, skip: int = 0, limit: int = 100
+        self,
+        db: AsyncSession,
+        *,
+        user_id: int,
+        skip: int = 0,
+        limit: int = 100,
+        since_timestamp: Optional[int] = None,
     ) -> List[Rating]:
         stmt = (
             select(self.model)
@@ -222,15 +385,97 @@ class CRUDRating(CRUDBase[Rating, RatingCreate, RatingUpdate]):
             .offset(skip)
             .limit(limit)
         )
+        # A timestamp lower bound lets PostgreSQL prune partitions outside the window
+        if since_timestamp is not None:
+            stmt = stmt.filter(self.model.timestamp >= since_timestamp)
         result = await db.execute(stmt)
         return result.scalars().all()
 
-    async def get_all_ratings_for_training(self, db: AsyncSession) -> List[Rating]:
+    async def get_rated_movie_ids(self, db: AsyncSession, *, user_id: int) -> List[int]:
+        """Ids of every movie the user rated; an index-only scan on PostgreSQL."""
+        result = await db.execute(
+            select(self.model.movie_id).filter(self.model.user_id == user_id)
+        )
+        return list(set(result.scalars().all()))
+
+    async def get_rated_movie_ids_for_users(
+        self, db: AsyncSession, *, user_ids: Sequence[int]
+    ) -> Dict[int, Set[int]]:
+        """Ids of every movie each user rated, in one query."""
+        if not user_ids:
+            return {}
+        result = await db.execute(
+            select(self.model.user_id, self.model.movie_id).filter(
+                self.model.user_id.in_(user_ids)
+            )
+        )
+        rated: Dict[int, Set[int]] = {}
+        for user_id, movie_id in result.all():
+            rated.setdefault(user_id, set()).add(movie_id)
+        return rated
+
+    async def get_fingerprint(self, db: AsyncSession) -> Dict[str, int]:
+        """Rating count, max timestamp and max id: changes whenever ratings do."""
+        result = await db.execute(
+            select(
+                func.count(self.model.id),
+                func.max(self.model.timestamp),
+                func.max(self.model.id),
+            )
+        )
+        count, max_timestamp, max_id = result.one()
+        return {
+            "count": int(count or 0),
+            "max_timestamp": int(max_timestamp or 0),
+            "max_id": int(max_id or 0),
+        }
+
+    async def count_since_id(self, db: AsyncSession, *, after_id: int) -> int:
+        """Number of ratings created after the rating with id `after_id`."""
+        result = await db.execute(
+            select(func.count(self.model.id)).filter(self.model.id > after_id)
+        )
+        return int(result.scalar_one() or 0)
+
+    async def get_all_ratings_for_training(
+        self, db: AsyncSession, *, since_timestamp: Optional[int] = None
+    ) -> List[Rating]:
 
         stmt = select(self.model).order_by(self.model.user_id, self.model.timestamp)
+        if since_timestamp is not None:
+            stmt = stmt.filter(self.model.timestamp >= since_timestamp)
         result = await db.execute(stmt)
         return result.scalars().all()
 
+    async def get_training_columns(
+        self,
+        db: AsyncSession,
+        *,
+        after_id: int = 0,
+        max_id: Optional[int] = None,
+        since_timestamp: Optional[int] = None,
+    ) -> List[Any]:
+        """(user_id, movie_id, rating, timestamp) rows with after_id < id <= max_id.
+
+        Plain column tuples in id order, for the columnar training data cache.
+        """
+        stmt = (
+            select(
+                self.model.user_id,
+                self.model.movie_id,
+                self.model.rating,
+                self.model.timestamp,
+            )
+            .filter(self.model.id > after_id)
+            .order_by(self.model.id)
+        )
+        if max_id is not None:
+            stmt = stmt.filter(self.model.id <= max_id)
+        if since_timestamp is not None:
+            stmt = stmt.filter(self.model.timestamp >= since_timestamp)
+        result = await db.execute(stmt)
+        return result.all()
+
 
 user = CRUDUser(User)
 movie = CRUDMovie(Movie)
@@ -0,0 +1,74 @@
+"""Initial schema: users, movies and ratings
+
+Matches the tables previously created by Base.metadata.create_all, so
+existing databases are stamped at this revision instead of re-created.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-19 00:00:00
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+revision: str = "0001"
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _audit_columns():
+    return [
+        sa.Column("id", sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column("created_at", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("updated_at", sa.DateTime(timezone=True), nullable=True),
+    ]
+
+
+def upgrade() -> None:
+    op.create_table(
+        "users",
+        *_audit_columns(),
+        sa.Column("email", sa.String(), nullable=False),
+        sa.Column("hashed_password", sa.String(), nullable=False),
+        sa.Column("is_active", sa.Boolean(), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_users_id", "users", ["id"])
+    op.create_index("ix_users_email", "users", ["email"], unique=True)
+
+    op.create_table(
+        "movies",
+        *_audit_columns(),
+        sa.Column("title", sa.String(), nullable=False),
+        sa.Column("genres", sa.String(), nullable=True),
+        sa.Column("resource_url", sa.String(), nullable=True),
+        sa.Column("movie_lens_id", sa.Integer(), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_movies_id", "movies", ["id"])
+    op.create_index("ix_movies_title", "movies", ["title"])
+    op.create_index("ix_movies_movie_lens_id", "movies", ["movie_lens_id"], unique=True)
+
+    op.create_table(
+        "ratings",
+        *_audit_columns(),
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("movie_id", sa.Integer(), nullable=False),
+        sa.Column("rating", sa.Float(), nullable=False),
+        sa.Column("timestamp", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(["movie_id"], ["movies.id"]),
+        sa.ForeignKeyConstraint(["user_id"], ["users.id"]),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_ratings_id", "ratings", ["id"])
+    op.create_index("ix_ratings_timestamp", "ratings", ["timestamp"])
+
+
+def downgrade() -> None:
+    op.drop_table("ratings")
+    op.drop_table("movies")
+    op.drop_table("users")
@@ -0,0 +1,44 @@
+"""Composite covering indexes for the hot rating queries
+
+- ix_ratings_user_id_timestamp serves get_ratings_by_user (filter on user_id,
+  ORDER BY timestamp DESC via a backward scan) and the (user_id, timestamp)
+  ordering of get_all_ratings_for_training with a single index.
+- ix_ratings_movie_id covers the per-movie rating summary aggregates
+  (GROUP BY movie_id, avg(rating), count(id)) as an index-only scan.
+
+INCLUDE columns are PostgreSQL-only and are ignored on other dialects.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-19 00:00:00
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+revision: str = "0002"
+down_revision: Union[str, None] = "0001"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index(
+        "ix_ratings_user_id_timestamp",
+        "ratings",
+        ["user_id", "timestamp"],
+        postgresql_include=["movie_id", "rating"],
+    )
+    op.create_index(
+        "ix_ratings_movie_id",
+        "ratings",
+        ["movie_id"],
+        postgresql_include=["rating", "id"],
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_ratings_movie_id", table_name="ratings")
+    op.drop_index("ix_ratings_user_id_timestamp", table_name="ratings")
@@ -0,0 +1,34 @@
+"""Optionally convert ratings to a monthly range-partitioned table
+
+Only runs on PostgreSQL with RATINGS_PARTITIONING enabled. Databases that
+enable partitioning after this revision was applied can convert with
+`python -m app.db.partitions convert`.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-19 00:00:00
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+from app.core.config import settings
+from app.db.partitions import convert_ratings_to_partitioned
+
+revision: str = "0003"
+down_revision: Union[str, None] = "0002"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    if bind.dialect.name == "postgresql" and settings.RATINGS_PARTITIONING:
+        convert_ratings_to_partitioned(bind)
+
+
+def downgrade() -> None:
+    # Partitioned data stays in place; converting back is a manual operation.
+    pass
@@ -0,0 +1,37 @@
+"""Add a DEFAULT partition to the partitioned ratings table
+
+Rows whose timestamp no month partition covers used to fail on insert; they
+now land in ratings_p_default until maintenance creates their month. Only
+runs on PostgreSQL when ratings is already partitioned.
+
+With a DEFAULT partition, PostgreSQL no longer allows DETACH ... CONCURRENTLY,
+so expired months are detached with a plain DETACH under a lock_timeout (see
+detach_expired_partitions).
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-19 00:00:00
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+from app.db.partitions import ensure_default_partition, is_ratings_partitioned
+
+revision: str = "0004"
+down_revision: Union[str, None] = "0003"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    if bind.dialect.name == "postgresql" and is_ratings_partitioned(bind):
+        ensure_default_partition(bind)
+
+
+def downgrade() -> None:
+    # Rows may live in the DEFAULT partition; dropping it is a manual operation.
+    pass
@@ -1,6 +1,15 @@
 from datetime import datetime
 
-from sqlalchemy import Boolean, Column, DateTime, Float, ForeignKey, Integer, String
+from sqlalchemy import (
+    Boolean,
+    Column,
+    DateTime,
+    Float,
+    ForeignKey,
+    Index,
+    Integer,
+    String,
+)
 from sqlalchemy.orm import relationship
 
 from app.db.base_class import Base
@@ -28,6 +37,16 @@ class Movie(Base):
 
 class Rating(Base):
     __tablename__ = "ratings"
+    # Schema changes go through migrations (app/db/migrations); keep these in sync.
+    __table_args__ = (
+        Index(
+            "ix_ratings_user_id_timestamp",
+            "user_id",
+            "timestamp",
+            postgresql_include=["movie_id", "rating"],
+        ),
+        Index("ix_ratings_movie_id", "movie_id", postgresql_include=["rating", "id"]),
+    )
 
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
 
@@ -0,0 +1,318 @@
+"""Monthly range partitioning of the ratings table (PostgreSQL only).
+
+When RATINGS_PARTITIONING is enabled, `ratings` is a declaratively partitioned
+table keyed on `timestamp` (epoch seconds) with one partition per month, a
+`ratings_p_historic` partition for everything before the first month and a
+DEFAULT partition (`ratings_p_default`) catching any row no month covers yet,
+e.g. a timestamp beyond the created months when maintenance fell behind.
+Creating a month moves its rows out of the DEFAULT partition.
+
+Partitions are maintained by a Celery beat task: upcoming months are created
+ahead of time and, if RATINGS_PARTITION_RETAIN_MONTHS is set, partitions older
+than the retention window are detached and moved to the archive schema / cold
+tablespace. PostgreSQL doesn't allow DETACH ... CONCURRENTLY while a DEFAULT
+partition exists, so a plain DETACH is used: it briefly takes an ACCESS
+EXCLUSIVE lock on `ratings` (no scan), waiting at most
+RATINGS_DETACH_LOCK_TIMEOUT_MS for it.
+
+Usage (one-off conversion of an existing table):
+    python -m app.db.partitions convert
+"""
+
+import asyncio
+import logging
+import re
+import sys
+from datetime import datetime, timezone
+from typing import List, Optional, Tuple
+
+from sqlalchemy.engine import Connection
+from sqlalchemy.exc import DBAPIError
+
+from app.core.config import settings
+from app.db.session import async_engine
+
+logger = logging.getLogger(__name__)
+
+RATINGS_TABLE = "ratings"
+HISTORIC_PARTITION = "ratings_p_historic"
+DEFAULT_PARTITION = "ratings_p_default"
+_PARTITION_NAME_RE = re.compile(r"^ratings_p(\d{4})(\d{2})$")
+# SQLSTATE of a lock_timeout expiring
+LOCK_NOT_AVAILABLE = "55P03"
+
+
+def month_start(year: int, month: int) -> int:
+    return int(datetime(year, month, 1, tzinfo=timezone.utc).timestamp())
+
+
+def add_months(year: int, month: int, months: int) -> Tuple[int, int]:
+    index = year * 12 + (month - 1) + months
+    return index // 12, index % 12 + 1
+
+
+def month_of(timestamp: int) -> Tuple[int, int]:
+    moment = datetime.fromtimestamp(timestamp, tz=timezone.utc)
+    return moment.year, moment.month
+
+
+def partition_name(year: int, month: int) -> str:
+    return f"ratings_p{year:04d}{month:02d}"
+
+
+def lookback_start_timestamp(days: int) -> Optional[int]:
+    """Lower timestamp bound for a recent window, so queries prune old partitions."""
+    if days <= 0:
+        return None
+    return int(datetime.now(timezone.utc).timestamp()) - days * 86400
+
+
+def is_ratings_partitioned(conn: Connection) -> bool:
+    result = conn.exec_driver_sql(
+        "SELECT c.relkind FROM pg_class c WHERE c.relname = 'ratings' "
+        "AND c.relnamespace = current_schema()::regnamespace"
+    )
+    return result.scalar() == "p"
+
+
+def list_month_partitions(conn: Connection) -> List[Tuple[int, int, str]]:
+    result = conn.exec_driver_sql(
+        "SELECT child.relname FROM pg_inherits "
+        "JOIN pg_class parent ON pg_inherits.inhparent = parent.oid "
+        "JOIN pg_class child ON pg_inherits.inhrelid = child.oid "
+        "WHERE parent.relname = 'ratings' "
+        "AND parent.relnamespace = current_schema()::regnamespace"
+    )
+    partitions = []
+    for (name,) in result.all():
+        match = _PARTITION_NAME_RE.match(name)
+        if match:
+            partitions.append((int(match.group(1)), int(match.group(2)), name))
+    return sorted(partitions)
+
+
+def has_default_partition(conn: Connection) -> bool:
+    result = conn.exec_driver_sql(
+        f"SELECT 1 FROM pg_class c WHERE c.relname = '{DEFAULT_PARTITION}' "
+        "AND c.relnamespace = current_schema()::regnamespace"
+    )
+    return result.first() is not None
+
+
+def ensure_default_partition(conn: Connection) -> bool:
+    """Creates the DEFAULT partition if missing; True if it was created."""
+    if has_default_partition(conn):
+        return False
+    conn.exec_driver_sql(
+        f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF {RATINGS_TABLE} DEFAULT"
+    )
+    return True
+
+
+def create_month_partition(conn: Connection, year: int, month: int) -> str:
+    """Creates a month partition, moving its rows out of the DEFAULT partition.
+
+    PostgreSQL refuses a new partition while the DEFAULT partition holds rows
+    in its range, so those rows are copied into a standalone table, deleted
+    from DEFAULT, and the table is attached, all in the caller's transaction.
+    """
+    name = partition_name(year, month)
+    next_year, next_month = add_months(year, month, 1)
+    start, end = month_start(year, month), month_start(next_year, next_month)
+    bounds = f"FOR VALUES FROM ({start}) TO ({end})"
+    in_range = f'"timestamp" >= {start} AND "timestamp" < {end}'
+    stray = has_default_partition(conn) and (
+        conn.exec_driver_sql(
+            f"SELECT 1 FROM {DEFAULT_PARTITION} WHERE {in_range} LIMIT 1"
+        ).first()
+        is not None
+    )
+    if not stray:
+        conn.exec_driver_sql(
+            f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {RATINGS_TABLE} {bounds}"
+        )
+        return name
+
+    logger.info(f"Moving rows of {name} out of {DEFAULT_PARTITION}...")
+    conn.exec_driver_sql(
+        f"CREATE TABLE {name} (LIKE {RATINGS_TABLE} INCLUDING DEFAULTS)"
+    )
+    conn.exec_driver_sql(
+        f"INSERT INTO {name} SELECT * FROM {DEFAULT_PARTITION} WHERE {in_range}"
+    )
+    conn.exec_driver_sql(f"DELETE FROM {DEFAULT_PARTITION} WHERE {in_range}")
+    conn.exec_driver_sql(
+        f"ALTER TABLE {RATINGS_TABLE} ATTACH PARTITION {name} {bounds}"
+    )
+    return name
+
+
+def ensure_future_partitions(
+    conn: Connection, months_ahead: int = settings.RATINGS_PARTITION_MONTHS_AHEAD
+) -> List[str]:
+    """Creates partitions from the current month up to `months_ahead` months out."""
+    year, month = month_of(int(datetime.now(timezone.utc).timestamp()))
+    existing = {(y, m) for y, m, _ in list_month_partitions(conn)}
+    created = []
+    for offset in range(months_ahead + 1):
+        target = add_months(year, month, offset)
+        if target not in existing:
+            created.append(create_month_partition(conn, *target))
+    return created
+
+
+def convert_ratings_to_partitioned(conn: Connection) -> None:
+    """Rebuilds `ratings` as a monthly range-partitioned table, copying all rows.
+
+    Runs inside the caller's transaction. The primary key becomes
+    (id, timestamp) because PostgreSQL requires the partition key in it.
+    """
+    if is_ratings_partitioned(conn):
+        logger.info("ratings is already partitioned. Nothing to convert.")
+        return
+
+    bounds = conn.exec_driver_sql(
+        f'SELECT min("timestamp"), max("timestamp") FROM {RATINGS_TABLE}'
+    )
+    min_ts, max_ts = bounds.first()
+    now_ts = int(datetime.now(timezone.utc).timestamp())
+    first_year, first_month = month_of(min_ts if min_ts is not None else now_ts)
+    last_year, last_month = add_months(
+        *month_of(max(max_ts or now_ts, now_ts)),
+        settings.RATINGS_PARTITION_MONTHS_AHEAD,
+    )
+
+    logger.info(
+        f"Converting ratings to monthly partitions from {first_year}-{first_month:02d} "
+        f"to {last_year}-{last_month:02d}..."
+    )
+    conn.exec_driver_sql(f"ALTER TABLE {RATINGS_TABLE} RENAME TO ratings_unpartitioned")
+    for index_name in (
+        "ix_ratings_id",
+        "ix_ratings_timestamp",
+        "ix_ratings_user_id_timestamp",
+        "ix_ratings_movie_id",
+    ):
+        conn.exec_driver_sql(f"DROP INDEX IF EXISTS {index_name}")
+    conn.exec_driver_sql(
+        f"CREATE TABLE {RATINGS_TABLE} (LIKE ratings_unpartitioned INCLUDING DEFAULTS) "
+        'PARTITION BY RANGE ("timestamp")'
+    )
+    conn.exec_driver_sql(
+        f"CREATE TABLE {HISTORIC_PARTITION} PARTITION OF {RATINGS_TABLE} "
+        f"FOR VALUES FROM (MINVALUE) TO ({month_start(first_year, first_month)})"
+    )
+    year, month = first_year, first_month
+    while (year, month) <= (last_year, last_month):
+        create_month_partition(conn, year, month)
+        year, month = add_months(year, month, 1)
+    ensure_default_partition(conn)
+
+    conn.exec_driver_sql(
+        f"INSERT INTO {RATINGS_TABLE} SELECT * FROM ratings_unpartitioned"
+    )
+    # The id sequence is owned by the old table; keep it alive when that is dropped
+    conn.exec_driver_sql(
+        f"ALTER SEQUENCE IF EXISTS ratings_id_seq OWNED BY {RATINGS_TABLE}.id"
+    )
+    conn.exec_driver_sql("DROP TABLE ratings_unpartitioned")
+
+    conn.exec_driver_sql(
+        f'ALTER TABLE {RATINGS_TABLE} ADD PRIMARY KEY (id, "timestamp")'
+    )
+    conn.exec_driver_sql(
+        f"ALTER TABLE {RATINGS_TABLE} ADD FOREIGN KEY (user_id) REFERENCES users (id)"
+    )
+    conn.exec_driver_sql(
+        f"ALTER TABLE {RATINGS_TABLE} ADD FOREIGN KEY (movie_id) REFERENCES movies (id)"
+    )
+    conn.exec_driver_sql(f"CREATE INDEX ix_ratings_id ON {RATINGS_TABLE} (id)")
+    conn.exec_driver_sql(
+        f'CREATE INDEX ix_ratings_timestamp ON {RATINGS_TABLE} ("timestamp")'
+    )
+    conn.exec_driver_sql(
+        f"CREATE INDEX ix_ratings_user_id_timestamp ON {RATINGS_TABLE} "
+        f'(user_id, "timestamp") INCLUDE (movie_id, rating)'
+    )
+    conn.exec_driver_sql(
+        f"CREATE INDEX ix_ratings_movie_id ON {RATINGS_TABLE} "
+        "(movie_id) INCLUDE (rating, id)"
+    )
+    logger.info("ratings converted to a partitioned table.")
+
+
+def detach_expired_partitions(
+    conn: Connection, retain_months: int = settings.RATINGS_PARTITION_RETAIN_MONTHS
+) -> List[str]:
+    """Detaches month partitions older than `retain_months` and archives them.
+
+    `conn` must be in AUTOCOMMIT mode so each DETACH releases its lock on
+    ratings right away, before the archive moves. A partition whose lock
+    isn't granted within RATINGS_DETACH_LOCK_TIMEOUT_MS is left attached for
+    the next run. Detached tables are moved to RATINGS_ARCHIVE_SCHEMA and,
+    if configured, RATINGS_COLD_TABLESPACE.
+    """
+    if retain_months <= 0 or not is_ratings_partitioned(conn):
+        return []
+
+    year, month = month_of(int(datetime.now(timezone.utc).timestamp()))
+    cutoff = add_months(year, month, -retain_months)
+    archive_schema = settings.RATINGS_ARCHIVE_SCHEMA
+    detached = []
+
+    conn.exec_driver_sql(f"CREATE SCHEMA IF NOT EXISTS {archive_schema}")
+    for part_year, part_month, name in list_month_partitions(conn):
+        if (part_year, part_month) >= cutoff:
+            continue
+        logger.info(f"Detaching rating partition {name}...")
+        conn.exec_driver_sql(
+            f"SET lock_timeout = {settings.RATINGS_DETACH_LOCK_TIMEOUT_MS}"
+        )
+        try:
+            conn.exec_driver_sql(f"ALTER TABLE {RATINGS_TABLE} DETACH PARTITION {name}")
+        except DBAPIError as e:
+            if getattr(e.orig, "sqlstate", None) != LOCK_NOT_AVAILABLE:
+                raise
+            logger.warning(f"Lock timeout detaching {name}; retrying next run.")
+            continue
+        finally:
+            conn.exec_driver_sql("RESET lock_timeout")
+        conn.exec_driver_sql(f"ALTER TABLE {name} SET SCHEMA {archive_schema}")
+        if settings.RATINGS_COLD_TABLESPACE:
+            conn.exec_driver_sql(
+                f"ALTER TABLE {archive_schema}.{name} "
+                f"SET TABLESPACE {settings.RATINGS_COLD_TABLESPACE}"
+            )
+        detached.append(name)
+    return detached
+
+
+async def maintain_rating_partitions() -> dict:
+    """Entry point for the maintenance task: create upcoming, archive expired."""
+    async with async_engine.begin() as conn:
+        if not await conn.run_sync(is_ratings_partitioned):
+            logger.info("ratings is not partitioned. Skipping partition maintenance.")
+            return {"partitioned": False, "created": [], "detached": []}
+        if await conn.run_sync(ensure_default_partition):
+            logger.info(f"Created the {DEFAULT_PARTITION} partition.")
+        created = await conn.run_sync(ensure_future_partitions)
+
+    async with async_engine.connect() as conn:
+        autocommit_conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        detached = await autocommit_conn.run_sync(detach_expired_partitions)
+
+    logger.info(f"Rating partitions created: {created}, detached: {detached}")
+    return {"partitioned": True, "created": created, "detached": detached}
+
+
+async def _convert():
+    async with async_engine.begin() as conn:
+        await conn.run_sync(convert_ratings_to_partitioned)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    if len(sys.argv) > 1 and sys.argv[1] == "convert":
+        asyncio.run(_convert())
+    else:
+        print(asyncio.run(maintain_rating_partitions()))
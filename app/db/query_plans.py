@@ -0,0 +1,104 @@
+"""Index usage of the hot CRUD queries (PostgreSQL only).
+
+Each hot CRUD call runs against the database while the SQL it emits is
+captured; every statement is then EXPLAINed with sequential scans disabled.
+With enable_seqscan off the planner only falls back to a Seq Scan when no
+usable index exists, so any Seq Scan node means an index regression.
+
+Shared by scripts/check_query_plans.py and tests/test_query_plans.py.
+"""
+
+import json
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import event, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db import crud
+from app.db.models import Movie, Rating
+from app.db.session import AsyncSessionLocal, async_engine, use_primary
+
+Query = Callable[[AsyncSession], Awaitable[Any]]
+
+
+def hot_queries(user_id: int, movie_id: int) -> List[Tuple[str, Query]]:
+    """(name, query) of the CRUD calls whose plans must use indexes."""
+    return [
+        (
+            "rating.get_ratings_by_user",
+            lambda db: crud.rating.get_ratings_by_user(db, user_id=user_id, limit=20),
+        ),
+        (
+            "rating.get_rated_movie_ids",
+            lambda db: crud.rating.get_rated_movie_ids(db, user_id=user_id),
+        ),
+        ("movie.get", lambda db: crud.movie.get(db, id=movie_id)),
+        (
+            "movie.get_multi_with_rating_summary",
+            lambda db: crud.movie.get_multi_with_rating_summary(db, limit=20),
+        ),
+        (
+            "rating.get_all_ratings_for_training",
+            lambda db: crud.rating.get_all_ratings_for_training(db),
+        ),
+    ]
+
+
+async def sample_ids() -> Optional[Tuple[int, int]]:
+    """A (user_id, movie_id) to run the hot queries with; None if unseeded."""
+    async with AsyncSessionLocal() as db:
+        user_id = (await db.execute(select(func.min(Rating.user_id)))).scalar()
+        movie_id = (await db.execute(select(func.min(Movie.id)))).scalar()
+    if user_id is None or movie_id is None:
+        return None
+    return user_id, movie_id
+
+
+def find_seq_scans(plan_node: Dict[str, Any]) -> List[str]:
+    """Relations read by a Seq Scan anywhere in an EXPLAIN (FORMAT JSON) plan."""
+    found = []
+    if plan_node.get("Node Type") == "Seq Scan":
+        found.append(plan_node.get("Relation Name", "?"))
+    for child in plan_node.get("Plans", []):
+        found.extend(find_seq_scans(child))
+    return found
+
+
+async def capture_statements(query: Query) -> List[Tuple[str, Any]]:
+    """Runs `query` on the primary and returns the SELECTs it emitted."""
+    captured: List[Tuple[str, Any]] = []
+
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, many):
+        if statement.lstrip().upper().startswith("SELECT"):
+            captured.append((statement, parameters))
+
+    event.listen(
+        async_engine.sync_engine, "before_cursor_execute", _before_cursor_execute
+    )
+    try:
+        async with AsyncSessionLocal() as db:
+            # Plans are checked on the primary; keep the queries there too
+            await query(use_primary(db))
+    finally:
+        event.remove(
+            async_engine.sync_engine, "before_cursor_execute", _before_cursor_execute
+        )
+    return captured
+
+
+async def explain_seq_scans(query: Query) -> List[Tuple[str, List[str]]]:
+    """(statement, seq-scanned relations) for every SELECT `query` emits."""
+    statements = await capture_statements(query)
+    plans = []
+    async with async_engine.connect() as conn:
+        await conn.exec_driver_sql("SET enable_seqscan = off")
+        for statement, parameters in statements:
+            result = await conn.exec_driver_sql(
+                f"EXPLAIN (FORMAT JSON) {statement}", parameters
+            )
+            plan = result.scalar()
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            plans.append((statement, find_seq_scans(plan[0]["Plan"])))
+        await conn.rollback()
+    return plans
@@ -1,28 +1,230 @@
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
-from sqlalchemy.orm import sessionmaker
+import threading
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Dict, Optional
+
+from sqlalchemy import event, inspect
+from sqlalchemy.engine import Connection
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy.sql import Select
 
 from app.core.config import settings
-from app.db.base_class import Base
+from app.db import models  # noqa: F401  (registers tables on Base.metadata)
+
+# Alembic is imported when migrating, not by every process importing the engine
+if TYPE_CHECKING:
+    from alembic.config import Config
+
+
+class PoolMetrics:
+    """Connection pool utilisation and checkout wait-time counters for one engine."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self.checked_out = 0
+        self.peak_checked_out = 0
+        self.checkouts = 0
+        self.timeouts = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def record_checkout(self, wait_seconds: float) -> None:
+        with self._lock:
+            self.checked_out += 1
+            self.peak_checked_out = max(self.peak_checked_out, self.checked_out)
+            self.checkouts += 1
+            self.total_wait_seconds += wait_seconds
+            self.max_wait_seconds = max(self.max_wait_seconds, wait_seconds)
+
+    def record_checkin(self) -> None:
+        with self._lock:
+            self.checked_out = max(0, self.checked_out - 1)
+
+    def record_timeout(self) -> None:
+        with self._lock:
+            self.timeouts += 1
+
+    def snapshot(self, pool: Any = None) -> Dict[str, Any]:
+        with self._lock:
+            data = {
+                "name": self.name,
+                "checked_out": self.checked_out,
+                "peak_checked_out": self.peak_checked_out,
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "avg_wait_ms": (
+                    1000.0 * self.total_wait_seconds / self.checkouts
+                    if self.checkouts
+                    else 0.0
+                ),
+                "max_wait_ms": 1000.0 * self.max_wait_seconds,
+            }
+        if isinstance(pool, AsyncAdaptedQueuePool):
+            capacity = pool.size() + max(pool._max_overflow, 0)
+            data.update(
+                {
+                    "pool_size": pool.size(),
+                    "max_overflow": pool._max_overflow,
+                    "idle": pool.checkedin(),
+                    "overflow": pool.overflow(),
+                    "utilisation": (
+                        data["checked_out"] / capacity if capacity > 0 else 0.0
+                    ),
+                }
+            )
+        return data
+
+
+class InstrumentedQueuePool(AsyncAdaptedQueuePool):
+    """Queue pool that reports checkout wait time and utilisation to PoolMetrics.
+
+    Use instrumented_pool_class() to obtain a subclass bound to a metrics object,
+    since create_async_engine only forwards the standard pool arguments.
+    """
+
+    metrics: PoolMetrics
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            conn = super()._do_get()
+        except Exception:
+            self.metrics.record_timeout()
+            raise
+        self.metrics.record_checkout(time.perf_counter() - started)
+        return conn
+
+    def _do_return_conn(self, record):
+        self.metrics.record_checkin()
+        return super()._do_return_conn(record)
+
+
+def instrumented_pool_class(metrics: PoolMetrics) -> type:
+    return type("InstrumentedQueuePool", (InstrumentedQueuePool,), {"metrics": metrics})
+
+
+pool_metrics: Dict[str, PoolMetrics] = {}
+
+
+def _create_engine(url: str, name: str) -> AsyncEngine:
+    # SQLite (used as a local stand-in) manages its own pooling.
+    if make_url(url).get_backend_name() == "sqlite":
+        return create_async_engine(url, echo=False)
+
+    metrics = PoolMetrics(name)
+    pool_metrics[name] = metrics
+    return create_async_engine(
+        url,
+        echo=False,
+        poolclass=instrumented_pool_class(metrics),
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+        pool_recycle=settings.DB_POOL_RECYCLE,
+        pool_pre_ping=settings.DB_POOL_PRE_PING,
+    )
+
+
+# Async engines: all writes go to the primary; reads go to the replica when configured
+async_engine = _create_engine(settings.DATABASE_URL, "primary")
+replica_engine: Optional[AsyncEngine] = (
+    _create_engine(settings.DATABASE_REPLICA_URL, "replica")
+    if settings.DATABASE_REPLICA_URL
+    else None
+)
+
+
+class RoutingSession(Session):
+    """Sends plain SELECTs to the replica engine and everything else to the primary.
+
+    Once a session has flushed a write, it sticks to the primary so that
+    read-after-write (e.g. refresh after commit) never sees replica lag.
+    Call use_primary(db) to pin a session to the primary explicitly.
+    """
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        if (
+            replica_engine is None
+            or self._flushing
+            or self.info.get("use_primary")
+            or not isinstance(clause, Select)
+            or clause._for_update_arg is not None
+        ):
+            return async_engine.sync_engine
+        return replica_engine.sync_engine
+
+
+@event.listens_for(RoutingSession, "after_flush")
+def _pin_to_primary_after_write(session, flush_context):
+    session.info["use_primary"] = True
+
+
+def use_primary(db: AsyncSession) -> AsyncSession:
+    db.info["use_primary"] = True
+    return db
 
-# Async engine
-async_engine = create_async_engine(settings.DATABASE_URL, echo=False)
 
 # Async session factory
 AsyncSessionLocal = sessionmaker(
     autocommit=False,
     autoflush=False,
-    bind=async_engine,
     class_=AsyncSession,
+    sync_session_class=RoutingSession,
     expire_on_commit=False,
 )
 
 
+def get_pool_metrics() -> Dict[str, Dict[str, Any]]:
+    engines = {"primary": async_engine, "replica": replica_engine}
+    return {
+        name: metrics.snapshot(engines[name].sync_engine.pool)
+        for name, metrics in pool_metrics.items()
+    }
+
+
 async def get_async_db() -> AsyncSession:
     async with AsyncSessionLocal() as session:
         yield session
 
 
+MIGRATIONS_DIR = Path(__file__).resolve().parent / "migrations"
+# Revision matching the schema that create_all used to produce
+BASELINE_REVISION = "0001"
+# pg_advisory_xact_lock key serialising migrations across API workers
+MIGRATION_LOCK_KEY = 7_320_001
+
+
+def get_alembic_config(connection: Optional[Connection] = None) -> "Config":
+    from alembic.config import Config
+
+    config = Config()
+    config.set_main_option("script_location", str(MIGRATIONS_DIR))
+    config.attributes["connection"] = connection
+    return config
+
+
+def run_migrations(connection: Connection) -> None:
+    from alembic import command
+
+    if connection.dialect.name == "postgresql":
+        # Every uvicorn worker migrates at start-up: the first one takes the lock
+        # and migrates, the others wait for its commit and find the schema at head
+        connection.exec_driver_sql(
+            f"SELECT pg_advisory_xact_lock({MIGRATION_LOCK_KEY})"
+        )
+    config = get_alembic_config(connection)
+    table_names = inspect(connection).get_table_names()
+    if "ratings" in table_names and "alembic_version" not in table_names:
+        # Database predates migrations (created via create_all): adopt it as the baseline
+        command.stamp(config, BASELINE_REVISION)
+    command.upgrade(config, "head")
+
+
 async def create_db_and_tables():
+    """Brings the database schema up to date by applying pending migrations."""
     async with async_engine.begin() as conn:
-
-        await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(run_migrations)
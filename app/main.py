@@ -1,15 +1,35 @@
+import asyncio
 import logging
+import os
 from contextlib import asynccontextmanager
+from typing import Any, Dict, Optional
 
-from fastapi import Depends, FastAPI, HTTPException
+from fastapi import Depends, FastAPI, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from sqlalchemy import text
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.api import deps
 from app.api.v1.api import api_router
-from app.core.config import settings
-from app.db.session import AsyncSessionLocal, create_db_and_tables, get_async_db
-from app.services.recommender.predict import load_model_and_mappings
+from app.core.config import ensure_storage_dirs, settings
+from app.db import models
+from app.db.session import (
+    create_db_and_tables,
+    get_async_db,
+    get_pool_metrics,
+)
+from app.security import shutdown_password_hasher
+from app.services.events import get_redis
+from app.worker.rating_events import RatingEventConsumer
+from app.worker.scheduler import get_training_status, request_training
+from app.services.recommender.instrumentation import read_run_metrics
+from app.services.recommender.predict import (
+    get_pipeline_stats,
+    get_readiness,
+    preload_model,
+)
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -20,24 +40,22 @@ async def lifespan(app: FastAPI):
     # app Startup
     logger.info("Application startup...")
     logger.info(f"Keras backend configured as: {settings.KERAS_BACKEND}")
+    ensure_storage_dirs()
 
-    logger.info("Initializing database and creating tables if they don't exist...")
+    logger.info("Initializing database and applying pending migrations...")
 
     await create_db_and_tables()
-    logger.info("Database tables checked/created.")
+    logger.info("Database schema is up to date.")
 
-    logger.info("Attempting to preload recommendation model and mappings...")
-    try:
-        # Need a db session to load mappings
-        async with AsyncSessionLocal() as db:
-            await load_model_and_mappings(db)
-        logger.info("Recommendation model and mappings preloading attempted.")
-    except Exception as e:
-        logger.error(f"Error during startup model preloading: {e}", exc_info=True)
+    # Loading and warm-up run in the background; /ready reports when it is done
+    logger.info("Preloading and warming up recommendation model in background...")
+    preload_task = asyncio.create_task(preload_model())
 
     yield
     # Shutdown
     logger.info("Application shutdown...")
+    preload_task.cancel()
+    shutdown_password_hasher()
 
 
 app = FastAPI(
@@ -80,17 +98,91 @@ async def health_check(db: AsyncSession = Depends(get_async_db)):
         raise HTTPException(status_code=503, detail="Database connection error")
 
 
+@app.get("/ready", tags=["Health"])
+async def readiness_check():
+    """Green only once the recommendation model is loaded and warmed up."""
+    readiness = get_readiness()
+    return JSONResponse(
+        status_code=200 if readiness["ready"] else 503, content=readiness
+    )
+
+
+@app.get("/health/db-pool", tags=["Health"])
+async def db_pool_metrics():
+    return get_pool_metrics()
+
+
+@app.get("/health/recommender", tags=["Health"])
+async def recommender_stage_latencies():
+    return {"stages": get_pipeline_stats()}
+
+
+@app.get("/health/training", tags=["Health"])
+async def training_status():
+    try:
+        return await get_training_status()
+    except Exception as e:
+        logger.error(f"Could not read training scheduler state: {e}")
+        raise HTTPException(status_code=503, detail="Training scheduler unavailable")
+
+
+@app.get("/health/rating-events", tags=["Health"])
+async def rating_events_lag():
+    try:
+        return await RatingEventConsumer(get_redis()).lag()
+    except Exception as e:
+        logger.error(f"Could not read rating event consumer lag: {e}")
+        raise HTTPException(status_code=503, detail="Rating event stream unavailable")
+
+
 # For debugging Celery tasks via HTTP (we do not need this here in production)
-from app.worker.tasks import test_celery, train_recommendation_model_task
+# Tasks are sent by name so the API never imports the worker/training code.
+from app.worker.celery_app import celery_app
 
 
 @app.post("/trigger-test-celery/{word}")
 async def trigger_test_task(word: str):
-    task = test_celery.delay(word)
+    task = celery_app.send_task("app.worker.tasks.test_celery", args=[word])
     return {"message": "Test Celery task triggered", "task_id": task.id}
 
 
 @app.post("/trigger-retrain-model")
-async def trigger_retrain_task():
-    task = train_recommendation_model_task.delay()
-    return {"message": "Model retraining task triggered", "task_id": task.id}
+async def trigger_retrain_task(
+    force: bool = False,
+    workers: Optional[int] = Query(None, ge=1, le=os.cpu_count()),
+    current_user: models.User = Depends(deps.get_current_active_user),
+):
+    """Queues a training run; triggers while one is queued share its task id.
+
+    Without `force`, the run is skipped if no rating changed since the last model.
+    `workers` > 1 trains data-parallel over that many local processes (at most
+    the number of CPUs).
+    """
+    task_id, created = await request_training(force=force, workers=workers)
+    message = (
+        "Model retraining task triggered"
+        if created
+        else "Model retraining already queued"
+    )
+    return {"message": message, "task_id": task_id, "deduplicated": not created}
+
+
+def _training_run(task_id: str) -> Dict[str, Any]:
+    result = celery_app.AsyncResult(task_id)
+    state, info = result.state, result.info
+    if isinstance(info, Exception):
+        info = {"error": repr(info)}
+    if state == "PENDING":
+        # Unknown to the result backend (e.g. expired): fall back to the file
+        # the latest run wrote next to the model
+        metrics = read_run_metrics()
+        if metrics is not None and metrics.get("task_id") == task_id:
+            state, info = metrics["status"].upper(), metrics
+    return {"task_id": task_id, "state": state, "metrics": info}
+
+
+@app.get("/training/runs/{task_id}", tags=["Training"])
+async def training_run(task_id: str):
+    """Live stage timings and epoch progress of a training run."""
+    # Reading the result backend is blocking I/O
+    return await run_in_threadpool(_training_run, task_id)
@@ -1,7 +1,10 @@
+import time
 from datetime import datetime
-from typing import Optional
+from typing import List, Optional
 
-from pydantic import BaseModel
+from pydantic import BaseModel, field_validator
+
+from app.core.config import settings
 
 
 class RatingBase(BaseModel):
@@ -11,7 +14,15 @@ class RatingBase(BaseModel):
 
 
 class RatingCreate(RatingBase):
-    pass
+    @field_validator("timestamp")
+    @classmethod
+    def timestamp_in_range(cls, value: int) -> int:
+        """Rejects negative timestamps and ones too far in the future."""
+        if value < 0:
+            raise ValueError("timestamp must not be negative")
+        if value > time.time() + settings.RATING_MAX_FUTURE_SECONDS:
+            raise ValueError("timestamp is too far in the future")
+        return value
 
 
 class RatingUpdate(BaseModel):
@@ -31,3 +42,17 @@ class RatingInDB(RatingBase):
 class Rating(RatingInDB):
 
     pass
+
+
+class RatingBulkItemResult(BaseModel):
+    index: int  # Position of the item in the submitted array / NDJSON stream
+    status: str  # "created", "invalid", "movie_not_found" or "error"
+    rating_id: Optional[int] = None
+    movie_id: Optional[int] = None
+    detail: Optional[str] = None
+
+
+class RatingBulkResult(BaseModel):
+    created: int
+    failed: int
+    results: List[RatingBulkItemResult]
@@ -0,0 +1,25 @@
+from typing import List, Optional
+
+from pydantic import BaseModel, Field, model_validator
+
+
+class RecommendationUserFilter(BaseModel):
+    active_only: bool = True
+    rated_since: Optional[int] = None  # Epoch seconds; users with a rating since then
+    min_ratings: int = 0
+    max_users: Optional[int] = None
+
+
+class RecommendationBatchRequest(BaseModel):
+    user_ids: Optional[List[int]] = None
+    filter: Optional[RecommendationUserFilter] = None
+    count: int = Field(10, ge=1, le=50)
+    exclude_watched: bool = True
+    genres: Optional[List[str]] = None
+    fill_with_trending: bool = True
+
+    @model_validator(mode="after")
+    def check_target(self) -> "RecommendationBatchRequest":
+        if (self.user_ids is None) == (self.filter is None):
+            raise ValueError("Provide exactly one of user_ids or filter")
+        return self
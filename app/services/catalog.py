@@ -0,0 +1,98 @@
+import asyncio
+import logging
+import re
+import time
+from typing import Dict, FrozenSet, Iterable, List, Optional, Set
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db import crud
+
+logger = logging.getLogger(__name__)
+
+_GENRE_SEPARATOR = re.compile(r"[|,]")
+
+
+def split_genres(genres: Optional[str]) -> List[str]:
+    """Splits a Movie.genres string ("Action|Comedy") into normalised genre names."""
+    if not genres:
+        return []
+    return [
+        genre.strip().lower()
+        for genre in _GENRE_SEPARATOR.split(genres)
+        if genre.strip()
+    ]
+
+
+class MovieIdCache:
+    """In-memory set of existing internal Movie.id values.
+
+    Lets write paths validate movie ids without a per-item query. The set is
+    reloaded when it is older than `max_age_seconds`. Ids missing from it are
+    looked up in the database (movies added since the last reload) and added,
+    so creating a movie needs no invalidation. Movies are never deleted by the
+    API; an id removed out of band lingers until the next reload.
+    """
+
+    def __init__(self, max_age_seconds: float = 300.0):
+        self.max_age_seconds = max_age_seconds
+        self._ids: FrozenSet[int] = frozenset()
+        self._loaded_at = 0.0
+        self._lock = asyncio.Lock()
+
+    async def _refresh(self, db: AsyncSession) -> None:
+        async with self._lock:
+            self._ids = frozenset(await crud.movie.get_all_ids(db))
+            self._loaded_at = time.monotonic()
+        logger.info(f"Movie id cache loaded with {len(self._ids)} ids.")
+
+    async def get_ids(self, db: AsyncSession) -> FrozenSet[int]:
+        if time.monotonic() - self._loaded_at > self.max_age_seconds:
+            await self._refresh(db)
+        return self._ids
+
+    async def find_unknown(
+        self, db: AsyncSession, movie_ids: Iterable[int]
+    ) -> Set[int]:
+        """Returns the subset of movie_ids that do not exist."""
+        wanted = set(movie_ids)
+        unknown = wanted - await self.get_ids(db)
+        if unknown:
+            found = set(await crud.movie.get_existing_ids(db, ids=list(unknown)))
+            if found:
+                self._ids = self._ids | found
+            unknown -= found
+        return unknown
+
+
+class MovieGenreCache:
+    """In-memory Movie.id -> genre list map, reloaded when an id is missing."""
+
+    def __init__(self, min_refresh_seconds: float = 30.0):
+        self.min_refresh_seconds = min_refresh_seconds
+        self._genres: Dict[int, List[str]] = {}
+        self._loaded_at = 0.0
+        self._lock = asyncio.Lock()
+
+    async def _refresh(self, db: AsyncSession) -> None:
+        async with self._lock:
+            self._genres = {
+                movie_id: split_genres(genres)
+                for movie_id, genres in await crud.movie.get_genres_map(db)
+            }
+            self._loaded_at = time.monotonic()
+
+    async def get_many(
+        self, db: AsyncSession, movie_ids: Iterable[int]
+    ) -> Dict[int, List[str]]:
+        wanted = set(movie_ids)
+        if (
+            wanted - self._genres.keys()
+            and time.monotonic() - self._loaded_at > self.min_refresh_seconds
+        ):
+            await self._refresh(db)
+        return {movie_id: self._genres.get(movie_id, []) for movie_id in wanted}
+
+
+movie_ids = MovieIdCache()
+movie_genres = MovieGenreCache()
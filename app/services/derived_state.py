@@ -0,0 +1,106 @@
+"""Derived state maintained from the rating event stream.
+
+Each handler receives a batch of decoded rating events (see
+app.services.events.decode_rating_event) and applies it to Redis with a
+single pipeline round trip. Handlers are not idempotent on their own; the
+consumer (app.worker.rating_events) skips events a handler already applied,
+and a replay rebuilds the state after reset_derived_state.
+"""
+
+import logging
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Sequence
+
+import redis.asyncio as aioredis
+
+from app.core.config import settings
+from app.services.popularity import BUCKET_KEY, update_popularity_counters
+
+logger = logging.getLogger(__name__)
+
+USER_HISTORY_KEY = "user_history:{user_id}"
+MOVIE_STATS_KEY = "movie_stats:{movie_id}"
+USER_HISTORY_LENGTH = settings.MAX_CONTEXT_LENGTH * 2
+
+
+async def update_movie_aggregates(
+    redis: aioredis.Redis, events: List[Dict[str, Any]]
+) -> None:
+    """Keeps per-movie rating count and sum (average = sum / count)."""
+    counts: Dict[int, int] = defaultdict(int)
+    sums: Dict[int, float] = defaultdict(float)
+    for event in events:
+        counts[event["movie_id"]] += 1
+        sums[event["movie_id"]] += event["rating"]
+
+    async with redis.pipeline(transaction=False) as pipe:
+        for movie_id, count in counts.items():
+            key = MOVIE_STATS_KEY.format(movie_id=movie_id)
+            pipe.hincrby(key, "count", count)
+            pipe.hincrbyfloat(key, "sum", sums[movie_id])
+        await pipe.execute()
+
+
+async def update_user_histories(
+    redis: aioredis.Redis, events: List[Dict[str, Any]]
+) -> None:
+    """Keeps each user's most recent movie ids (newest first), capped in length."""
+    per_user: Dict[int, List[Dict[str, Any]]] = defaultdict(list)
+    for event in events:
+        per_user[event["user_id"]].append(event)
+
+    async with redis.pipeline(transaction=False) as pipe:
+        for user_id, user_events in per_user.items():
+            user_events.sort(key=lambda e: e["timestamp"])
+            key = USER_HISTORY_KEY.format(user_id=user_id)
+            pipe.lpush(key, *[e["movie_id"] for e in user_events])
+            pipe.ltrim(key, 0, USER_HISTORY_LENGTH - 1)
+        await pipe.execute()
+
+
+DEFAULT_HANDLERS = [
+    update_movie_aggregates,
+    update_user_histories,
+    update_popularity_counters,
+]
+
+
+# Every key the handlers write to, as SCAN patterns
+DERIVED_KEY_PATTERNS = [
+    USER_HISTORY_KEY.format(user_id="*"),
+    MOVIE_STATS_KEY.format(movie_id="*"),
+    BUCKET_KEY.format(scope="*", bucket="*"),
+]
+
+
+async def reset_derived_state(
+    redis: aioredis.Redis, patterns: Sequence[str] = DERIVED_KEY_PATTERNS
+) -> int:
+    """Deletes every derived key (before rebuilding it from the stream)."""
+    deleted = 0
+    for pattern in patterns:
+        keys = [key async for key in redis.scan_iter(match=pattern, count=1000)]
+        for start in range(0, len(keys), 1000):
+            deleted += await redis.delete(*keys[start : start + 1000])
+    logger.info(f"Deleted {deleted} derived state keys.")
+    return deleted
+
+
+async def get_movie_stats(
+    redis: aioredis.Redis, movie_id: int
+) -> Optional[Dict[str, float]]:
+    stats = await redis.hgetall(MOVIE_STATS_KEY.format(movie_id=movie_id))
+    if not stats:
+        return None
+    count = int(stats.get("count", 0))
+    total = float(stats.get("sum", 0.0))
+    return {
+        "num_ratings": count,
+        "average_rating": total / count if count else 0.0,
+    }
+
+
+async def get_user_history(redis: aioredis.Redis, user_id: int) -> List[int]:
+    """Most recent movie ids for a user, oldest first (model context order)."""
+    movie_ids = await redis.lrange(USER_HISTORY_KEY.format(user_id=user_id), 0, -1)
+    return [int(movie_id) for movie_id in reversed(movie_ids)]
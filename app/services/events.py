@@ -0,0 +1,70 @@
+import logging
+from typing import Any, Dict, List, Optional, Sequence
+
+import redis.asyncio as aioredis
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+_redis: Optional[aioredis.Redis] = None
+
+
+def get_redis() -> aioredis.Redis:
+    """Shared async Redis client for application data (not the Celery broker)."""
+    global _redis
+    if _redis is None:
+        _redis = aioredis.Redis.from_url(
+            settings.REDIS_URL, decode_responses=True, socket_connect_timeout=2
+        )
+    return _redis
+
+
+def set_redis(client: Optional[aioredis.Redis]) -> None:
+    """Swaps the shared client, e.g. for a fakeredis instance or a local stand-in."""
+    global _redis
+    _redis = client
+
+
+def encode_rating_event(
+    rating_id: int, user_id: int, movie_id: int, rating: float, timestamp: int
+) -> Dict[str, str]:
+    # Single-letter field names keep stream entries compact
+    return {
+        "i": str(rating_id),
+        "u": str(user_id),
+        "m": str(movie_id),
+        "r": repr(float(rating)),
+        "t": str(timestamp),
+    }
+
+
+def decode_rating_event(event_id: str, fields: Dict[str, str]) -> Dict[str, Any]:
+    return {
+        "event_id": event_id,
+        "rating_id": int(fields["i"]),
+        "user_id": int(fields["u"]),
+        "movie_id": int(fields["m"]),
+        "rating": float(fields["r"]),
+        "timestamp": int(fields["t"]),
+    }
+
+
+async def publish_rating_events(events: Sequence[Dict[str, str]]) -> List[str]:
+    """Appends encoded rating events to the stream. Never raises: the rating is
+    already committed, so a publishing failure only delays derived state."""
+    if not settings.RATING_EVENTS_ENABLED or not events:
+        return []
+    try:
+        async with get_redis().pipeline(transaction=False) as pipe:
+            for fields in events:
+                pipe.xadd(
+                    settings.RATING_EVENTS_STREAM,
+                    fields,
+                    maxlen=settings.RATING_EVENTS_MAXLEN,
+                    approximate=True,
+                )
+            return await pipe.execute()
+    except Exception as e:
+        logger.warning(f"Could not publish {len(events)} rating event(s): {e}")
+        return []
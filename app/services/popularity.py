@@ -0,0 +1,151 @@
+"""Real-time trending lists from time-bucketed counters in Redis sorted sets.
+
+Every rating event increments the movie's score in the current time bucket,
+both overall and for each of the movie's genres. A trending list is the
+decayed sum of the last POPULARITY_WINDOW_BUCKETS buckets, materialised with
+ZUNIONSTORE at most once per POPULARITY_CACHE_SECONDS and then served with
+ZREVRANGE in O(log n + N).
+"""
+
+import logging
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import redis.asyncio as aioredis
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.db import crud
+from app.db.session import AsyncSessionLocal
+from app.services.catalog import movie_genres
+from app.services.events import get_redis
+
+logger = logging.getLogger(__name__)
+
+ALL_SCOPE = "all"
+BUCKET_KEY = "trending:{scope}:{bucket}"
+WINDOW_KEY = "trending:{scope}:window"
+
+
+def _scope(genre: Optional[str]) -> str:
+    return f"genre:{genre.strip().lower()}" if genre else ALL_SCOPE
+
+
+def _bucket(timestamp: Optional[float] = None) -> int:
+    now = time.time() if timestamp is None else timestamp
+    return int(now) // settings.POPULARITY_BUCKET_SECONDS
+
+
+def _event_time(event_id: str) -> float:
+    """Seconds since the epoch at which a stream entry was added."""
+    return int(event_id.split("-", 1)[0]) / 1000.0
+
+
+async def update_popularity_counters(
+    redis: aioredis.Redis, events: List[Dict[str, Any]]
+) -> None:
+    """Rating event handler: bumps overall and per-genre counters per bucket."""
+    async with AsyncSessionLocal() as db:
+        genres_by_movie = await movie_genres.get_many(
+            db, (event["movie_id"] for event in events)
+        )
+
+    # Bucketed by the time the event was written (its stream id), not by when it
+    # is applied, so reclaimed or replayed events land in their own bucket
+    increments: Dict[Tuple[str, int, int], float] = defaultdict(float)
+    for event in events:
+        movie_id = event["movie_id"]
+        bucket = _bucket(_event_time(event["event_id"]))
+        increments[(ALL_SCOPE, bucket, movie_id)] += 1.0
+        for genre in genres_by_movie.get(movie_id, []):
+            increments[(_scope(genre), bucket, movie_id)] += 1.0
+
+    window_buckets = settings.POPULARITY_WINDOW_BUCKETS + 1
+    touched_keys = {}
+    async with redis.pipeline(transaction=False) as pipe:
+        for (scope, bucket, movie_id), amount in increments.items():
+            key = BUCKET_KEY.format(scope=scope, bucket=bucket)
+            pipe.zincrby(key, amount, movie_id)
+            touched_keys[key] = bucket
+        for key, bucket in touched_keys.items():
+            # Buckets already out of the window expire immediately
+            pipe.expireat(
+                key, (bucket + window_buckets) * settings.POPULARITY_BUCKET_SECONDS
+            )
+        await pipe.execute()
+
+
+async def _materialise_window(redis: aioredis.Redis, scope: str) -> str:
+    window_key = WINDOW_KEY.format(scope=scope)
+    if await redis.exists(window_key):
+        return window_key
+
+    current = _bucket()
+    weights = {
+        BUCKET_KEY.format(scope=scope, bucket=current - age): (
+            settings.POPULARITY_DECAY**age
+        )
+        for age in range(settings.POPULARITY_WINDOW_BUCKETS)
+    }
+    async with redis.pipeline(transaction=True) as pipe:
+        pipe.zunionstore(window_key, weights)
+        pipe.expire(window_key, settings.POPULARITY_CACHE_SECONDS)
+        await pipe.execute()
+    return window_key
+
+
+async def get_trending_movie_ids(
+    count: int = 10,
+    genre: Optional[str] = None,
+    redis: Optional[aioredis.Redis] = None,
+) -> List[Tuple[int, float]]:
+    """Top `count` (movie_id, score) pairs for the recent window, best first."""
+    redis = redis or get_redis()
+    window_key = await _materialise_window(redis, _scope(genre))
+    top = await redis.zrevrange(window_key, 0, count - 1, withscores=True)
+    return [(int(movie_id), float(score)) for movie_id, score in top]
+
+
+async def get_trending_recommendations(
+    db: AsyncSession,
+    count: int = 10,
+    genre: Optional[str] = None,
+    exclude_movie_ids: Sequence[int] = (),
+) -> List[Dict[str, Any]]:
+    """Trending movies in the recommendation response format.
+
+    Falls back to all-time most rated movies when there are no recent events
+    (or Redis is unavailable), so cold-start users always get a list.
+    """
+    excluded = set(exclude_movie_ids)
+    wanted = count + len(excluded)
+    source = "trending"
+    try:
+        ranked_ids = [
+            movie_id
+            for movie_id, _ in await get_trending_movie_ids(wanted, genre=genre)
+        ]
+    except Exception as e:
+        logger.warning(f"Trending counters unavailable: {e}")
+        ranked_ids = []
+    if not ranked_ids and genre is None:
+        ranked_ids = await crud.movie.get_most_rated_ids(db, limit=wanted)
+        source = "popular"
+
+    ranked_ids = [movie_id for movie_id in ranked_ids if movie_id not in excluded]
+    movies_by_id = {
+        movie.id: movie for movie in await crud.movie.get_by_ids(db, ranked_ids[:count])
+    }
+    return [
+        {
+            "movie_id": movie_id,
+            "movie_lens_id": movies_by_id[movie_id].movie_lens_id,
+            "title": movies_by_id[movie_id].title,
+            "resource_url": movies_by_id[movie_id].resource_url,
+            "genres": movies_by_id[movie_id].genres,
+            "source": source,
+        }
+        for movie_id in ranked_ids[:count]
+        if movie_id in movies_by_id
+    ]
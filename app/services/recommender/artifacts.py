@@ -0,0 +1,49 @@
+"""Files produced alongside the trained model in models_store.
+
+Every artifact derived from a model is tagged with the model version (the
+model file's mtime in nanoseconds) so that serving code only uses artifacts
+that belong to the model it has loaded.
+"""
+
+import os
+from pathlib import Path
+from typing import Dict, Optional
+
+import numpy as np
+
+from app.core.config import settings
+
+
+def artifact_path(suffix: str, model_path: str = settings.MODEL_PATH) -> Path:
+    """artifact_path("neighbours.npz") -> models_store/gru4rec_model.neighbours.npz"""
+    path = Path(model_path)
+    return path.with_name(f"{path.stem}.{suffix}")
+
+
+def model_version(model_path: str = settings.MODEL_PATH) -> Optional[str]:
+    path = Path(model_path)
+    if not path.exists():
+        return None
+    return str(path.stat().st_mtime_ns)
+
+
+def save_npz_atomic(path: Path, **arrays: np.ndarray) -> None:
+    """Writes an .npz next to its final location and renames it into place, so
+    readers never observe a partially written file."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    with open(tmp_path, "wb") as f:
+        np.savez(f, **arrays)
+    os.replace(tmp_path, path)
+
+
+def load_versioned_npz(
+    path: Path, expected_version: Optional[str]
+) -> Optional[Dict[str, np.ndarray]]:
+    """Loads an .npz artifact if it exists and was built for `expected_version`."""
+    if expected_version is None or not path.exists():
+        return None
+    with np.load(path) as data:
+        if str(data["model_version"]) != expected_version:
+            return None
+        return {name: data[name] for name in data.files}
@@ -0,0 +1,170 @@
+"""Checkpoints that let an interrupted training run resume.
+
+Each run (keyed by its Celery task id, which a redelivered task keeps) gets a
+directory under models_store/checkpoints/ holding:
+
+- snapshot.npz: the preprocessed dataset (train/test contexts and labels,
+  vocabulary), written once preprocessing finishes;
+- epoch-NNNN.keras: the full model after each epoch. Keras saves the
+  optimizer state too, so fit resumes exactly where it stopped;
+- meta.json: run metadata, e.g. the ratings fingerprint the run started from.
+
+Only the newest TRAINING_CHECKPOINTS_TO_KEEP epoch files are kept. The run's
+own directory is removed once its model is saved.
+
+A run that fails in-process (train_model raises or returns False) also
+removes its directory: the task isn't redelivered, and resuming would only
+repeat the failure. Only one run trains at a time, so a directory left by
+another task id belongs to a run whose worker died. Its redelivery can arrive after the next scheduled run
+(the broker's visibility timeout is as long as a run), so a starting run
+without checkpoints of its own takes over the newest such directory and
+resumes it; older ones are removed.
+"""
+
+import json
+import logging
+import os
+import re
+import shutil
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.core.config import settings
+from app.services.recommender.artifacts import save_npz_atomic
+from app.services.recommender.vocabulary import MovieVocabulary
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_DIR = Path(settings.MODEL_PATH).parent / "checkpoints"
+_EPOCH_FILE = re.compile(r"^epoch-(\d+)\.keras$")
+
+
+class DatasetSnapshot:
+    """Preprocessed training data: split examples plus their vocabulary."""
+
+    def __init__(
+        self,
+        vocabulary: MovieVocabulary,
+        train_contexts: np.ndarray,
+        train_labels: np.ndarray,
+        test_contexts: np.ndarray,
+        test_labels: np.ndarray,
+    ):
+        self.vocabulary = vocabulary
+        self.train_contexts = train_contexts
+        self.train_labels = train_labels
+        self.test_contexts = test_contexts
+        self.test_labels = test_labels
+
+
+class TrainingCheckpoints:
+    """Dataset snapshot and epoch checkpoints of one training run."""
+
+    def __init__(
+        self,
+        run_id: str,
+        root: Path = CHECKPOINT_DIR,
+        keep: int = settings.TRAINING_CHECKPOINTS_TO_KEEP,
+    ):
+        self.path = root / run_id
+        self.root = root
+        self.keep = max(keep, 1)
+
+    def prepare(self) -> None:
+        """Creates this run's directory, resuming the newest abandoned run's."""
+        self.root.mkdir(parents=True, exist_ok=True)
+        others = sorted(
+            (
+                other
+                for other in self.root.iterdir()
+                if other.is_dir() and other != self.path
+            ),
+            key=lambda other: other.stat().st_mtime,
+        )
+        resumable = [other for other in others if (other / "snapshot.npz").exists()]
+        if resumable and not self.path.exists():
+            newest = resumable[-1]
+            logger.info(f"Resuming the checkpoints of abandoned run {newest.name}.")
+            os.rename(newest, self.path)
+            others.remove(newest)
+        self.path.mkdir(exist_ok=True)
+        for other in others:
+            logger.info(f"Removing checkpoints of abandoned run {other.name}.")
+            shutil.rmtree(other, ignore_errors=True)
+
+    @property
+    def meta(self) -> Dict[str, Any]:
+        path = self.path / "meta.json"
+        return json.loads(path.read_text()) if path.exists() else {}
+
+    def update_meta(self, **values: Any) -> None:
+        path = self.path / "meta.json"
+        tmp_path = path.with_name(".meta.json.tmp")
+        tmp_path.write_text(json.dumps({**self.meta, **values}))
+        os.replace(tmp_path, path)
+
+    def save_snapshot(self, snapshot: DatasetSnapshot) -> None:
+        save_npz_atomic(
+            self.path / "snapshot.npz",
+            vocabulary=snapshot.vocabulary.movie_ids,
+            train_contexts=snapshot.train_contexts,
+            train_labels=snapshot.train_labels,
+            test_contexts=snapshot.test_contexts,
+            test_labels=snapshot.test_labels,
+        )
+        logger.info(f"Dataset snapshot saved to {self.path}.")
+
+    def load_snapshot(self) -> Optional[DatasetSnapshot]:
+        path = self.path / "snapshot.npz"
+        if not path.exists():
+            return None
+        with np.load(path) as data:
+            return DatasetSnapshot(
+                MovieVocabulary(data["vocabulary"]),
+                data["train_contexts"],
+                data["train_labels"],
+                data["test_contexts"],
+                data["test_labels"],
+            )
+
+    def epochs(self) -> List[Tuple[int, Path]]:
+        """(completed epochs, checkpoint file), oldest first."""
+        if not self.path.exists():
+            return []
+        found = []
+        for file in self.path.iterdir():
+            match = _EPOCH_FILE.match(file.name)
+            if match:
+                found.append((int(match.group(1)), file))
+        return sorted(found)
+
+    def latest(self) -> Optional[Tuple[int, Path]]:
+        epochs = self.epochs()
+        return epochs[-1] if epochs else None
+
+    def save_epoch(self, model: Any, epoch: int) -> None:
+        """Saves the model after `epoch` completed epochs and prunes old ones."""
+        path = self.path / f"epoch-{epoch:04d}.keras"
+        # Keras needs the .keras suffix, so the temporary file keeps it
+        tmp_path = self.path / f".tmp-epoch-{epoch:04d}.keras"
+        model.save(tmp_path)
+        os.replace(tmp_path, path)
+        for _, old in self.epochs()[: -self.keep]:
+            old.unlink(missing_ok=True)
+        logger.info(f"Checkpoint saved: {path}")
+
+    def clear(self) -> None:
+        shutil.rmtree(self.path, ignore_errors=True)
+
+
+def keras_checkpoint_callback(checkpoints: TrainingCheckpoints):
+    """A Keras callback saving a checkpoint at the end of every epoch."""
+    import keras
+
+    class _CheckpointCallback(keras.callbacks.Callback):
+        def on_epoch_end(self, epoch, logs=None):
+            checkpoints.save_epoch(self.model, epoch + 1)
+
+    return _CheckpointCallback()
@@ -0,0 +1,317 @@
+"""Data-parallel CPU training over local worker processes.
+
+With TRAINING_WORKERS > 1, training runs in that many spawned processes
+joined by tf.distribute.MultiWorkerMirroredStrategy (TF_CONFIG on localhost
+ports from TRAINING_WORKER_PORT). Keras 3's fit can't run under that
+strategy, so _fit_replicated drives the model's train_step instead. The Celery worker runs with -P solo, so the
+training task itself starts and supervises them.
+
+- Input: every worker loads the run's dataset snapshot (checkpoints.py) and
+  keeps an equal, disjoint slice of it, batched per replica (the global
+  batch is split evenly), so all workers run the same number of steps per
+  epoch.
+- Saving: MirroredStrategy saves are collective, so every worker saves, but
+  only rank 0 writes to the real locations (epoch checkpoints, the model).
+  The other ranks write to a scratch directory that is then deleted.
+- Progress: rank 0 forwards its training progress to the parent's TrainingRun
+  through a queue.
+- Threads: each worker gets cpu_count / TRAINING_WORKERS intra-op threads,
+  so the processes don't oversubscribe the host.
+
+Each replica scores its queries against its local batch only, so in-batch
+negatives shrink with the number of workers.
+"""
+
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import shutil
+import tempfile
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.core.config import settings
+from app.services.recommender.checkpoints import TrainingCheckpoints
+from app.services.recommender.instrumentation import TrainingRun
+
+logger = logging.getLogger(__name__)
+
+# How often the parent checks on its workers while relaying progress
+POLL_SECONDS = 1.0
+
+
+def cluster_spec(num_workers: int, port: int) -> Dict[str, List[str]]:
+    return {"worker": [f"localhost:{port + rank}" for rank in range(num_workers)]}
+
+
+def shard_examples(
+    contexts: np.ndarray, labels: np.ndarray, rank: int, num_workers: int
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Equal, disjoint slice of the examples for one worker.
+
+    Up to num_workers - 1 examples are dropped so every worker gets the same
+    number of batches (uneven step counts deadlock the collectives).
+    """
+    size = len(labels) // num_workers
+    return contexts[rank::num_workers][:size], labels[rank::num_workers][:size]
+
+
+class _ProgressRelay:
+    """Stands in for TrainingRun on rank 0 and forwards fit progress."""
+
+    def __init__(self, progress: Any):
+        self.progress = progress
+
+    def epoch_started(self, epoch: int, epochs: int, batches: Optional[int]) -> None:
+        self.progress.put(("epoch_started", (epoch, epochs, batches)))
+
+    def batch_finished(self, batch: int, batch_size: int, logs: Dict) -> None:
+        self.progress.put(("batch_finished", (batch, batch_size, _plain(logs))))
+
+    def epoch_finished(self, epoch: int, logs: Dict, examples: int) -> None:
+        self.progress.put(("epoch_finished", (epoch, _plain(logs), examples)))
+
+
+def _plain(logs: Optional[Dict]) -> Dict[str, float]:
+    return {name: float(value) for name, value in (logs or {}).items()}
+
+
+def fit_distributed(
+    checkpoints: TrainingCheckpoints,
+    num_workers: int,
+    run: TrainingRun,
+    model_path: str,
+    epochs: Optional[int] = None,
+    batch_size: Optional[int] = None,
+    port: int = settings.TRAINING_WORKER_PORT,
+) -> bool:
+    """Fits the model on the snapshot in `checkpoints` with num_workers processes.
+
+    Rank 0 saves the trained model to model_path. Returns True on success;
+    if any worker fails, the others are stopped (they would block in the
+    next collective) and False is returned.
+    """
+    threads = max((os.cpu_count() or 1) // num_workers, 1)
+    logger.info(
+        f"Starting {num_workers} training workers on ports {port}-"
+        f"{port + num_workers - 1} ({threads} threads each)."
+    )
+    context = multiprocessing.get_context("spawn")
+    progress = context.Queue()
+    processes = []
+    for rank in range(num_workers):
+        job = {
+            "rank": rank,
+            "num_workers": num_workers,
+            "port": port,
+            "threads": threads,
+            "run_id": checkpoints.path.name,
+            "checkpoint_root": str(checkpoints.root),
+            "model_path": model_path,
+            "epochs": epochs,
+            "batch_size": batch_size,
+        }
+        process = context.Process(
+            target=_train_worker,
+            args=(job, progress),
+            name=f"training-worker-{rank}",
+        )
+        process.start()
+        processes.append(process)
+
+    try:
+        while True:
+            _relay(progress, run, timeout=POLL_SECONDS)
+            failed = [p for p in processes if p.exitcode not in (None, 0)]
+            if failed:
+                logger.error(
+                    "Training workers failed: "
+                    + ", ".join(f"{p.name} (exit {p.exitcode})" for p in failed)
+                )
+                return False
+            if all(p.exitcode == 0 for p in processes):
+                break
+    finally:
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+            process.join()
+    while _relay(progress, run, timeout=None):
+        pass
+    return True
+
+
+def _relay(progress: Any, run: TrainingRun, timeout: Optional[float]) -> bool:
+    """Applies one progress message to `run`; False if none arrived."""
+    try:
+        if timeout is None:
+            method, args = progress.get_nowait()
+        else:
+            method, args = progress.get(timeout=timeout)
+    except queue.Empty:
+        return False
+    getattr(run, method)(*args)
+    return True
+
+
+def _train_worker(job: Dict[str, Any], progress: Any) -> None:
+    """One MultiWorkerMirroredStrategy worker (runs in a spawned process)."""
+    rank, num_workers = job["rank"], job["num_workers"]
+    os.environ["TF_CONFIG"] = json.dumps(
+        {
+            "cluster": cluster_spec(num_workers, job["port"]),
+            "task": {"type": "worker", "index": rank},
+        }
+    )
+    import tensorflow as tf
+
+    from app.services.recommender import train
+    from app.services.recommender.checkpoints import keras_checkpoint_callback
+    from app.services.recommender.instrumentation import keras_progress_callback
+    from app.services.recommender.preprocessing import create_tf_datasets
+
+    tf.config.threading.set_intra_op_parallelism_threads(job["threads"])
+    strategy = tf.distribute.MultiWorkerMirroredStrategy()
+
+    run_checkpoints = TrainingCheckpoints(job["run_id"], Path(job["checkpoint_root"]))
+    snapshot = run_checkpoints.load_snapshot()
+    if snapshot is None:
+        raise RuntimeError(f"No dataset snapshot in {run_checkpoints.path}")
+    epochs = job["epochs"] or train.NUM_EPOCHS
+    global_batch_size = job["batch_size"] or train.BATCH_SIZE
+    batch_size = max(global_batch_size // num_workers, 1)
+
+    train_contexts, train_labels = shard_examples(
+        snapshot.train_contexts, snapshot.train_labels, rank, num_workers
+    )
+    if not len(train_labels):
+        raise RuntimeError("Fewer training examples than workers.")
+    train_ds = create_tf_datasets(
+        train_contexts, train_labels, batch_size, is_training=True
+    )
+    fit_kwargs = {}
+    test_contexts, test_labels = shard_examples(
+        snapshot.test_contexts, snapshot.test_labels, rank, num_workers
+    )
+    if len(test_labels):
+        fit_kwargs["validation_data"] = create_tf_datasets(
+            test_contexts, test_labels, batch_size, is_training=False
+        )
+
+    is_chief = rank == 0
+    scratch = None if is_chief else Path(tempfile.mkdtemp(prefix=f".worker-{rank}-"))
+    try:
+        with strategy.scope():
+            model, initial_epoch = train.load_or_build_model(
+                snapshot.vocabulary, run_checkpoints
+            )
+        if model is None:
+            raise RuntimeError("Could not build the model.")
+        if is_chief:
+            checkpoints = run_checkpoints
+        else:
+            checkpoints = TrainingCheckpoints(job["run_id"], root=scratch)
+            checkpoints.prepare()
+        callbacks = [keras_checkpoint_callback(checkpoints)]
+        if is_chief:
+            callbacks.append(
+                keras_progress_callback(
+                    _ProgressRelay(progress),
+                    batch_size * num_workers,
+                    len(train_labels) * num_workers,
+                )
+            )
+        _fit_replicated(
+            strategy,
+            model,
+            train_ds,
+            epochs=epochs,
+            initial_epoch=initial_epoch,
+            callbacks=callbacks,
+            **fit_kwargs,
+        )
+        if is_chief:
+            os.makedirs(os.path.dirname(job["model_path"]), exist_ok=True)
+        model.save(job["model_path"] if is_chief else scratch / "model.keras")
+    finally:
+        if scratch is not None:
+            shutil.rmtree(scratch, ignore_errors=True)
+
+
+def _fit_replicated(
+    strategy: Any,
+    model: Any,
+    train_ds: Any,
+    epochs: int,
+    initial_epoch: int,
+    callbacks: List[Any],
+    validation_data: Any = None,
+) -> None:
+    """model.fit for MultiWorkerMirroredStrategy.
+
+    Keras 3's TF trainer reduces the input batch and the scalar logs along
+    axis 0 under this strategy, which fails with more than one worker. This
+    runs the model's own train_step / test_step on every replica and
+    averages the logs across workers instead.
+    """
+    import keras
+    import tensorflow as tf
+
+    def replicated(step_function):
+        @tf.function
+        def step(batch):
+            logs = strategy.run(step_function, args=(batch,))
+            return {
+                name: strategy.reduce("MEAN", value, axis=None)
+                for name, value in logs.items()
+            }
+
+        return step
+
+    def distribute(dataset):
+        # Datasets are already per-replica: no re-batching or sharding
+        return strategy.distribute_datasets_from_function(lambda _: dataset)
+
+    train_step = replicated(model.train_step)
+    test_step = replicated(model.test_step)
+    train_batches = distribute(train_ds)
+    validation_batches = (
+        distribute(validation_data) if validation_data is not None else None
+    )
+
+    if not model.optimizer.built:
+        # fit builds the optimizer before the first step; do the same here
+        with strategy.scope():
+            model.optimizer.build(model.trainable_variables)
+    callback_list = keras.callbacks.CallbackList(
+        callbacks,
+        model=model,
+        epochs=epochs,
+        steps=int(train_ds.cardinality()),
+        verbose=0,
+    )
+    model.stop_training = False
+    callback_list.on_train_begin()
+    for epoch in range(initial_epoch, epochs):
+        model.reset_metrics()
+        callback_list.on_epoch_begin(epoch)
+        logs = {}
+        for batch, data in enumerate(train_batches):
+            callback_list.on_train_batch_begin(batch)
+            logs = _plain(train_step(data))
+            callback_list.on_train_batch_end(batch, logs)
+        epoch_logs = dict(logs)
+        if validation_batches is not None:
+            model.reset_metrics()
+            val_logs = {}
+            for data in validation_batches:
+                val_logs = _plain(test_step(data))
+            epoch_logs.update({f"val_{name}": v for name, v in val_logs.items()})
+        callback_list.on_epoch_end(epoch, epoch_logs)
+        if model.stop_training:
+            break
+    callback_list.on_train_end()
@@ -0,0 +1,198 @@
+"""Embedding tables for the query and candidate towers.
+
+EMBEDDING_BACKEND picks the table used by SequentialRetrievalModel:
+
+- "full": one row per vocabulary row (keras.layers.Embedding);
+- "hash": the hashing trick. Each row sums NUM_HASHES vectors from a shared
+  table of `buckets` vectors, picked by independent universal hashes, so
+  rows that collide on one hash are still told apart by the others;
+- "qr": quotient-remainder compositional embeddings. Row r is
+  Q[r // buckets] + R[r % buckets]. Every row gets a unique pair of vectors
+  from two tables of about num_rows / buckets and buckets rows.
+
+The number of buckets follows from EMBEDDING_MEMORY_BUDGET_MB (per table).
+When the full table fits the budget, the full table is used.
+
+Both compact layers expose `embeddings` as the materialised (num_rows, dim)
+table, like keras.layers.Embedding. Retrieval and the serving segment
+therefore work unchanged; only training holds the compact weights.
+"""
+
+import logging
+import math
+from typing import Tuple
+
+import keras
+import numpy as np
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_BACKENDS = ("full", "hash", "qr")
+NUM_HASHES = 2
+HASH_PRIME = 2**31 - 1
+HASH_SEED = 1234
+
+
+def table_rows(backend: str, num_rows: int, buckets: int) -> int:
+    """Rows of trainable vectors one table holds with the given backend."""
+    if backend == "hash":
+        return buckets
+    if backend == "qr":
+        return math.ceil(num_rows / buckets) + buckets
+    return num_rows
+
+
+def resolve_backend(
+    num_rows: int,
+    dim: int,
+    backend: str = settings.EMBEDDING_BACKEND,
+    budget_mb: float = settings.EMBEDDING_MEMORY_BUDGET_MB,
+) -> Tuple[str, int]:
+    """(backend, buckets) for a table of num_rows x dim float32 within budget."""
+    if backend not in EMBEDDING_BACKENDS:
+        raise ValueError(f"Unsupported embedding backend: {backend}")
+    budget_rows = int(budget_mb * 1024 * 1024) // (4 * dim)
+    if backend == "full" or budget_rows >= num_rows:
+        return "full", 0
+    if backend == "hash":
+        return "hash", max(budget_rows, 1)
+    # qr: largest `buckets` with ceil(num_rows / buckets) + buckets <= budget.
+    # The smallest possible table (buckets = sqrt(num_rows)) is the floor.
+    smallest = math.isqrt(max(num_rows - 1, 0)) + 1
+    buckets = smallest
+    if budget_rows * budget_rows > 4 * num_rows:
+        buckets = max(
+            int((budget_rows + math.sqrt(budget_rows**2 - 4 * num_rows)) / 2),
+            smallest,
+        )
+    while buckets > smallest and table_rows("qr", num_rows, buckets) > budget_rows:
+        buckets -= 1
+    if table_rows("qr", num_rows, buckets) > budget_rows:
+        logger.warning(
+            f"EMBEDDING_MEMORY_BUDGET_MB={budget_mb} is below the smallest "
+            f"quotient-remainder table for {num_rows} rows; using {buckets} buckets."
+        )
+    return "qr", buckets
+
+
+def hash_buckets(num_rows: int, buckets: int, num_hashes: int = NUM_HASHES):
+    """(num_rows, num_hashes) int32 bucket of every row under each hash."""
+    rng = np.random.RandomState(HASH_SEED)
+    rows = np.arange(num_rows, dtype=np.int64)
+    columns = []
+    for _ in range(num_hashes):
+        a = rng.randint(1, HASH_PRIME, dtype=np.int64)
+        b = rng.randint(0, HASH_PRIME, dtype=np.int64)
+        columns.append(((rows * a + b) % HASH_PRIME) % buckets)
+    return np.stack(columns, axis=1).astype(np.int32)
+
+
+@keras.saving.register_keras_serializable(package="recommender")
+class HashedEmbedding(keras.layers.Layer):
+    """Hashing-trick embedding: sum of NUM_HASHES vectors from a shared table."""
+
+    def __init__(self, input_dim: int, output_dim: int, buckets: int, **kwargs):
+        super().__init__(**kwargs)
+        self.input_dim = input_dim
+        self.output_dim = output_dim
+        self.buckets = buckets
+
+    def build(self, input_shape=None):
+        self.table = self.add_weight(
+            shape=(self.buckets, self.output_dim),
+            initializer="uniform",
+            name="table",
+        )
+        # Bucket ids are fixed at construction; stored so saved models agree
+        self.bucket_ids = self.add_weight(
+            shape=(self.input_dim, NUM_HASHES),
+            initializer="zeros",
+            dtype="int32",
+            trainable=False,
+            name="bucket_ids",
+        )
+        self.bucket_ids.assign(hash_buckets(self.input_dim, self.buckets))
+        super().build(input_shape)
+
+    def call(self, inputs):
+        ids = keras.ops.take(self.bucket_ids, keras.ops.cast(inputs, "int32"), axis=0)
+        return keras.ops.sum(keras.ops.take(self.table, ids, axis=0), axis=-2)
+
+    @property
+    def embeddings(self):
+        """The materialised (input_dim, output_dim) table."""
+        return keras.ops.sum(keras.ops.take(self.table, self.bucket_ids, axis=0), -2)
+
+    def get_config(self):
+        config = super().get_config()
+        config.update(
+            {
+                "input_dim": self.input_dim,
+                "output_dim": self.output_dim,
+                "buckets": self.buckets,
+            }
+        )
+        return config
+
+
+@keras.saving.register_keras_serializable(package="recommender")
+class QREmbedding(keras.layers.Layer):
+    """Quotient-remainder embedding: Q[row // buckets] + R[row % buckets]."""
+
+    def __init__(self, input_dim: int, output_dim: int, buckets: int, **kwargs):
+        super().__init__(**kwargs)
+        self.input_dim = input_dim
+        self.output_dim = output_dim
+        self.buckets = buckets
+
+    def build(self, input_shape=None):
+        self.quotient = self.add_weight(
+            shape=(math.ceil(self.input_dim / self.buckets), self.output_dim),
+            initializer="uniform",
+            name="quotient",
+        )
+        self.remainder = self.add_weight(
+            shape=(self.buckets, self.output_dim),
+            initializer="uniform",
+            name="remainder",
+        )
+        super().build(input_shape)
+
+    def call(self, inputs):
+        ids = keras.ops.cast(inputs, "int32")
+        return keras.ops.take(
+            self.quotient, keras.ops.floor_divide(ids, self.buckets), axis=0
+        ) + keras.ops.take(self.remainder, keras.ops.mod(ids, self.buckets), axis=0)
+
+    @property
+    def embeddings(self):
+        """The materialised (input_dim, output_dim) table."""
+        return self.call(keras.ops.arange(self.input_dim, dtype="int32"))
+
+    def get_config(self):
+        config = super().get_config()
+        config.update(
+            {
+                "input_dim": self.input_dim,
+                "output_dim": self.output_dim,
+                "buckets": self.buckets,
+            }
+        )
+        return config
+
+
+def make_embedding(
+    num_rows: int, dim: int, backend: str = "full", buckets: int = 0
+) -> keras.layers.Layer:
+    if backend == "hash":
+        return HashedEmbedding(num_rows, dim, buckets)
+    if backend == "qr":
+        return QREmbedding(num_rows, dim, buckets)
+    return keras.layers.Embedding(num_rows, dim)
+
+
+def embedding_table(layer: keras.layers.Layer) -> np.ndarray:
+    """The (num_rows, dim) float32 table of any of the embedding layers."""
+    return np.asarray(keras.ops.convert_to_numpy(layer.embeddings), dtype=np.float32)
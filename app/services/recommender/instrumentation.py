@@ -0,0 +1,189 @@
+"""Structured metrics for a training run.
+
+TrainingRun times the stages of train_model (extract, examples, vocabulary,
+encode, snapshot, datasets, build, fit, save, artifacts, publish). It records
+rows/s per stage, peak RSS and the epoch progress of model.fit, and publishes
+a snapshot:
+
+- to a callback, e.g. Celery's update_state, so GET /training/runs/{task_id}
+  shows live progress;
+- to RUN_METRICS_ARTIFACT next to the model (latest run only).
+
+Peak RSS is the getrusage high-water mark, so in a long-lived worker it can
+include earlier runs. peak_rss_mb covers this process; peak_rss_children_mb
+the largest child it has waited for, e.g. a distributed training worker
+(only counted once that child has exited).
+"""
+
+import json
+import logging
+import os
+import resource
+import sys
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from app.services.recommender.artifacts import artifact_path
+
+logger = logging.getLogger(__name__)
+
+RUN_METRICS_ARTIFACT = "run-metrics.json"
+PROGRESS_STATE = "PROGRESS"
+# Batch progress is published at most this often
+PROGRESS_INTERVAL_SECONDS = 2.0
+
+
+def peak_rss_mb(who: int = resource.RUSAGE_SELF) -> float:
+    """Peak RSS of this process, or of its largest reaped child (RUSAGE_CHILDREN)."""
+    peak = resource.getrusage(who).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+class TrainingRun:
+    """Stage timings, throughput, memory and fit progress of one training run."""
+
+    def __init__(
+        self,
+        task_id: Optional[str] = None,
+        report: Optional[Callable[[Dict[str, Any]], None]] = None,
+    ):
+        self.task_id = task_id
+        self.report = report
+        self.status = "running"
+        self.started_at = time.time()
+        self.stages: List[Dict[str, Any]] = []
+        self.fit: Dict[str, Any] = {}
+        self._stage_started: Optional[float] = None
+        self._last_progress = 0.0
+
+    def stage(self, name: str) -> None:
+        """Ends the current stage (if any) and starts `name`."""
+        self._end_stage()
+        self.stages.append({"name": name})
+        self._stage_started = time.perf_counter()
+        logger.info(f"Training stage: {name}")
+
+    def count(self, rows: int) -> None:
+        """Rows (or examples) processed by the current stage."""
+        if self.stages:
+            self.stages[-1]["rows"] = int(rows)
+
+    def _end_stage(self) -> None:
+        if self._stage_started is None:
+            return
+        current = self.stages[-1]
+        seconds = time.perf_counter() - self._stage_started
+        current["seconds"] = round(seconds, 3)
+        if "rows" in current and seconds > 0:
+            current["rows_per_s"] = round(current["rows"] / seconds, 1)
+        current["peak_rss_mb"] = round(peak_rss_mb(), 1)
+        current["peak_rss_children_mb"] = round(
+            peak_rss_mb(resource.RUSAGE_CHILDREN), 1
+        )
+        self._stage_started = None
+        logger.info(f"Training stage finished: {current}")
+        self.publish()
+
+    def epoch_started(self, epoch: int, epochs: int, batches: Optional[int]) -> None:
+        self.fit.update({"epoch": epoch + 1, "epochs": epochs, "batches": batches})
+        self.fit["batch"] = 0
+        self.fit["_epoch_started"] = time.perf_counter()
+
+    def batch_finished(self, batch: int, batch_size: int, logs: Dict) -> None:
+        self.fit["batch"] = batch + 1
+        elapsed = time.perf_counter() - self.fit["_epoch_started"]
+        if elapsed > 0:
+            self.fit["examples_per_s"] = round((batch + 1) * batch_size / elapsed, 1)
+        self.fit["logs"] = _floats(logs)
+        now = time.monotonic()
+        if now - self._last_progress >= PROGRESS_INTERVAL_SECONDS:
+            self._last_progress = now
+            self.publish(write=False)
+
+    def epoch_finished(self, epoch: int, logs: Dict, examples: int) -> None:
+        seconds = time.perf_counter() - self.fit.pop("_epoch_started")
+        summary = {
+            "epoch": epoch + 1,
+            "seconds": round(seconds, 3),
+            "examples_per_s": round(examples / seconds, 1) if seconds > 0 else None,
+            **_floats(logs),
+        }
+        self.fit.setdefault("history", []).append(summary)
+        logger.info(f"Epoch finished: {summary}")
+        self.publish()
+
+    def finish(self, status: str) -> Dict[str, Any]:
+        self._end_stage()
+        self.status = status
+        self.publish()
+        return self.to_dict()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "task_id": self.task_id,
+            "status": self.status,
+            "started_at": self.started_at,
+            "elapsed_s": round(time.time() - self.started_at, 3),
+            "stage": self.stages[-1]["name"] if self.stages else None,
+            "stages": self.stages,
+            "fit": {
+                name: value
+                for name, value in self.fit.items()
+                if not name.startswith("_")
+            },
+            "peak_rss_mb": round(peak_rss_mb(), 1),
+            "peak_rss_children_mb": round(peak_rss_mb(resource.RUSAGE_CHILDREN), 1),
+        }
+
+    def publish(self, write: bool = True) -> None:
+        """Sends a snapshot to the report callback and, with `write`, the file."""
+        snapshot = self.to_dict()
+        if self.report is not None:
+            try:
+                self.report(snapshot)
+            except Exception as e:
+                logger.warning(f"Could not publish training progress: {e}")
+        if write:
+            try:
+                write_run_metrics(snapshot)
+            except OSError as e:
+                logger.warning(f"Could not write run metrics: {e}")
+
+
+def _floats(logs: Optional[Dict]) -> Dict[str, float]:
+    return {name: float(value) for name, value in (logs or {}).items()}
+
+
+def keras_progress_callback(run: TrainingRun, batch_size: int, examples: int):
+    """A Keras callback feeding epoch / batch progress into `run`."""
+    import keras
+
+    class _ProgressCallback(keras.callbacks.Callback):
+        def on_epoch_begin(self, epoch, logs=None):
+            params = self.params or {}
+            run.epoch_started(epoch, params.get("epochs"), params.get("steps"))
+
+        def on_train_batch_end(self, batch, logs=None):
+            run.batch_finished(batch, batch_size, logs)
+
+        def on_epoch_end(self, epoch, logs=None):
+            run.epoch_finished(epoch, logs, examples)
+
+    return _ProgressCallback()
+
+
+def write_run_metrics(metrics: Dict[str, Any]) -> None:
+    path = artifact_path(RUN_METRICS_ARTIFACT)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    tmp_path.write_text(json.dumps(metrics, indent=2))
+    os.replace(tmp_path, path)
+
+
+def read_run_metrics() -> Optional[Dict[str, Any]]:
+    """Metrics of the latest run, from the file next to the model."""
+    path = artifact_path(RUN_METRICS_ARTIFACT)
+    if not path.exists():
+        return None
+    return json.loads(path.read_text())
@@ -2,9 +2,9 @@ import logging
 
 import keras
 import keras_rs
-import tensorflow as tf
 
 from app.core.config import settings
+from app.services.recommender.embeddings import make_embedding
 
 logger = logging.getLogger(__name__)
 
@@ -12,30 +12,49 @@ logger = logging.getLogger(__name__)
 class SequentialRetrievalModel(keras.Model):
     """Create the sequential retrieval model.
 
+    Only keras / keras.ops are used, so it runs on any KERAS_BACKEND.
+
     Args:
-      movies_count: Total number of unique movies in the dataset.
+      movies_count: Vocabulary rows minus one; the embedding tables have
+        movies_count + 1 rows (see vocabulary.py).
       embedding_dimension: Output dimension for movie embedding tables.
+      embedding_backend: "full", "hash" or "qr" (see embeddings.py).
+      embedding_buckets: Buckets of the hashed / quotient-remainder tables.
     """
 
     def __init__(
         self,
         movies_count: int,
         embedding_dimension: int = settings.EMBEDDING_DIM,
+        embedding_backend: str = "full",
+        embedding_buckets: int = 0,
         **kwargs,
     ):
         super().__init__(**kwargs)
         self.movies_count = movies_count
         self.embedding_dimension = embedding_dimension
+        self.embedding_backend = embedding_backend
+        self.embedding_buckets = embedding_buckets
+        # Set while test_step traces/runs: evaluation only needs the loss
+        self._evaluating = False
 
         self.query_model = keras.Sequential(
             [
-                keras.layers.Embedding(self.movies_count + 1, self.embedding_dimension),
+                make_embedding(
+                    self.movies_count + 1,
+                    self.embedding_dimension,
+                    embedding_backend,
+                    embedding_buckets,
+                ),
                 keras.layers.GRU(self.embedding_dimension),
             ]
         )
 
-        self.candidate_model = keras.layers.Embedding(
-            self.movies_count + 1, self.embedding_dimension
+        self.candidate_model = make_embedding(
+            self.movies_count + 1,
+            self.embedding_dimension,
+            embedding_backend,
+            embedding_buckets,
         )
 
         self.retrieval = keras_rs.layers.BruteForceRetrieval(k=10, return_scores=False)
@@ -78,7 +97,10 @@ class SequentialRetrievalModel(keras.Model):
             "query_embeddings": query_embeddings,
         }
 
-        if not training:
+        if not training and not self._evaluating:
+            if self.embedding_backend != "full":
+                # Compact tables are materialised from their current weights
+                self.retrieval.candidate_embeddings = self.candidate_model.embeddings
             # Ensure candidate_embeddings are set, which should happen in build()
             if self.retrieval.candidate_embeddings is None:
                 # This case should ideally not be hit if build() worked correctly.
@@ -93,14 +115,23 @@ class SequentialRetrievalModel(keras.Model):
                     )
                     logger.info("Re-assigned candidate_embeddings in call().")
                 else:  # Cannot make predictions if no candidates
-                    result["predictions"] = tf.constant(
-                        [], dtype=tf.int32
+                    result["predictions"] = keras.ops.zeros(
+                        (0,), dtype="int32"
                     )  # Empty predictions
                     return result
 
             result["predictions"] = self.retrieval(query_embeddings)
         return result
 
+    def test_step(self, *args, **kwargs):
+        # Skips the retrieval head, so validation batches in fit() neither
+        # materialise hash/qr tables nor run a brute-force top-k
+        self._evaluating = True
+        try:
+            return super().test_step(*args, **kwargs)
+        finally:
+            self._evaluating = False
+
     def compute_loss(self, x, y, y_pred, sample_weight=None):
         candidate_id = y
         query_embeddings = y_pred["query_embeddings"]
@@ -120,6 +151,8 @@ class SequentialRetrievalModel(keras.Model):
             {
                 "movies_count": self.movies_count,
                 "embedding_dimension": self.embedding_dimension,
+                "embedding_backend": self.embedding_backend,
+                "embedding_buckets": self.embedding_buckets,
             }
         )
         return config
@@ -0,0 +1,235 @@
+"""Two-stage recommendation pipeline: cheap retrieval, then vectorized ranking.
+
+1. Retrieval scores the query embeddings against the whole candidate table and
+   keeps the top RETRIEVAL_CANDIDATES rows (with genre / watched constraints
+   applied inside the scoring, see retrieval.top_k).
+2. Ranking re-scores only those candidates with a pluggable scorer over
+   per-candidate features (embedding similarity, popularity, rating average,
+   recency), as (batch, candidates) arrays.
+
+Each stage is timed against its own latency budget. Timings are kept in a
+rolling window and exposed through get_stats().
+"""
+
+import logging
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.core.config import settings
+from app.services.recommender.retrieval import top_k
+
+logger = logging.getLogger(__name__)
+
+# A scorer maps (batch, candidates) feature arrays to (batch, candidates) scores
+Scorer = Callable[[Dict[str, np.ndarray]], np.ndarray]
+# A retriever has the signature of retrieval.top_k without the candidate table
+# (e.g. sharding.ShardedRetriever); the default searches the local table.
+Retriever = Callable[..., List[List[Tuple[int, float]]]]
+
+
+class ItemFeatureStore:
+    """Per-movie ranking features as dense arrays indexed by embedding row."""
+
+    def __init__(self, num_rows: int):
+        self.num_rows = num_rows
+        self.features: Dict[str, np.ndarray] = {
+            "popularity": np.zeros(num_rows, dtype=np.float32),
+            "rating": np.zeros(num_rows, dtype=np.float32),
+            "recency": np.zeros(num_rows, dtype=np.float32),
+        }
+
+    @classmethod
+    def from_aggregates(
+        cls,
+        num_rows: int,
+        aggregates: Iterable[Tuple[int, int, float, int]],
+        recency_half_life_days: float = settings.RANKING_RECENCY_HALF_LIFE_DAYS,
+    ) -> "ItemFeatureStore":
+        """Builds features from (movie_id, count, avg_rating, last_timestamp) rows."""
+        store = cls(num_rows)
+        rows = np.array(
+            [row for row in aggregates if 0 < row[0] < num_rows], dtype=np.float64
+        ).reshape(-1, 4)
+        if rows.size == 0:
+            return store
+
+        movie_ids = rows[:, 0].astype(np.int64)
+        counts = np.log1p(rows[:, 1])
+        store.features["popularity"][movie_ids] = counts / max(counts.max(), 1e-6)
+        store.features["rating"][movie_ids] = rows[:, 2] / 5.0
+        age_days = (time.time() - rows[:, 3]) / 86400.0
+        store.features["recency"][movie_ids] = np.exp2(
+            -np.maximum(age_days, 0.0) / recency_half_life_days
+        )
+        return store
+
+    def gather(self, rows: np.ndarray) -> Dict[str, np.ndarray]:
+        return {name: values[rows] for name, values in self.features.items()}
+
+
+class LinearScorer:
+    """Weighted sum of features; the default, easily replaced, ranking model."""
+
+    def __init__(self, weights: Dict[str, float]):
+        self.weights = weights
+
+    def __call__(self, features: Dict[str, np.ndarray]) -> np.ndarray:
+        scores = np.zeros_like(features["similarity"])
+        for name, weight in self.weights.items():
+            if name in features and weight:
+                scores += weight * features[name]
+        return scores
+
+
+def parse_weights(spec: str) -> Dict[str, float]:
+    """Parses "similarity=1.0,popularity=0.1" into a weights dict."""
+    weights = {}
+    for item in spec.split(","):
+        if "=" in item:
+            name, value = item.split("=", 1)
+            weights[name.strip()] = float(value)
+    return weights
+
+
+class StageStats:
+    """Rolling latency statistics for one pipeline stage."""
+
+    def __init__(self, budget_ms: float, window: int = 1024):
+        self.budget_ms = budget_ms
+        self.samples: Deque[float] = deque(maxlen=window)
+        self.calls = 0
+        self.over_budget = 0
+
+    def record(self, elapsed_ms: float) -> bool:
+        self.samples.append(elapsed_ms)
+        self.calls += 1
+        over = elapsed_ms > self.budget_ms
+        if over:
+            self.over_budget += 1
+        return over
+
+    def summary(self) -> Dict[str, float]:
+        samples = np.array(self.samples) if self.samples else np.zeros(1)
+        return {
+            "budget_ms": self.budget_ms,
+            "calls": self.calls,
+            "over_budget": self.over_budget,
+            "p50_ms": float(np.percentile(samples, 50)),
+            "p95_ms": float(np.percentile(samples, 95)),
+            "max_ms": float(samples.max()),
+        }
+
+
+class RecommendationPipeline:
+    def __init__(
+        self,
+        candidate_embeddings: np.ndarray,
+        feature_store: ItemFeatureStore,
+        scorer: Optional[Scorer] = None,
+        num_candidates: int = settings.RETRIEVAL_CANDIDATES,
+        retrieval_budget_ms: float = settings.RETRIEVAL_BUDGET_MS,
+        ranking_budget_ms: float = settings.RANKING_BUDGET_MS,
+        retriever: Optional[Retriever] = None,
+    ):
+        self.candidate_embeddings = candidate_embeddings
+        self.retriever = retriever
+        self.feature_store = feature_store
+        self.scorer = scorer or LinearScorer(parse_weights(settings.RANKING_WEIGHTS))
+        self.num_candidates = num_candidates
+        self.stats = {
+            "retrieval": StageStats(retrieval_budget_ms),
+            "ranking": StageStats(ranking_budget_ms),
+        }
+
+    def retrieve(
+        self,
+        query_embeddings: np.ndarray,
+        allowed: Optional[np.ndarray] = None,
+        excluded: Optional[Sequence[Iterable[int]]] = None,
+    ) -> List[List[Tuple[int, float]]]:
+        started = time.perf_counter()
+        if self.retriever is not None:
+            candidates = self.retriever(
+                query_embeddings,
+                self.num_candidates,
+                allowed=allowed,
+                excluded=excluded,
+            )
+        else:
+            candidates = top_k(
+                query_embeddings,
+                self.candidate_embeddings,
+                self.num_candidates,
+                allowed=allowed,
+                excluded=excluded,
+            )
+        elapsed_ms = 1000.0 * (time.perf_counter() - started)
+        if self.stats["retrieval"].record(elapsed_ms):
+            logger.warning(
+                f"Retrieval stage took {elapsed_ms:.1f} ms for {len(candidates)} "
+                f"queries (budget {self.stats['retrieval'].budget_ms} ms)."
+            )
+        return candidates
+
+    def rank(
+        self, candidates: List[List[Tuple[int, float]]], k: int
+    ) -> List[List[Tuple[int, float]]]:
+        started = time.perf_counter()
+        batch_size = len(candidates)
+        width = max((len(row) for row in candidates), default=0)
+        if width == 0:
+            return [[] for _ in candidates]
+
+        rows = np.zeros((batch_size, width), dtype=np.int64)
+        similarity = np.zeros((batch_size, width), dtype=np.float32)
+        valid = np.zeros((batch_size, width), dtype=bool)
+        for query_index, query_candidates in enumerate(candidates):
+            count = len(query_candidates)
+            if count:
+                rows[query_index, :count] = [row for row, _ in query_candidates]
+                similarity[query_index, :count] = [s for _, s in query_candidates]
+                valid[query_index, :count] = True
+
+        # Standardise similarity per query so scorer weights are scale-free
+        masked = np.where(valid, similarity, np.nan)
+        mean = np.nanmean(masked, axis=1, keepdims=True)
+        std = np.nanstd(masked, axis=1, keepdims=True)
+        features = self.feature_store.gather(rows)
+        features["similarity"] = np.nan_to_num((similarity - mean) / (std + 1e-6))
+
+        scores = self.scorer(features).astype(np.float32)
+        scores[~valid] = -np.inf
+        order = np.argsort(-scores, axis=1)[:, :k]
+        ranked = [
+            [
+                (int(rows[query_index, col]), float(scores[query_index, col]))
+                for col in order[query_index]
+                if valid[query_index, col]
+            ]
+            for query_index in range(batch_size)
+        ]
+
+        elapsed_ms = 1000.0 * (time.perf_counter() - started)
+        if self.stats["ranking"].record(elapsed_ms):
+            logger.warning(
+                f"Ranking stage took {elapsed_ms:.1f} ms for {batch_size}x{width} "
+                f"candidates (budget {self.stats['ranking'].budget_ms} ms)."
+            )
+        return ranked
+
+    def recommend(
+        self,
+        query_embeddings: np.ndarray,
+        k: int,
+        allowed: Optional[np.ndarray] = None,
+        excluded: Optional[Sequence[Iterable[int]]] = None,
+    ) -> List[List[Tuple[int, float]]]:
+        """Top-k (row, score) per query after retrieval and ranking."""
+        candidates = self.retrieve(query_embeddings, allowed=allowed, excluded=excluded)
+        return self.rank(candidates, k)
+
+    def get_stats(self) -> Dict[str, Dict[str, float]]:
+        return {name: stage.summary() for name, stage in self.stats.items()}
@@ -1,120 +1,457 @@
+import asyncio
 import logging
 import os
+import time
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
 
-import keras
 import numpy as np
-import tensorflow as tf
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.config import settings
 from app.db import crud, models
-from app.services.recommender.model import SequentialRetrievalModel
+from app.db.session import AsyncSessionLocal
+from app.services.recommender.artifacts import artifact_path, load_versioned_npz
+from app.services.recommender.pipeline import ItemFeatureStore, RecommendationPipeline
 from app.services.recommender.preprocessing import prepare_user_context_for_prediction
+from app.services.recommender.retrieval import (
+    allowed_rows,
+    build_genre_masks,
+    known_rows,
+)
+from app.services.recommender.similarity import NEIGHBOURS_ARTIFACT
+from app.services.recommender.vocabulary import IdentityVocabulary, MovieVocabulary
+from app.services.recommender.warmup import BucketedQueryFunction
+
+# Keras/TensorFlow are imported on first model load (in a worker thread), so
+# importing this module - and the API that depends on it - stays cheap.
+if TYPE_CHECKING:
+    from app.services.recommender.model import SequentialRetrievalModel
+    from app.services.recommender.sharding import ShardedRetriever
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-_model: Optional[SequentialRetrievalModel] = None
-_movie_id_to_details: Optional[Dict[int, Dict[str, Any]]] = (
-    None  # Keyed by internal Movie.id
-)
-_movies_count_at_load: Optional[int] = None  # Max internal Movie.id model was built for
-_loaded_model_timestamp: Optional[float] = None
 
+class ServingState:
+    """Everything needed to serve one model version, swapped in as a whole.
 
-async def load_model_and_mappings(db: AsyncSession, force_reload: bool = False):
-    global _model, _movie_id_to_details, _movies_count_at_load, _loaded_model_timestamp
+    A new state is fully built and warmed up before it replaces the current
+    one, so requests always see a consistent model, mappings and pipeline.
+    """
 
-    model_path_obj = Path(settings.MODEL_PATH)
-    if not model_path_obj.exists():
-        logger.warning(
-            f"Model file not found at {settings.MODEL_PATH}. Prediction not available."
-        )
-        _model = None
-        _movie_id_to_details = None
-        _movies_count_at_load = None
-        _loaded_model_timestamp = None
-        return
+    def __init__(
+        self,
+        model: Optional["SequentialRetrievalModel"],  # None in segment mode
+        model_timestamp: float,
+        movies_count: int,  # Embedding rows - 1 the model was built for
+        vocabulary: MovieVocabulary,  # Internal Movie.id <-> embedding row
+        movie_details: Any,  # Keyed by internal Movie.id (dict or SegmentCatalog)
+        known_rows: np.ndarray,
+        genre_masks: Dict[str, np.ndarray],
+        pipeline: RecommendationPipeline,
+        query_function: "BucketedQueryFunction",
+    ):
+        self.model = model
+        self.model_timestamp = model_timestamp
+        self.movies_count = movies_count
+        self.vocabulary = vocabulary
+        self.movie_details = movie_details
+        self.known_rows = known_rows
+        self.genre_masks = genre_masks
+        self.pipeline = pipeline
+        self.query_function = query_function
+        self.warmup_report: Dict[str, Any] = {}
+        # Precomputed item neighbours (indexed by and holding embedding rows),
+        # as (rows, scores); None until the artifact for this model version exists
+        self.neighbours: Optional[Tuple[np.ndarray, np.ndarray]] = None
 
-    current_model_timestamp = model_path_obj.stat().st_mtime
-    needs_load = (
-        force_reload
-        or _model is None
-        or (
-            _loaded_model_timestamp is not None
-            and current_model_timestamp > _loaded_model_timestamp
-        )
-        or _movie_id_to_details is None
-    )
 
-    if not needs_load:
+_state: Optional[ServingState] = None
+_load_lock = asyncio.Lock()
+_reload_task: Optional[asyncio.Task] = None
+_initial_load_done = False
+# Version (mtime) of a model source that failed to load; not retried until it changes
+_failed_timestamp: Optional[float] = None
+
+
+def _load_neighbours(state: ServingState, model_path_obj: Path) -> None:
+    version = str(model_path_obj.stat().st_mtime_ns)
+    artifact = load_versioned_npz(artifact_path(NEIGHBOURS_ARTIFACT), version)
+    if artifact is None:
+        logger.warning("No neighbour artifact for the loaded model. /similar disabled.")
         return
+    state.neighbours = (artifact["neighbour_ids"], artifact["neighbour_scores"])
+    logger.info(f"Loaded neighbour matrix {artifact['neighbour_ids'].shape}.")
 
-    logger.info(
-        f"Reloading model/mappings (Reason: force={force_reload}, model_none={_model is None}, ts_change={_loaded_model_timestamp is None or current_model_timestamp > _loaded_model_timestamp}, details_none={_movie_id_to_details is None})."
+
+def _load_keras_model() -> Tuple["SequentialRetrievalModel", np.ndarray]:
+    """Loads and builds the model; returns it with its candidate embedding table."""
+    import keras
+
+    from app.services.recommender.model import SequentialRetrievalModel
+
+    model = keras.models.load_model(
+        settings.MODEL_PATH,
+        custom_objects={"SequentialRetrievalModel": SequentialRetrievalModel},
     )
-    _model = None
-    _movie_id_to_details = None
-    _movies_count_at_load = None
-    _loaded_model_timestamp = None
+    if getattr(model, "movies_count", 1) > 0:
+        model(
+            np.zeros((1, settings.MAX_CONTEXT_LENGTH), dtype=np.int32),
+            training=False,
+        )  # Build call
+    return model, keras.ops.convert_to_numpy(model.candidate_model.embeddings)
 
+
+async def _build_state(
+    db: AsyncSession, model_path_obj: Path
+) -> Optional[ServingState]:
+    """Loads the Keras model and mappings from the model file and database."""
+    model_timestamp = model_path_obj.stat().st_mtime
     try:
-        _model = keras.models.load_model(
-            settings.MODEL_PATH,
-            custom_objects={"SequentialRetrievalModel": SequentialRetrievalModel},
-        )
+        model, candidate_embeddings = await asyncio.to_thread(_load_keras_model)
         if hasattr(
-            _model, "movies_count"
+            model, "movies_count"
         ):  # movies_count is max internal ID model was trained with
-            _movies_count_at_load = _model.movies_count
+            movies_count = model.movies_count
         else:  # Fallback if model config doesn't store it
             max_id_db = await crud.movie.get_max_internal_movie_id(db)
-            _movies_count_at_load = int(max_id_db) if max_id_db else 0
+            movies_count = int(max_id_db) if max_id_db else 0
+        logger.info(f"Model loaded. Expects movies_count (rows - 1): {movies_count}")
+    except Exception as e:
+        logger.error(f"Error loading model: {e}", exc_info=True)
+        return None
+
+    # Training writes the vocabulary before moving the model file in place, so
+    # a model without one predates the vocabulary: its rows are Movie.ids
+    vocabulary = MovieVocabulary.load(str(model_path_obj.stat().st_mtime_ns))
+    num_rows = candidate_embeddings.shape[0]
+    if vocabulary is None and num_rows == movies_count + 1:
+        logger.info("No vocabulary for the model file; using Movie.id as row.")
+        vocabulary = IdentityVocabulary(movies_count)
+    if vocabulary is None or len(vocabulary) != num_rows:
+        logger.error(
+            f"Vocabulary does not match the model's {num_rows} embedding rows."
+        )
+        return None
+
+    logger.info("Fetching movie details for cache (keyed by internal Movie.id)...")
+    all_movies_db = await crud.movie.get_catalog(db)
+    if not all_movies_db:
+        logger.error("No movies from DB for cache!")
+        return None
+
+    movie_details = {
+        movie.id: {  # Key by internal Movie.id
+            "internal_id": movie.id,
+            "movie_lens_id": movie.movie_lens_id,
+            "title": movie.title,
+            "resource_url": movie.resource_url,
+            "genres": movie.genres,
+        }
+        for movie in all_movies_db
+    }
+    logger.info(f"Loaded details for {len(movie_details)} movies into cache.")
+
+    row_genres = dict(
+        vocabulary.rekey(
+            (movie_id, details.get("genres"))
+            for movie_id, details in movie_details.items()
+        )
+    )
+    genre_masks = build_genre_masks(row_genres, num_rows)
+    logger.info(f"Built retrieval masks for {len(genre_masks)} genres.")
+    feature_store = ItemFeatureStore.from_aggregates(
+        num_rows, vocabulary.rekey(await crud.rating.get_item_aggregates(db))
+    )
+
+    if settings.RETRIEVAL_SHARD_ADDRESSES:
+        # Shards serve published segments, which a keras-mode model may not match
+        logger.warning("RETRIEVAL_SHARD_ADDRESSES needs SERVING_MODE=segment; ignored.")
+    state = ServingState(
+        model=model,
+        model_timestamp=model_timestamp,
+        movies_count=movies_count,
+        vocabulary=vocabulary,
+        movie_details=movie_details,
+        known_rows=known_rows(row_genres.keys(), num_rows, vocabulary.first_row),
+        genre_masks=genre_masks,
+        pipeline=RecommendationPipeline(candidate_embeddings, feature_store),
+        query_function=BucketedQueryFunction(model.query_model),
+    )
+    _load_neighbours(state, model_path_obj)
+    return state
+
+
+def _shard_retriever(num_rows: int, version: str) -> Optional["ShardedRetriever"]:
+    """Scatter-gather retrieval when RETRIEVAL_SHARD_ADDRESSES is configured.
+
+    Only for segment mode: shards search the published segment of `version`.
+    """
+    if not settings.RETRIEVAL_SHARD_ADDRESSES:
+        return None
+    from app.services.recommender.sharding import ShardedRetriever, parse_addresses
+
+    addresses = parse_addresses(settings.RETRIEVAL_SHARD_ADDRESSES)
+    try:
+        retriever = ShardedRetriever(addresses, num_rows, version=version)
+    except ValueError as e:
+        logger.error(f"{e} Retrieving candidates in-process.")
+        return None
+    logger.info(f"Retrieving candidates from {len(addresses)} shards ({version}).")
+    return retriever
+
+
+def _open_segment_state() -> Optional[ServingState]:
+    """Attaches to the registry's CURRENT segment; all arrays stay memory-mapped."""
+    from app.services.recommender.registry import CURRENT_POINTER, open_current_segment
+
+    model_timestamp = CURRENT_POINTER.stat().st_mtime
+    segment = open_current_segment()
+    if segment is None:
+        logger.warning("No serving segment published. Prediction not available.")
+        return None
+
+    candidate_embeddings = segment.candidate_table()
+    num_rows = candidate_embeddings.shape[0]
+    feature_store = ItemFeatureStore.from_aggregates(
+        num_rows, segment.item_aggregates()
+    )
+    state = ServingState(
+        model=None,
+        model_timestamp=model_timestamp,
+        movies_count=segment.meta["movies_count"],
+        vocabulary=segment.vocabulary(),
+        movie_details=segment.catalog(),
+        known_rows=segment.arrays["known_rows"],
+        genre_masks=segment.genre_masks(),
+        pipeline=RecommendationPipeline(
+            candidate_embeddings,
+            feature_store,
+            retriever=_shard_retriever(num_rows, segment.version),
+        ),
+        query_function=BucketedQueryFunction(segment.query_model()),
+    )
+    state.neighbours = segment.neighbours()
+    logger.info(
+        f"Attached to serving segment {segment.path} "
+        f"({segment.meta.get('embedding_dtype', 'float32')} embeddings)."
+    )
+    return state
+
+
+def _source_path() -> Path:
+    """File whose change means a new model: the model file or the CURRENT pointer."""
+    if settings.SERVING_MODE == "segment":
+        from app.services.recommender.registry import CURRENT_POINTER
+
+        return CURRENT_POINTER
+    return Path(settings.MODEL_PATH)
+
+
+def _is_stale(source_path: Path) -> bool:
+    timestamp = source_path.stat().st_mtime
+    if timestamp == _failed_timestamp:
+        return False
+    state = _state
+    return state is None or timestamp > state.model_timestamp
+
+
+def _load_failed(source_path: Path) -> bool:
+    return source_path.exists() and source_path.stat().st_mtime == _failed_timestamp
+
+
+async def load_model_and_mappings(db: AsyncSession, force_reload: bool = False):
+    """Builds, warms up and swaps in a serving state if the model is new or changed.
+
+    The current state keeps serving until the new one is ready. Concurrent
+    calls while a load is running return immediately, except force_reload,
+    which waits for that load and then reloads. A model source that
+    fails to load is not retried until it changes (or force_reload).
+    """
+    global _state, _failed_timestamp
+
+    source_path = _source_path()
+    if not source_path.exists():
+        logger.warning(
+            f"Model file not found at {source_path}. Prediction not available."
+        )
+        _state = None
+        return
+
+    if not force_reload and not _is_stale(source_path):
+        # The neighbour artifact is written just after the model file, so a
+        # load may have happened before it existed; pick it up when it lands.
+        state = _state
+        if (
+            state.model is not None
+            and state.neighbours is None
+            and artifact_path(NEIGHBOURS_ARTIFACT).exists()
+        ):
+            _load_neighbours(state, source_path)
+        return
+
+    if _load_lock.locked() and not force_reload:
+        return
+    async with _load_lock:
         logger.info(
-            f"Model loaded. Expects movies_count (max internal_id): {_movies_count_at_load}"
+            f"Loading model/mappings (force={force_reload}, "
+            f"current_version={_state.model_timestamp if _state else None})."
+        )
+        started = time.perf_counter()
+        source_timestamp = source_path.stat().st_mtime
+        if settings.SERVING_MODE == "segment":
+            new_state = await asyncio.to_thread(_open_segment_state)
+        else:
+            new_state = await _build_state(db, source_path)
+        if new_state is None:
+            _failed_timestamp = source_timestamp
+            return
+        try:
+            new_state.warmup_report = await asyncio.to_thread(
+                new_state.query_function.warm_up
+            )
+        except Exception as e:
+            logger.error(f"Error warming up the query function: {e}", exc_info=True)
+            _failed_timestamp = source_timestamp
+            return
+        _state = new_state
+        _failed_timestamp = None
+        logger.info(
+            f"Swapped in model from {source_path} "
+            f"in {time.perf_counter() - started:.1f}s."
         )
 
-        if _movies_count_at_load and _movies_count_at_load > 0:
-            _model(
-                tf.zeros((1, settings.MAX_CONTEXT_LENGTH), dtype=tf.int32),
-                training=False,
-            )  # Build call
-        _loaded_model_timestamp = current_model_timestamp
-        logger.info("Model loaded successfully.")
+
+async def _reload_in_background() -> None:
+    try:
+        async with AsyncSessionLocal() as db:
+            await load_model_and_mappings(db)
     except Exception as e:
-        logger.error(f"Error loading model: {e}", exc_info=True)
-        _model = None
+        logger.error(f"Background model reload failed: {e}", exc_info=True)
+
+
+def refresh_model_in_background() -> None:
+    """Schedules a reload when the model file changed; never blocks a request."""
+    global _reload_task
+    source_path = _source_path()
+    if not source_path.exists():
         return
+    if _reload_task is not None and not _reload_task.done():
+        return
+    state = _state
+    neighbours_pending = (
+        state is not None
+        and state.model is not None
+        and state.neighbours is None
+        and artifact_path(NEIGHBOURS_ARTIFACT).exists()
+    )
+    if _is_stale(source_path) or neighbours_pending:
+        _reload_task = asyncio.create_task(_reload_in_background())
 
-    if _movie_id_to_details is None and _model is not None:
-        logger.info("Fetching movie details for cache (keyed by internal Movie.id)...")
-        all_movies_db = await crud.movie.get_multi(
-            db, limit=10000
-        )  # Fetches all movies
-        if not all_movies_db:
-            logger.error("No movies from DB for cache!")
-            _movie_id_to_details = {}
-            return
 
-        _movie_id_to_details = {
-            movie.id: {  # Key by internal Movie.id
-                "internal_id": movie.id,
-                "movie_lens_id": movie.movie_lens_id,
-                "title": movie.title,
-                "resource_url": movie.resource_url,
-                "genres": movie.genres,
-            }
-            for movie in all_movies_db
-        }
-        _movie_id_to_details[0] = {
-            "title": "Padding Token",
-            "internal_id": 0,
-        }  # Model padding token
-        logger.info(
-            f"Loaded details for {len(_movie_id_to_details)-1} movies into cache."
+async def preload_model() -> None:
+    """Start-up load and warm-up; readiness turns green once this has finished."""
+    global _initial_load_done
+    try:
+        async with AsyncSessionLocal() as db:
+            await load_model_and_mappings(db)
+    except Exception as e:
+        logger.error(f"Error during startup model preloading: {e}", exc_info=True)
+    finally:
+        _initial_load_done = True
+
+
+def get_readiness() -> Dict[str, Any]:
+    state = _state
+    source_path = _source_path()
+    load_failed = _load_failed(source_path)
+    # Without a usable model there is nothing to warm up; fallbacks serve
+    usable = state is not None or load_failed or not source_path.exists()
+    return {
+        "ready": _initial_load_done and usable,
+        "serving_mode": settings.SERVING_MODE,
+        "model_loaded": state is not None,
+        "model_load_failed": load_failed,
+        "model_timestamp": state.model_timestamp if state else None,
+        "loading": _load_lock.locked(),
+        "warmup": state.warmup_report if state else None,
+    }
+
+
+def _movie_summary(state: ServingState, internal_movie_id: int) -> Dict[str, Any]:
+    movie_detail_info = state.movie_details[internal_movie_id]
+    return {
+        "movie_id": internal_movie_id,  # This is the internal ID
+        "movie_lens_id": movie_detail_info.get(
+            "movie_lens_id"
+        ),  # Original ML ID if present
+        "title": movie_detail_info.get("title"),
+        "resource_url": movie_detail_info.get("resource_url"),
+        "genres": movie_detail_info.get("genres"),
+    }
+
+
+def is_model_ready() -> bool:
+    return _state is not None
+
+
+def recommend_for_histories(
+    histories: Dict[int, List[int]],
+    exclude_watched: bool = True,
+    num_recommendations: int = 10,
+    genres: Optional[List[str]] = None,
+) -> Dict[int, List[Dict[str, Any]]]:
+    """Recommendations for many users in one forward pass and one pipeline call.
+
+    `histories` maps user id -> internal movie ids, oldest first. Users with an
+    empty history get an empty list. Serves whatever state is loaded and does
+    no I/O, so it can run in a worker thread.
+    """
+    results: Dict[int, List[Dict[str, Any]]] = {user_id: [] for user_id in histories}
+    state = _state  # One consistent snapshot, even if a swap happens meanwhile
+    if state is None:
+        logger.warning("Model/mappings not loaded. Cannot recommend.")
+        return results
+
+    user_ids = [user_id for user_id, history in histories.items() if history]
+    if not user_ids:
+        return results
+    # Movie ids -> embedding rows; movies outside the vocabulary become OOV
+    history_rows = {
+        uid: state.vocabulary.lookup(histories[uid]).tolist() for uid in user_ids
+    }
+    context = np.array(
+        [prepare_user_context_for_prediction(history_rows[uid]) for uid in user_ids],
+        dtype=np.int32,
+    )
+
+    try:
+        query_embeddings = state.query_function(context)
+    except Exception as e:
+        logger.error(f"Prediction error: {e}", exc_info=True)
+        return results
+
+    # Genre and watched-movie constraints are applied inside the retrieval scoring,
+    # so the result is filled up to num_recommendations whenever possible.
+    excluded = [history_rows[uid] for uid in user_ids] if exclude_watched else None
+    try:
+        ranked = state.pipeline.recommend(
+            query_embeddings,
+            num_recommendations,
+            allowed=allowed_rows(state.genre_masks, state.known_rows, genres or ()),
+            excluded=excluded,
         )
+    except Exception as e:
+        # e.g. an unreachable retrieval shard; callers fall back to trending
+        logger.error(f"Retrieval error: {e}", exc_info=True)
+        return results
+    for user_id, user_ranked in zip(user_ids, ranked):
+        results[user_id] = [
+            _movie_summary(state, state.vocabulary.movie_id(row))
+            for row, _ in user_ranked
+        ]
+    return results
 
 
 async def get_recommendations_for_user(
@@ -122,9 +459,10 @@ async def get_recommendations_for_user(
     user: models.User,
     exclude_watched: bool = True,
     num_recommendations: int = 10,
+    genres: Optional[List[str]] = None,
 ) -> List[Dict[str, Any]]:
-    await load_model_and_mappings(db)
-    if not _model or not _movie_id_to_details or _movies_count_at_load is None:
+    refresh_model_in_background()
+    if not is_model_ready():
         logger.warning("Model/mappings not loaded. Cannot recommend.")
         return []
 
@@ -138,47 +476,53 @@ async def get_recommendations_for_user(
         logger.info(f"User {user.id} has no history.")
         return []
 
-    prediction_context_ids = prepare_user_context_for_prediction(user_movie_ids_history)
-    context_tensor = tf.constant([prediction_context_ids], dtype=tf.int32)
+    return recommend_for_histories(
+        {user.id: user_movie_ids_history},
+        exclude_watched=exclude_watched,
+        num_recommendations=num_recommendations,
+        genres=genres,
+    )[user.id]
 
-    try:
-        model_output = _model(context_tensor, training=False)
-        predicted_internal_movie_ids = model_output["predictions"]
-        predicted_internal_movie_ids = (
-            predicted_internal_movie_ids.numpy()[0]
-            if hasattr(predicted_internal_movie_ids, "numpy")
-            else list(predicted_internal_movie_ids[0])
-        )
-    except Exception as e:
-        logger.error(f"Prediction error: {e}", exc_info=True)
+
+async def get_similar_movies(
+    db: AsyncSession, movie_id: int, count: int = 10
+) -> Optional[List[Dict[str, Any]]]:
+    """Nearest movies by candidate embedding, from the precomputed neighbour matrix.
+
+    Returns None when no neighbour artifact is loaded for the current model.
+    """
+    refresh_model_in_background()
+    state = _state
+    if state is None or state.neighbours is None:
+        return None
+    neighbour_rows, neighbour_scores = state.neighbours
+    row = state.vocabulary.row(movie_id)
+    if row is None or row >= neighbour_rows.shape[0]:
         return []
 
-    recommendations = []
-    watched_internal_ids_set = set(user_movie_ids_history)
-    for internal_movie_id_int in predicted_internal_movie_ids:
-        internal_movie_id = int(internal_movie_id_int)
-        if internal_movie_id == 0:
+    similar = []
+    for neighbour_row, score in zip(neighbour_rows[row], neighbour_scores[row]):
+        neighbour_id = state.vocabulary.movie_id(int(neighbour_row))
+        if neighbour_id is None:
             continue
-        if exclude_watched and internal_movie_id in watched_internal_ids_set:
+        movie_detail_info = state.movie_details.get(neighbour_id)
+        if not movie_detail_info:
             continue
-
-        movie_detail_info = _movie_id_to_details.get(internal_movie_id)
-        if movie_detail_info:
-            recommendations.append(
-                {
-                    "movie_id": internal_movie_id,  # This is the internal ID
-                    "movie_lens_id": movie_detail_info.get(
-                        "movie_lens_id"
-                    ),  # Original ML ID if present
-                    "title": movie_detail_info.get("title"),
-                    "resource_url": movie_detail_info.get("resource_url"),
-                    "genres": movie_detail_info.get("genres"),
-                }
-            )
-        else:
-            logger.warning(
-                f"Internal Movie ID {internal_movie_id} predicted but not found in details map. Max internal ID at load: {_movies_count_at_load}"
-            )
-        if len(recommendations) >= num_recommendations:
+        similar.append(
+            {
+                "movie_id": neighbour_id,
+                "movie_lens_id": movie_detail_info.get("movie_lens_id"),
+                "title": movie_detail_info.get("title"),
+                "resource_url": movie_detail_info.get("resource_url"),
+                "genres": movie_detail_info.get("genres"),
+                "score": float(score),
+            }
+        )
+        if len(similar) >= count:
             break
-    return recommendations
+    return similar
+
+
+def get_pipeline_stats() -> Optional[Dict[str, Dict[str, float]]]:
+    state = _state
+    return state.pipeline.get_stats() if state is not None else None
@@ -1,129 +1,180 @@
-import collections
-from typing import Any, Dict, List
+import logging
+import multiprocessing
+import os
+import tempfile
+from pathlib import Path
+from typing import List, Optional, Tuple
 
-import pandas as pd
-import tensorflow as tf
+import numpy as np
 
 from app.core.config import settings
+from app.services.recommender.vocabulary import OOV_ROW, MovieVocabulary
 
 MAX_CONTEXT_LENGTH = settings.MAX_CONTEXT_LENGTH
 MIN_SEQUENCE_LENGTH = settings.MIN_SEQUENCE_LENGTH
 MIN_RATING_FILTER = 2
+# More shards than workers evens out users with very long histories
+SHARDS_PER_WORKER = 4
+_RATING_COLUMNS = ("users", "movies", "timestamps")
+_EXAMPLE_COLUMNS = ("example_users", "contexts", "labels")
 
+logger = logging.getLogger(__name__)
 
-def get_movie_sequence_per_user(
-    ratings_df: pd.DataFrame,
-) -> Dict[int, List[Dict[str, Any]]]:
-    """Get movieID sequences for every user from a DataFrame of ratings."""
-    sequences = collections.defaultdict(list)
-
-    # ratings_df has columns: 'user_id', 'movie_id', 'rating', 'timestamp'
-    # These column names should match what crud.rating.get_all_ratings_for_training provides
-    for _, row in ratings_df.iterrows():
-        user_id = int(row["user_id"])
-        sequences[user_id].append(
-            {
-                "movie_id": int(row["movie_id"]),
-                "timestamp": int(row["timestamp"]),
-                "rating": float(row["rating"]),
-            }
+
+def generate_examples(
+    users: np.ndarray, movies: np.ndarray, timestamps: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Next-movie examples from columns of ratings, vectorised.
+
+    Every user's ratings are ordered by timestamp (ties keep their input
+    order). Users with fewer than MIN_SEQUENCE_LENGTH ratings are skipped.
+    Each rating after a user's first one is a label; its context is the up to
+    MAX_CONTEXT_LENGTH movies before it, oldest first, padded with 0 at the
+    end. Returns (example users, contexts int32 [n, MAX_CONTEXT_LENGTH],
+    labels int32), all in the movie ids given.
+    """
+    if len(users) == 0:
+        return (
+            np.zeros(0, dtype=np.int32),
+            np.zeros((0, MAX_CONTEXT_LENGTH), dtype=np.int32),
+            np.zeros(0, dtype=np.int32),
         )
+    # lexsort is stable: equal timestamps keep their input order
+    order = np.lexsort((timestamps, users))
+    users, movies = users[order], movies[order]
+    num_rows = len(users)
+
+    starts = np.flatnonzero(np.r_[True, users[1:] != users[:-1]])
+    lengths = np.diff(np.r_[starts, num_rows])
+    user_start = np.repeat(starts, lengths)
+    user_length = np.repeat(lengths, lengths)
+
+    positions = np.arange(num_rows)
+    label_positions = positions[
+        (positions > user_start) & (user_length >= MIN_SEQUENCE_LENGTH)
+    ]
+    context_start = np.maximum(
+        user_start[label_positions], label_positions - MAX_CONTEXT_LENGTH
+    )
+    index = context_start[:, None] + np.arange(MAX_CONTEXT_LENGTH)
+    contexts = np.where(
+        index < label_positions[:, None], movies[np.minimum(index, num_rows - 1)], 0
+    )
+    return (
+        users[label_positions].astype(np.int32),
+        contexts.astype(np.int32),
+        movies[label_positions].astype(np.int32),
+    )
 
-    # Sort movie sequences by timestamp for every user.
-    for user_id, context in sequences.items():
-        context.sort(key=lambda x: x["timestamp"])
-        sequences[user_id] = context
-    return sequences
-
-
-def generate_examples_from_user_sequences(
-    sequences: Dict[int, List[Dict[str, Any]]],
-) -> List[Dict[str, Any]]:
-    """Generates sequences for all users, with padding, truncation, etc."""
-
-    def generate_examples_from_user_sequence(
-        sequence: List[Dict[str, Any]],
-    ) -> List[Dict[str, Any]]:
-        """Generates examples for a single user sequence."""
-        examples = []
-        for label_idx in range(
-            1, len(sequence)
-        ):  # Start from 1, as first item cannot be a label
-            # Determine the start of the context sequence
-            start_idx = max(0, label_idx - MAX_CONTEXT_LENGTH)
-            context = sequence[
-                start_idx:label_idx
-            ]  # History up to, but not including, the label
-
-            # Pad context to MAX_CONTEXT_LENGTH
-            # Padded items get movie_id = 0 (mask token)
-            padded_context = [
-                {"movie_id": 0, "timestamp": 0, "rating": 0.0}
-            ] * MAX_CONTEXT_LENGTH
-
-            # Create a copy for modification
-            current_context_list = list(context)
-
-            # Padding
-            while len(current_context_list) < MAX_CONTEXT_LENGTH:
-                current_context_list.append(
-                    {
-                        "movie_id": 0,
-                        "timestamp": 0,
-                        "rating": 0.0,
-                    }
-                )
-
-            label_movie_id = int(sequence[label_idx]["movie_id"])
-            context_movie_ids = [
-                int(movie["movie_id"]) for movie in current_context_list
-            ]
-
-            examples.append(
-                {
-                    "context_movie_id": context_movie_ids,
-                    "label_movie_id": label_movie_id,
-                },
+
+def generate_examples_parallel(
+    users: np.ndarray,
+    movies: np.ndarray,
+    timestamps: np.ndarray,
+    workers: int = settings.PREPROCESSING_WORKERS,
+    scratch_dir: Optional[Path] = None,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """generate_examples sharded by user over a process pool.
+
+    The rating columns are written once as .npy files in a scratch directory
+    and memory-mapped by the workers, so no large array is pickled. Shard s
+    holds the users with user % num_shards == s; each worker writes its
+    examples as per-shard .npy files, which are then copied into the result.
+    Examples come out grouped by shard instead of sorted by user.
+
+    Below PREPROCESSING_PARALLEL_MIN_RATINGS ratings, or with one worker, the
+    pool isn't worth starting and generate_examples runs in-process.
+    """
+    workers = workers or os.cpu_count() or 1
+    if workers <= 1 or len(users) < settings.PREPROCESSING_PARALLEL_MIN_RATINGS:
+        return generate_examples(users, movies, timestamps)
+
+    num_shards = workers * SHARDS_PER_WORKER
+    if scratch_dir is not None:
+        scratch_dir.mkdir(parents=True, exist_ok=True)
+    with tempfile.TemporaryDirectory(prefix=".examples-", dir=scratch_dir) as tmp:
+        directory = Path(tmp)
+        for name, column in zip(_RATING_COLUMNS, (users, movies, timestamps)):
+            np.save(directory / f"{name}.npy", column)
+        # spawn: the training worker has TensorFlow loaded, which isn't fork-safe
+        context = multiprocessing.get_context("spawn")
+        with context.Pool(workers) as pool:
+            counts = pool.map(
+                _generate_shard,
+                [(str(directory), shard, num_shards) for shard in range(num_shards)],
             )
-        return examples
+        logger.info(
+            f"Generated {sum(counts)} examples in {num_shards} shards "
+            f"with {workers} processes."
+        )
+        return _concatenate_shards(directory, counts)
 
-    all_examples = []
-    for user_id, sequence in sequences.items():
-        if (
-            len(sequence) < MIN_SEQUENCE_LENGTH
-        ):  # User needs at least this many interactions
-            continue
 
-        user_examples = generate_examples_from_user_sequence(sequence)
-        all_examples.extend(user_examples)
+def _shard_path(directory: Path, shard: int, column: str) -> Path:
+    return directory / f"shard-{shard:04d}.{column}.npy"
 
-    return all_examples
 
+def _generate_shard(task: Tuple[str, int, int]) -> int:
+    """Pool worker: examples of one user shard, written to the scratch directory."""
+    directory, shard, num_shards = task
+    directory = Path(directory)
+    users, movies, timestamps = (
+        np.load(directory / f"{name}.npy", mmap_mode="r") for name in _RATING_COLUMNS
+    )
+    mine = np.flatnonzero(users % num_shards == shard)
+    examples = generate_examples(users[mine], movies[mine], timestamps[mine])
+    for column, values in zip(_EXAMPLE_COLUMNS, examples):
+        np.save(_shard_path(directory, shard, column), values)
+    return len(examples[2])
+
+
+def _concatenate_shards(
+    directory: Path, counts: List[int]
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    total = sum(counts)
+    example_users = np.empty(total, dtype=np.int32)
+    contexts = np.empty((total, MAX_CONTEXT_LENGTH), dtype=np.int32)
+    labels = np.empty(total, dtype=np.int32)
+    start = 0
+    for shard, count in enumerate(counts):
+        for column, out in zip(_EXAMPLE_COLUMNS, (example_users, contexts, labels)):
+            out[start : start + count] = np.load(
+                _shard_path(directory, shard, column), mmap_mode="r"
+            )
+        start += count
+    return example_users, contexts, labels
 
-def create_tf_datasets(
-    examples: List[Dict[str, Any]], batch_size: int, is_training: bool = True
-):
-    """Converts list of examples to a tf.data.Dataset."""
 
-    dataset_dict = collections.defaultdict(list)
-    for example in examples:
-        dataset_dict["context_movie_id"].append(example["context_movie_id"])
-        dataset_dict["label_movie_id"].append(example["label_movie_id"])
+def encode_examples(
+    vocabulary: MovieVocabulary, contexts: np.ndarray, labels: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Maps example movie ids to vocabulary rows.
+
+    Padding (0) maps to the padding row. Out-of-vocabulary movies stay in the
+    contexts but are never labels, so those examples are dropped.
+    """
+    label_rows = vocabulary.lookup(labels)
+    keep = label_rows != OOV_ROW
+    return vocabulary.lookup(contexts[keep]), label_rows[keep]
 
-    # Convert to TensorFlow tensors
-    context_movie_id_tf = tf.constant(dataset_dict["context_movie_id"], dtype=tf.int32)
-    label_movie_id_tf = tf.constant(dataset_dict["label_movie_id"], dtype=tf.int32)
+
+def create_tf_datasets(
+    contexts: np.ndarray, labels: np.ndarray, batch_size: int, is_training: bool = True
+):
+    """Converts context / label arrays (see encode_examples) to a tf.data.Dataset."""
+    import tensorflow as tf
 
     # Create tf.data.Dataset
     # The model's fit method expects (features, labels)
-    # features = context_movie_id_tf
-    # labels = label_movie_id_tf
     dataset = tf.data.Dataset.from_tensor_slices(
-        (context_movie_id_tf, label_movie_id_tf)
+        (
+            tf.constant(contexts, dtype=tf.int32),
+            tf.constant(labels, dtype=tf.int32),
+        )
     )
 
     if is_training:
-        dataset = dataset.shuffle(len(examples), reshuffle_each_iteration=True)
+        dataset = dataset.shuffle(len(labels), reshuffle_each_iteration=True)
 
     dataset = dataset.batch(batch_size)
     dataset = dataset.cache()  # Cache after batching and shuffling for training
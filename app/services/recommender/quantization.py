@@ -0,0 +1,154 @@
+"""Post-training quantization of the embedding tables used for serving.
+
+- float16: values stored as float16 (half the memory of float32).
+- int8: values stored as int8 with one float32 scale per row
+  (row = values * scale, scale = max |row| / 127), a quarter of the memory.
+
+Scoring converts the table to float32 block by block, so the temporary memory
+stays bounded and the full float32 table is never materialised. A quantized
+table is only promoted if its recall@k on held-out examples stays within
+QUANTIZATION_RECALL_TOLERANCE of the float32 tables (see check_recall).
+"""
+
+import logging
+from typing import Any, Callable, Dict, Optional, Sequence, Union
+
+import numpy as np
+
+from app.core.config import settings
+from app.services.recommender.retrieval import top_k
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_DTYPES = ("float32", "float16", "int8")
+SCORE_BLOCK_ROWS = 16384
+
+
+class QuantizedTable:
+    """A (rows, dim) embedding table stored as float16, or int8 plus row scales."""
+
+    def __init__(self, values: np.ndarray, scales: Optional[np.ndarray] = None):
+        self.values = values
+        self.scales = scales
+
+    @property
+    def shape(self):
+        return self.values.shape
+
+    @property
+    def dtype(self) -> str:
+        return str(self.values.dtype)
+
+    @property
+    def nbytes(self) -> int:
+        return self.values.nbytes + (0 if self.scales is None else self.scales.nbytes)
+
+    def __len__(self) -> int:
+        return self.values.shape[0]
+
+    def __getitem__(self, ids: Any) -> np.ndarray:
+        """Dequantized float32 rows, e.g. table[context] for an embedding lookup."""
+        rows = self.values[ids].astype(np.float32)
+        if self.scales is not None:
+            rows *= self.scales[ids][..., None]
+        return rows
+
+    def scores(self, query_embeddings: np.ndarray) -> np.ndarray:
+        """(batch, rows) float32 dot products against every row."""
+        query = np.asarray(query_embeddings, dtype=np.float32)
+        scores = np.empty((query.shape[0], len(self)), dtype=np.float32)
+        for start in range(0, len(self), SCORE_BLOCK_ROWS):
+            stop = min(start + SCORE_BLOCK_ROWS, len(self))
+            block = query @ self.values[start:stop].astype(np.float32).T
+            if self.scales is not None:
+                block *= self.scales[start:stop]
+            scores[:, start:stop] = block
+        return scores
+
+
+EmbeddingTable = Union[np.ndarray, QuantizedTable]
+
+
+def slice_table(table: EmbeddingTable, start: int, stop: int) -> EmbeddingTable:
+    """Rows [start, stop) of a table without dequantizing (a view for arrays)."""
+    if isinstance(table, QuantizedTable):
+        scales = None if table.scales is None else table.scales[start:stop]
+        return QuantizedTable(table.values[start:stop], scales)
+    return table[start:stop]
+
+
+def quantize_table(table: np.ndarray, dtype: str) -> EmbeddingTable:
+    """Quantizes a float32 table; "float32" returns it unchanged."""
+    table = np.asarray(table, dtype=np.float32)
+    if dtype == "float32":
+        return table
+    if dtype == "float16":
+        return QuantizedTable(table.astype(np.float16))
+    if dtype == "int8":
+        scales = np.abs(table).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        values = np.clip(np.rint(table / scales[:, None]), -127, 127)
+        return QuantizedTable(values.astype(np.int8), scales.astype(np.float32))
+    raise ValueError(f"Unsupported embedding dtype: {dtype}")
+
+
+def table_arrays(name: str, table: EmbeddingTable) -> Dict[str, np.ndarray]:
+    """Arrays to store for a table: `<name>` and, for int8, `<name>_scales`."""
+    if isinstance(table, np.ndarray):
+        return {name: table}
+    arrays = {name: table.values}
+    if table.scales is not None:
+        arrays[f"{name}_scales"] = table.scales
+    return arrays
+
+
+def load_table(arrays: Dict[str, np.ndarray], name: str) -> EmbeddingTable:
+    values = arrays[name]
+    if values.dtype == np.float32:
+        return values
+    return QuantizedTable(values, arrays.get(f"{name}_scales"))
+
+
+def recall_at_k(
+    query_embeddings: np.ndarray,
+    candidates: EmbeddingTable,
+    labels: Sequence[int],
+    k: int,
+) -> float:
+    """Fraction of queries whose label is among their top-k candidates."""
+    if len(labels) == 0:
+        return 0.0
+    results = top_k(query_embeddings, candidates, k)
+    hits = sum(
+        1
+        for label, result in zip(labels, results)
+        if any(row == label for row, _ in result)
+    )
+    return hits / len(labels)
+
+
+def check_recall(
+    float_query_model: Callable[[np.ndarray], np.ndarray],
+    float_candidates: EmbeddingTable,
+    quantized_query_model: Callable[[np.ndarray], np.ndarray],
+    quantized_candidates: EmbeddingTable,
+    contexts: np.ndarray,
+    labels: np.ndarray,
+    k: int = settings.QUANTIZATION_RECALL_K,
+    tolerance: float = settings.QUANTIZATION_RECALL_TOLERANCE,
+) -> Dict[str, Any]:
+    """Compares recall@k of quantized tables against float32 on held-out data."""
+    float_recall = recall_at_k(float_query_model(contexts), float_candidates, labels, k)
+    quantized_recall = recall_at_k(
+        quantized_query_model(contexts), quantized_candidates, labels, k
+    )
+    report = {
+        "k": k,
+        "examples": int(len(labels)),
+        "float32_recall": round(float_recall, 4),
+        "quantized_recall": round(quantized_recall, 4),
+        "tolerance": tolerance,
+        "passed": bool(len(labels)) and quantized_recall >= float_recall - tolerance,
+    }
+    logger.info(f"Quantization recall check: {report}")
+    return report
@@ -0,0 +1,483 @@
+"""Model registry: read-only serving segments shared by all API workers.
+
+A serving segment is a directory of .npy files under models_store/serving/,
+one per model version, holding everything inference needs as plain arrays:
+
+- the candidate embedding table;
+- the query tower weights (Embedding + GRU);
+  both embedding tables are stored as SERVING_EMBEDDING_DTYPE once the
+  quantized version passes the recall check (see quantization.py);
+- the movie vocabulary (embedding row -> internal Movie.id);
+- catalog arrays: known rows, genre masks, per-movie rating stats, and the
+  movie details as a packed UTF-8 JSON blob with row offsets;
+- the precomputed neighbours, when available.
+
+API workers open the arrays with np.load(mmap_mode="r"), so every worker
+shares the same page-cache pages instead of holding its own copy of the model.
+Inference runs on numpy (see NumpyGRUQueryModel), so with SERVING_MODE=segment
+workers never import Keras or TensorFlow.
+
+Segments are written to a temporary directory and renamed into place. Then
+the CURRENT pointer file is replaced atomically, so workers switch versions in
+one step. Old segments are removed; pages already mapped by a worker stay valid
+until that worker unmaps them.
+
+Usage (publish a segment for the model file currently on disk):
+    python -m app.services.recommender.registry publish
+"""
+
+import asyncio
+import json
+import logging
+import os
+import shutil
+import sys
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.db import crud
+from app.services.recommender.artifacts import (
+    artifact_path,
+    load_versioned_npz,
+    model_version,
+)
+from app.services.recommender.quantization import (
+    EmbeddingTable,
+    check_recall,
+    load_table,
+    quantize_table,
+    table_arrays,
+)
+from app.services.recommender.retrieval import build_genre_masks, known_rows
+from app.services.recommender.similarity import NEIGHBOURS_ARTIFACT
+from app.services.recommender.vocabulary import NUM_RESERVED_ROWS, MovieVocabulary
+
+logger = logging.getLogger(__name__)
+
+SERVING_DIR = Path(settings.MODEL_PATH).parent / "serving"
+CURRENT_POINTER = SERVING_DIR / "CURRENT"
+SEGMENTS_TO_KEEP = 2
+
+
+def _sigmoid(x: np.ndarray) -> np.ndarray:
+    return 1.0 / (1.0 + np.exp(-x))
+
+
+class NumpyGRUQueryModel:
+    """The query tower (Embedding -> GRU, last state) as a numpy forward pass.
+
+    Matches keras.layers.GRU defaults: tanh / sigmoid activations, gate order
+    (z, r, h) in the kernels, and the `reset_after` bias layout.
+    """
+
+    backend = "numpy"
+
+    def __init__(
+        self,
+        embeddings: EmbeddingTable,
+        kernel: np.ndarray,
+        recurrent_kernel: np.ndarray,
+        bias: np.ndarray,
+        reset_after: bool = True,
+    ):
+        self.embeddings = embeddings
+        self.kernel = kernel
+        self.recurrent_kernel = recurrent_kernel
+        self.bias = bias
+        self.reset_after = reset_after
+        self.units = recurrent_kernel.shape[0]
+
+    def __call__(self, context: np.ndarray, training: bool = False) -> np.ndarray:
+        units = self.units
+        if self.reset_after:
+            input_bias, recurrent_bias = self.bias[0], self.bias[1]
+        else:
+            input_bias, recurrent_bias = self.bias, None
+
+        inputs = self.embeddings[np.asarray(context)]  # (batch, steps, dim)
+        projected = inputs @ self.kernel + input_bias  # (batch, steps, 3 * units)
+        state = np.zeros((inputs.shape[0], units), dtype=np.float32)
+        for step in range(inputs.shape[1]):
+            x_z, x_r, x_h = np.split(projected[:, step], 3, axis=1)
+            if self.reset_after:
+                inner = state @ self.recurrent_kernel + recurrent_bias
+                r_z, r_r, r_h = np.split(inner, 3, axis=1)
+                z = _sigmoid(x_z + r_z)
+                r = _sigmoid(x_r + r_r)
+                candidate = np.tanh(x_h + r * r_h)
+            else:
+                inner = state @ self.recurrent_kernel[:, : 2 * units]
+                z = _sigmoid(x_z + inner[:, :units])
+                r = _sigmoid(x_r + inner[:, units:])
+                candidate = np.tanh(
+                    x_h + (r * state) @ self.recurrent_kernel[:, 2 * units :]
+                )
+            state = z * state + (1.0 - z) * candidate
+        return state.astype(np.float32)
+
+
+class SegmentCatalog:
+    """Movie details decoded on demand from the segment's packed JSON blob.
+
+    Keyed by internal Movie.id; the blob itself is laid out by embedding row.
+    """
+
+    def __init__(
+        self, blob: np.ndarray, offsets: np.ndarray, vocabulary: MovieVocabulary
+    ):
+        self.blob = blob
+        self.offsets = offsets
+        self.vocabulary = vocabulary
+
+    def __getitem__(self, movie_id: int) -> Dict[str, Any]:
+        row = self.vocabulary.row(movie_id)
+        if row is None or row >= len(self.offsets) - 1:
+            raise KeyError(movie_id)
+        start, stop = int(self.offsets[row]), int(self.offsets[row + 1])
+        if start == stop:
+            raise KeyError(movie_id)
+        return json.loads(self.blob[start:stop].tobytes())
+
+    def get(self, movie_id: int, default: Any = None) -> Any:
+        try:
+            return self[movie_id]
+        except KeyError:
+            return default
+
+    def __len__(self) -> int:
+        return int(np.count_nonzero(np.diff(self.offsets)))
+
+
+class ServingSegment:
+    """A published segment opened read-only; arrays are memory-mapped."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.meta: Dict[str, Any] = json.loads((path / "meta.json").read_text())
+        self.version: str = self.meta["model_version"]
+        self.arrays: Dict[str, np.ndarray] = {
+            file.stem: np.load(file, mmap_mode="r") for file in path.glob("*.npy")
+        }
+
+    def query_model(self) -> NumpyGRUQueryModel:
+        return _query_model(self.arrays, self.meta)
+
+    def candidate_table(self) -> EmbeddingTable:
+        return load_table(self.arrays, "candidate_embeddings")
+
+    def vocabulary(self) -> MovieVocabulary:
+        return MovieVocabulary(self.arrays["vocabulary"])
+
+    def catalog(self) -> SegmentCatalog:
+        return SegmentCatalog(
+            self.arrays["catalog_blob"],
+            self.arrays["catalog_offsets"],
+            self.vocabulary(),
+        )
+
+    def genre_masks(self) -> Dict[str, np.ndarray]:
+        masks = self.arrays["genre_masks"]
+        return {genre: masks[i] for i, genre in enumerate(self.meta["genres"])}
+
+    def item_aggregates(self) -> np.ndarray:
+        """(row, num_ratings, avg_rating, last_timestamp), keyed by embedding row."""
+        stats = self.arrays["item_stats"]
+        rows = np.flatnonzero(stats[:, 0] > 0)
+        return np.column_stack([rows, stats[rows]])
+
+    def neighbours(self) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        if "neighbour_ids" not in self.arrays:
+            return None
+        return self.arrays["neighbour_ids"], self.arrays["neighbour_scores"]
+
+
+def _query_model(
+    arrays: Dict[str, np.ndarray], meta: Dict[str, Any]
+) -> NumpyGRUQueryModel:
+    return NumpyGRUQueryModel(
+        load_table(arrays, "query_embeddings"),
+        arrays["gru_kernel"],
+        arrays["gru_recurrent_kernel"],
+        arrays["gru_bias"],
+        reset_after=meta["reset_after"],
+    )
+
+
+def current_segment_version() -> Optional[str]:
+    if not CURRENT_POINTER.exists():
+        return None
+    return CURRENT_POINTER.read_text().strip() or None
+
+
+def open_segment(version: Optional[str]) -> Optional[ServingSegment]:
+    """A published segment by version, while it is kept (see prune_segments)."""
+    if version is None or not (SERVING_DIR / version).is_dir():
+        return None
+    return ServingSegment(SERVING_DIR / version)
+
+
+def open_current_segment() -> Optional[ServingSegment]:
+    return open_segment(current_segment_version())
+
+
+def write_segment(
+    version: str, arrays: Dict[str, np.ndarray], meta: Dict[str, Any]
+) -> Path:
+    """Writes a segment directory and atomically points CURRENT at it."""
+    SERVING_DIR.mkdir(parents=True, exist_ok=True)
+    tmp_dir = SERVING_DIR / f".{version}.tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    tmp_dir.mkdir()
+    for name, array in arrays.items():
+        np.save(tmp_dir / f"{name}.npy", np.ascontiguousarray(array))
+    (tmp_dir / "meta.json").write_text(json.dumps({**meta, "model_version": version}))
+
+    final_dir = SERVING_DIR / version
+    shutil.rmtree(final_dir, ignore_errors=True)
+    os.rename(tmp_dir, final_dir)
+
+    tmp_pointer = SERVING_DIR / ".CURRENT.tmp"
+    tmp_pointer.write_text(version)
+    os.replace(tmp_pointer, CURRENT_POINTER)
+    prune_segments()
+    logger.info(f"Published serving segment {final_dir}.")
+    return final_dir
+
+
+def prune_segments(keep: int = SEGMENTS_TO_KEEP) -> List[str]:
+    """Removes all but the newest `keep` segments (never the CURRENT one)."""
+    current = current_segment_version()
+    segments = sorted(
+        (path for path in SERVING_DIR.iterdir() if path.is_dir()),
+        key=lambda path: path.stat().st_mtime,
+        reverse=True,
+    )
+    removed = []
+    for path in segments[keep:]:
+        if path.name == current or path.name.startswith("."):
+            continue
+        shutil.rmtree(path, ignore_errors=True)
+        removed.append(path.name)
+    return removed
+
+
+def model_arrays(model: Any) -> Tuple[Dict[str, np.ndarray], Dict[str, Any]]:
+    """Candidate table and query-tower weights of a SequentialRetrievalModel.
+
+    Hashed / quotient-remainder tables are materialised to full tables.
+    """
+    from app.services.recommender.embeddings import embedding_table
+
+    embedding_layer, gru_layer = model.query_model.layers[:2]
+    kernel, recurrent_kernel, bias = gru_layer.get_weights()
+    arrays = {
+        "candidate_embeddings": embedding_table(model.candidate_model),
+        "query_embeddings": embedding_table(embedding_layer),
+        "gru_kernel": kernel.astype(np.float32),
+        "gru_recurrent_kernel": recurrent_kernel.astype(np.float32),
+        "gru_bias": bias.astype(np.float32),
+    }
+    meta = {
+        "movies_count": int(model.movies_count),
+        "embedding_dim": int(model.embedding_dimension),
+        "embedding_backend": getattr(model, "embedding_backend", "full"),
+        "context_length": settings.MAX_CONTEXT_LENGTH,
+        "reset_after": bool(getattr(gru_layer, "reset_after", True)),
+    }
+    return arrays, meta
+
+
+async def catalog_arrays(
+    db: AsyncSession, vocabulary: MovieVocabulary
+) -> Tuple[Dict[str, np.ndarray], Dict[str, Any]]:
+    """Catalog, masks and rating stats for every vocabulary row."""
+    num_rows = len(vocabulary)
+    movies = await crud.movie.get_catalog(db)
+    details: Dict[int, Dict[str, Any]] = dict(
+        vocabulary.rekey(
+            (
+                movie.id,
+                {
+                    "internal_id": movie.id,
+                    "movie_lens_id": movie.movie_lens_id,
+                    "title": movie.title,
+                    "resource_url": movie.resource_url,
+                    "genres": movie.genres,
+                },
+            )
+            for movie in movies
+        )
+    )
+
+    encoded = [b""] * num_rows
+    for row, detail in details.items():
+        encoded[row] = json.dumps(detail).encode("utf-8")
+    offsets = np.zeros(num_rows + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(item) for item in encoded])
+    blob = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+
+    masks = build_genre_masks(
+        {row: detail.get("genres") for row, detail in details.items()},
+        num_rows,
+    )
+    genres = sorted(masks)
+    genre_masks = (
+        np.stack([masks[genre] for genre in genres])
+        if genres
+        else np.zeros((0, num_rows), dtype=bool)
+    )
+
+    item_stats = np.zeros((num_rows, 3), dtype=np.float64)
+    for row, count, avg_rating, last_timestamp in vocabulary.rekey(
+        await crud.rating.get_item_aggregates(db)
+    ):
+        item_stats[row] = (count, avg_rating or 0.0, last_timestamp or 0)
+
+    arrays = {
+        "vocabulary": vocabulary.movie_ids,
+        "known_rows": known_rows(details.keys(), num_rows),
+        "genre_masks": genre_masks,
+        "item_stats": item_stats,
+        "catalog_blob": blob,
+        "catalog_offsets": offsets,
+    }
+    return arrays, {"genres": genres}
+
+
+def quantize_embedding_arrays(
+    arrays: Dict[str, np.ndarray],
+    meta: Dict[str, Any],
+    dtype: str = settings.SERVING_EMBEDDING_DTYPE,
+    eval_contexts: Optional[np.ndarray] = None,
+    eval_labels: Optional[np.ndarray] = None,
+) -> None:
+    """Swaps in quantized embedding tables if they pass the recall check.
+
+    Otherwise (or without evaluation examples) the float32 tables are kept.
+    The outcome is recorded in meta["quantization"].
+    """
+    meta["embedding_dtype"] = "float32"
+    if dtype == "float32":
+        return
+    if eval_contexts is None or eval_labels is None or len(eval_labels) == 0:
+        logger.warning(f"No evaluation examples. Not promoting {dtype} embeddings.")
+        meta["quantization"] = {"dtype": dtype, "passed": False, "examples": 0}
+        return
+
+    quantized = {
+        name: quantize_table(arrays[name], dtype)
+        for name in ("candidate_embeddings", "query_embeddings")
+    }
+    quantized_arrays = dict(arrays)
+    for name, table in quantized.items():
+        quantized_arrays.update(table_arrays(name, table))
+    report = check_recall(
+        _query_model(arrays, meta),
+        arrays["candidate_embeddings"],
+        _query_model(quantized_arrays, meta),
+        quantized["candidate_embeddings"],
+        eval_contexts,
+        eval_labels,
+    )
+    meta["quantization"] = {"dtype": dtype, **report}
+    if not report["passed"]:
+        logger.warning(f"{dtype} embeddings failed the recall check. Keeping float32.")
+        return
+    arrays.update(quantized_arrays)
+    meta["embedding_dtype"] = dtype
+
+
+async def sample_eval_examples(
+    db: AsyncSession,
+    vocabulary: MovieVocabulary,
+    num_users: int = settings.QUANTIZATION_EVAL_USERS,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """(contexts, labels) from users' latest ratings: predict the last movie.
+
+    Both are vocabulary rows; users whose last movie is not in the vocabulary
+    are skipped.
+    """
+    from app.services.recommender.preprocessing import (
+        prepare_user_context_for_prediction,
+    )
+
+    user_ids = await crud.user.get_ids(db, limit=num_users, min_ratings=2)
+    histories = await crud.rating.get_recent_histories(
+        db, user_ids=user_ids, limit_per_user=settings.MAX_CONTEXT_LENGTH + 1
+    )
+    contexts, labels = [], []
+    for history in histories.values():
+        rows = vocabulary.lookup(history).tolist()
+        if len(rows) >= 2 and rows[-1] >= NUM_RESERVED_ROWS:
+            contexts.append(prepare_user_context_for_prediction(rows[:-1]))
+            labels.append(rows[-1])
+    return np.array(contexts, dtype=np.int32), np.array(labels, dtype=np.int64)
+
+
+async def publish_serving_segment(
+    db: AsyncSession,
+    model: Any,
+    version: Optional[str] = None,
+    vocabulary: Optional[MovieVocabulary] = None,
+    eval_contexts: Optional[np.ndarray] = None,
+    eval_labels: Optional[np.ndarray] = None,
+) -> Optional[Path]:
+    """Builds and publishes the serving segment for a trained model.
+
+    `vocabulary` defaults to the one saved with the model version.
+    `eval_contexts` / `eval_labels` are held-out examples (vocabulary rows) for
+    the quantization recall check; they are sampled from the database when not
+    given.
+    """
+    version = version or model_version()
+    if version is None:
+        logger.warning("No saved model version. Not publishing a serving segment.")
+        return None
+    vocabulary = vocabulary or MovieVocabulary.load(version)
+    if vocabulary is None:
+        logger.warning("No vocabulary for the model. Not publishing a segment.")
+        return None
+    arrays, meta = model_arrays(model)
+    if len(vocabulary) != arrays["candidate_embeddings"].shape[0]:
+        logger.error("Vocabulary does not match the model's embedding tables.")
+        return None
+    if settings.SERVING_EMBEDDING_DTYPE != "float32" and eval_labels is None:
+        eval_contexts, eval_labels = await sample_eval_examples(db, vocabulary)
+    quantize_embedding_arrays(
+        arrays, meta, eval_contexts=eval_contexts, eval_labels=eval_labels
+    )
+    catalog, catalog_meta = await catalog_arrays(db, vocabulary)
+    arrays.update(catalog)
+    meta.update(catalog_meta)
+
+    neighbours = load_versioned_npz(artifact_path(NEIGHBOURS_ARTIFACT), version)
+    if neighbours is not None:
+        arrays["neighbour_ids"] = neighbours["neighbour_ids"]
+        arrays["neighbour_scores"] = neighbours["neighbour_scores"]
+    return write_segment(version, arrays, meta)
+
+
+async def _publish_current_model() -> None:
+    import keras
+
+    from app.db.session import AsyncSessionLocal
+    from app.services.recommender.model import SequentialRetrievalModel
+
+    model = keras.models.load_model(
+        settings.MODEL_PATH,
+        custom_objects={"SequentialRetrievalModel": SequentialRetrievalModel},
+    )
+    async with AsyncSessionLocal() as db:
+        await publish_serving_segment(db, model)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    if len(sys.argv) > 1 and sys.argv[1] == "publish":
+        asyncio.run(_publish_current_model())
+    else:
+        print(current_segment_version())
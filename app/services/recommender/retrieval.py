@@ -0,0 +1,132 @@
+"""Exact top-k retrieval over the candidate embedding table, with constraints.
+
+Constraints (genre filters, already-watched movies, the reserved rows) are
+applied to the score matrix before the top-k selection rather than by
+post-filtering a fixed-size result, so a constrained query costs the same as
+an unconstrained one and returns `k` items whenever that many are eligible.
+"""
+
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.services.catalog import split_genres
+from app.services.recommender.vocabulary import NUM_RESERVED_ROWS
+
+
+def build_genre_masks(
+    row_genres: Dict[int, Optional[str]], num_rows: int
+) -> Dict[str, np.ndarray]:
+    """Per-genre boolean masks over embedding rows, from row -> genres.
+
+    Rows are vocabulary rows (see vocabulary.MovieVocabulary.rekey).
+    """
+    masks: Dict[str, np.ndarray] = {}
+    for row, genres in row_genres.items():
+        if not 0 < row < num_rows:
+            continue
+        for genre in split_genres(genres):
+            if genre not in masks:
+                masks[genre] = np.zeros(num_rows, dtype=bool)
+            masks[genre][row] = True
+    return masks
+
+
+def known_rows(
+    rows: Iterable[int], num_rows: int, first_row: int = NUM_RESERVED_ROWS
+) -> np.ndarray:
+    """Mask of the rows of existing movies (never the reserved rows)."""
+    mask = np.zeros(num_rows, dtype=bool)
+    ids = np.fromiter((i for i in rows if first_row <= i < num_rows), dtype=np.int64)
+    mask[ids] = True
+    return mask
+
+
+def allowed_rows(
+    genre_masks: Dict[str, np.ndarray], base: np.ndarray, genres: Iterable[str] = ()
+) -> np.ndarray:
+    """Rows of `base` eligible for retrieval: movies with ALL requested genres."""
+    allowed = base.copy()
+    for genre in genres:
+        mask = genre_masks.get(genre.strip().lower())
+        if mask is None:
+            return np.zeros_like(base)
+        allowed &= mask
+    return allowed
+
+
+def top_k(
+    query_embeddings: np.ndarray,
+    candidate_embeddings: np.ndarray,
+    k: int,
+    allowed: Optional[np.ndarray] = None,
+    excluded: Optional[Sequence[Iterable[int]]] = None,
+) -> List[List[Tuple[int, float]]]:
+    """Highest-scoring (row, score) pairs per query, best first.
+
+    Args:
+      query_embeddings: (batch, dim) query tower outputs.
+      candidate_embeddings: (rows, dim) candidate table, or a quantized table
+        exposing scores(query_embeddings) (see quantization.QuantizedTable).
+      allowed: optional (rows,) boolean mask shared by the whole batch.
+      excluded: optional per-query row ids to exclude (e.g. watched movies).
+    """
+    return to_pairs(
+        *top_k_arrays(query_embeddings, candidate_embeddings, k, allowed, excluded)
+    )
+
+
+def top_k_arrays(
+    query_embeddings: np.ndarray,
+    candidate_embeddings: np.ndarray,
+    k: int,
+    allowed: Optional[np.ndarray] = None,
+    excluded: Optional[Sequence[Iterable[int]]] = None,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """top_k as (batch, k) row and score arrays; ineligible rows score -inf."""
+    if hasattr(candidate_embeddings, "scores"):
+        scores = candidate_embeddings.scores(query_embeddings)
+    else:
+        # The table is float32 already; converting it would copy it per request
+        scores = (
+            query_embeddings.astype(np.float32, copy=False) @ candidate_embeddings.T
+        )
+    if allowed is not None:
+        scores[:, ~allowed] = -np.inf
+    if excluded is not None:
+        for query_index, rows in enumerate(excluded):
+            rows = [row for row in rows if 0 <= row < scores.shape[1]]
+            if rows:
+                scores[query_index, rows] = -np.inf
+    return select_top_k(scores, k)
+
+
+def select_top_k(
+    scores: np.ndarray, k: int, ids: Optional[np.ndarray] = None
+) -> Tuple[np.ndarray, np.ndarray]:
+    """The k best columns of each row of `scores`, best first.
+
+    Returns their `ids` (same shape as scores; column indexes by default)
+    and scores.
+    """
+    k = min(k, scores.shape[1])
+    top = np.argpartition(scores, -k, axis=1)[:, -k:]
+    top_scores = np.take_along_axis(scores, top, axis=1)
+    order = np.argsort(-top_scores, axis=1)
+    top = np.take_along_axis(top, order, axis=1)
+    top_scores = np.take_along_axis(top_scores, order, axis=1)
+    if ids is not None:
+        top = np.take_along_axis(ids, top, axis=1)
+    return top, top_scores
+
+
+def to_pairs(ids: np.ndarray, scores: np.ndarray) -> List[List[Tuple[int, float]]]:
+    """(id, score) lists per query, dropping ineligible (-inf) entries."""
+    return [
+        [
+            (int(row), float(score))
+            for row, score in zip(rows, row_scores)
+            if np.isfinite(score)
+        ]
+        for rows, row_scores in zip(ids, scores)
+    ]
@@ -0,0 +1,319 @@
+"""Sharded scatter-gather candidate retrieval.
+
+The candidate table is split into contiguous movie-id ranges, one per shard.
+Each shard process holds (memory-maps) only its own rows and answers top-k
+requests for a batch of query embeddings over that range. The coordinator
+(ShardedRetriever, used by the recommendation pipeline) sends every batch to
+all shards at once. Shards answer with (batch, k) id and score arrays, which
+the coordinator concatenates and reduces to the global top-k with one
+argpartition.
+
+Shards talk over multiprocessing.connection, so they can run on the same host
+or on other nodes. Every node needs the serving segment (e.g. a shared
+models_store volume). Configure the API with RETRIEVAL_SHARD_ADDRESSES in
+shard order; sharding is only used with SERVING_MODE=segment.
+
+Connections are authenticated with RETRIEVAL_SHARD_AUTHKEY, which must be set
+(requests are unpickled, so shard servers refuse to start without it). Shard
+servers bind RETRIEVAL_SHARD_HOST (loopback by default) and the coordinator
+gives up on a shard after RETRIEVAL_SHARD_TIMEOUT_SECONDS.
+
+Every request carries the segment version the coordinator serves. A shard
+searches that version (kept segments can be opened side by side during a
+swap) and answers with an error if it cannot, so results never mix rows of
+two segments.
+
+Usage (one process per shard):
+    python -m app.services.recommender.sharding serve <index> <num_shards> <port>
+"""
+
+import logging
+import os
+import socket
+import sys
+import threading
+import time
+from multiprocessing.connection import Client, Listener
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.core.config import settings
+from app.services.recommender.quantization import EmbeddingTable, slice_table
+from app.services.recommender.retrieval import select_top_k, to_pairs, top_k_arrays
+
+logger = logging.getLogger(__name__)
+
+Address = Tuple[str, int]
+
+
+class ShardVersionError(RuntimeError):
+    """The shard cannot serve the segment version a request asked for."""
+
+
+def shard_range(num_rows: int, index: int, num_shards: int) -> Tuple[int, int]:
+    """[start, stop) rows of shard `index`; sizes differ by at most one row."""
+    base, extra = divmod(num_rows, num_shards)
+    start = index * base + min(index, extra)
+    return start, start + base + (1 if index < extra else 0)
+
+
+def require_authkey(authkey: Optional[bytes] = None) -> bytes:
+    """`authkey`, or RETRIEVAL_SHARD_AUTHKEY; raises ValueError if empty."""
+    if authkey is None:
+        authkey = settings.RETRIEVAL_SHARD_AUTHKEY.encode()
+    if not authkey:
+        raise ValueError("RETRIEVAL_SHARD_AUTHKEY must be set for sharded retrieval.")
+    return authkey
+
+
+def parse_addresses(spec: str) -> List[Address]:
+    """Parses "host1:7001,host2:7001" into (host, port) pairs."""
+    addresses = []
+    for item in spec.split(","):
+        if item.strip():
+            host, port = item.strip().rsplit(":", 1)
+            addresses.append((host, int(port)))
+    return addresses
+
+
+class RetrievalShard:
+    """Local top-k over one row range of the candidate table."""
+
+    def __init__(self, candidates: EmbeddingTable, start: int, stop: int):
+        self.candidates = slice_table(candidates, start, stop)
+        self.start = start
+        self.stop = stop
+
+    def search(
+        self,
+        query_embeddings: np.ndarray,
+        k: int,
+        allowed: Optional[np.ndarray] = None,
+        excluded: Optional[Sequence[Iterable[int]]] = None,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Like retrieval.top_k_arrays, with global row ids in and out.
+
+        `allowed` covers this shard's rows only.
+        """
+        local_excluded = None
+        if excluded is not None:
+            local_excluded = [
+                [row - self.start for row in rows if self.start <= row < self.stop]
+                for rows in excluded
+            ]
+        rows, scores = top_k_arrays(
+            query_embeddings,
+            self.candidates,
+            k,
+            allowed=allowed,
+            excluded=local_excluded,
+        )
+        return rows + self.start, scores
+
+
+def _answer(request: Dict[str, Any], get_shard) -> Dict[str, Any]:
+    try:
+        shard = get_shard(request.get("version"))
+        results = shard.search(
+            request["queries"],
+            request["k"],
+            allowed=request.get("allowed"),
+            excluded=request.get("excluded"),
+        )
+    except ShardVersionError as e:
+        logger.warning(str(e))
+        return {"error": str(e)}
+    except Exception as e:
+        logger.error(f"Retrieval shard request failed: {e}", exc_info=True)
+        return {"error": f"{type(e).__name__}: {e}"}
+    return {"results": results}
+
+
+def _no_delay(conn) -> None:
+    """Turns off Nagle's algorithm on a multiprocessing.connection socket.
+
+    Large messages are written as a header then the payload; with Nagle on,
+    the payload's tail waits for the peer's delayed ACK (~40 ms per reply).
+    """
+    sock = socket.socket(fileno=os.dup(conn.fileno()))
+    try:
+        if sock.family in (socket.AF_INET, socket.AF_INET6):
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    finally:
+        sock.close()
+
+
+def _handle_connection(conn, get_shard) -> None:
+    _no_delay(conn)
+    try:
+        while True:
+            conn.send(_answer(conn.recv(), get_shard))
+    except (EOFError, OSError):
+        pass
+    finally:
+        conn.close()
+
+
+def serve_shard(
+    get_shard,
+    address: Address,
+    authkey: Optional[bytes] = None,
+    ready=None,
+) -> None:
+    """Accepts coordinator connections forever, one thread per connection.
+
+    `get_shard(version)` returns the shard to search for a request's segment
+    version, or raises ShardVersionError. If given, `ready` receives the bound
+    address.
+    """
+    authkey = require_authkey(authkey)
+    with Listener(address, authkey=authkey) as listener:
+        logger.info(f"Retrieval shard listening on {listener.address}.")
+        if ready is not None:
+            ready.send(listener.address)
+        while True:
+            conn = listener.accept()
+            threading.Thread(
+                target=_handle_connection, args=(conn, get_shard), daemon=True
+            ).start()
+
+
+class _SegmentShard:
+    """Serves one shard of the registry's segments, by requested version."""
+
+    def __init__(self, index: int, num_shards: int):
+        self.index = index
+        self.num_shards = num_shards
+        self.shards: Dict[str, RetrievalShard] = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, version: Optional[str]) -> RetrievalShard:
+        from app.services.recommender.registry import SEGMENTS_TO_KEEP, open_segment
+
+        with self._lock:
+            shard = self.shards.get(version)
+            if shard is not None:
+                return shard
+            segment = open_segment(version)
+            if segment is None:
+                raise ShardVersionError(
+                    f"Shard {self.index} has no serving segment {version}."
+                )
+            table = segment.candidate_table()
+            start, stop = shard_range(table.shape[0], self.index, self.num_shards)
+            self.shards[version] = RetrievalShard(table, start, stop)
+            # Keep as many open as the registry keeps on disk (oldest out first)
+            while len(self.shards) > SEGMENTS_TO_KEEP:
+                self.shards.pop(next(iter(self.shards)))
+            logger.info(
+                f"Shard {self.index}/{self.num_shards} serving rows "
+                f"[{start}, {stop}) of segment {version}."
+            )
+            return self.shards[version]
+
+
+class ShardedRetriever:
+    """Coordinator: scatters a query batch to every shard and merges the top-k.
+
+    Connections are kept per thread, since requests run in a thread pool.
+    `version` is the segment every shard must search. A shard that doesn't
+    answer within `timeout` seconds fails the call with TimeoutError.
+    """
+
+    def __init__(
+        self,
+        addresses: Sequence[Address],
+        num_rows: int,
+        version: Optional[str] = None,
+        authkey: Optional[bytes] = None,
+        timeout: float = settings.RETRIEVAL_SHARD_TIMEOUT_SECONDS,
+    ):
+        self.addresses = list(addresses)
+        self.num_rows = num_rows
+        self.version = version
+        self.authkey = require_authkey(authkey)
+        self.timeout = timeout
+        self.ranges = [
+            shard_range(num_rows, index, len(self.addresses))
+            for index in range(len(self.addresses))
+        ]
+        self._local = threading.local()
+
+    def _connections(self) -> List[Any]:
+        connections = getattr(self._local, "connections", None)
+        if connections is None:
+            connections = [
+                Client(address, authkey=self.authkey) for address in self.addresses
+            ]
+            for conn in connections:
+                _no_delay(conn)
+            self._local.connections = connections
+        return connections
+
+    def _reset_connections(self) -> None:
+        for conn in getattr(self._local, "connections", None) or []:
+            conn.close()
+        self._local.connections = None
+
+    @staticmethod
+    def _receive(conn, address: Address, deadline: float) -> Dict[str, Any]:
+        if not conn.poll(max(deadline - time.monotonic(), 0)):
+            raise TimeoutError(f"Retrieval shard {address[0]}:{address[1]} timed out.")
+        return conn.recv()
+
+    def _scatter_gather(self, requests: List[Dict[str, Any]]) -> List[Any]:
+        connections = self._connections()
+        try:
+            for conn, request in zip(connections, requests):
+                conn.send(request)
+            # The shards work in parallel, so one deadline covers them all
+            deadline = time.monotonic() + self.timeout
+            responses = [
+                self._receive(conn, address, deadline)
+                for conn, address in zip(connections, self.addresses)
+            ]
+        except (EOFError, OSError):
+            # Drop broken (or out of sync) connections so the next call reconnects
+            self._reset_connections()
+            raise
+        errors = [response["error"] for response in responses if "error" in response]
+        if errors:
+            raise RuntimeError(f"Retrieval shards failed: {'; '.join(errors)}")
+        return [response["results"] for response in responses]
+
+    def __call__(
+        self,
+        query_embeddings: np.ndarray,
+        k: int,
+        allowed: Optional[np.ndarray] = None,
+        excluded: Optional[Sequence[Iterable[int]]] = None,
+    ) -> List[List[Tuple[int, float]]]:
+        """Same contract as retrieval.top_k over the whole candidate table."""
+        queries = np.ascontiguousarray(query_embeddings, dtype=np.float32)
+        excluded = [list(rows) for rows in excluded] if excluded is not None else None
+        requests = [
+            {
+                "version": self.version,
+                "queries": queries,
+                "k": k,
+                "allowed": allowed[start:stop] if allowed is not None else None,
+                "excluded": excluded,
+            }
+            for start, stop in self.ranges
+        ]
+        shard_results = self._scatter_gather(requests)
+
+        ids = np.concatenate([rows for rows, _ in shard_results], axis=1)
+        scores = np.concatenate([scores for _, scores in shard_results], axis=1)
+        return to_pairs(*select_top_k(scores, k, ids))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    if len(sys.argv) != 5 or sys.argv[1] != "serve":
+        raise SystemExit(__doc__)
+    shard_index, num_shards, port = (int(arg) for arg in sys.argv[2:])
+    serve_shard(
+        _SegmentShard(shard_index, num_shards), (settings.RETRIEVAL_SHARD_HOST, port)
+    )
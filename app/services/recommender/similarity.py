@@ -0,0 +1,66 @@
+import logging
+from typing import Tuple
+
+import numpy as np
+
+from app.core.config import settings
+from app.services.recommender.artifacts import artifact_path, save_npz_atomic
+from app.services.recommender.vocabulary import NUM_RESERVED_ROWS
+
+logger = logging.getLogger(__name__)
+
+NEIGHBOURS_ARTIFACT = "neighbours.npz"
+
+
+def compute_item_neighbours(
+    embeddings: np.ndarray,
+    k: int = settings.SIMILAR_MOVIES_K,
+    block_memory_mb: int = settings.SIMILARITY_BLOCK_MEMORY_MB,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Top-k cosine neighbours for every row of an embedding table.
+
+    Rows are processed in blocks sized so that one (block x rows) float32 score
+    matrix stays within `block_memory_mb`. The reserved rows (padding and
+    out-of-vocabulary) are never returned as neighbours and their own
+    neighbour rows are left empty.
+
+    Returns (neighbour_ids int32 [rows, k], neighbour_scores float16 [rows, k]).
+    """
+    num_rows = embeddings.shape[0]
+    k = max(1, min(k, num_rows - NUM_RESERVED_ROWS - 1))
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    normalised = (embeddings / np.maximum(norms, 1e-12)).astype(np.float32)
+
+    block_rows = max(1, (block_memory_mb * 1024 * 1024) // (num_rows * 4))
+    neighbour_ids = np.zeros((num_rows, k), dtype=np.int32)
+    neighbour_scores = np.zeros((num_rows, k), dtype=np.float16)
+
+    for start in range(NUM_RESERVED_ROWS, num_rows, block_rows):
+        stop = min(start + block_rows, num_rows)
+        scores = normalised[start:stop] @ normalised.T
+        scores[:, :NUM_RESERVED_ROWS] = -np.inf  # padding / OOV rows
+        scores[np.arange(stop - start), np.arange(start, stop)] = -np.inf  # self
+        top = np.argpartition(scores, -k, axis=1)[:, -k:]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        neighbour_ids[start:stop] = np.take_along_axis(top, order, axis=1)
+        neighbour_scores[start:stop] = np.take_along_axis(top_scores, order, axis=1)
+
+    return neighbour_ids, neighbour_scores
+
+
+def build_neighbour_artifact(candidate_embeddings: np.ndarray, model_version: str):
+    """Computes and stores the neighbour matrix for a freshly saved model."""
+    logger.info(
+        f"Computing top-{settings.SIMILAR_MOVIES_K} neighbours for "
+        f"{candidate_embeddings.shape[0] - NUM_RESERVED_ROWS} movies..."
+    )
+    neighbour_ids, neighbour_scores = compute_item_neighbours(candidate_embeddings)
+    path = artifact_path(NEIGHBOURS_ARTIFACT)
+    save_npz_atomic(
+        path,
+        neighbour_ids=neighbour_ids,
+        neighbour_scores=neighbour_scores,
+        model_version=np.array(model_version),
+    )
+    logger.info(f"Neighbour artifact saved to {path}.")
@@ -1,23 +1,35 @@
 import logging
 import os
-import random
-from typing import List
+import uuid
+from typing import Optional, Tuple
 
 import keras
-import pandas as pd
-import tensorflow as tf
+import numpy as np
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.config import settings
-from app.db import crud
-from app.db.models import Rating
+from app.services.recommender.artifacts import model_version
+from app.services.recommender.checkpoints import (
+    DatasetSnapshot,
+    TrainingCheckpoints,
+    keras_checkpoint_callback,
+)
+from app.services.recommender.distributed import fit_distributed
+from app.services.recommender.embeddings import resolve_backend, table_rows
+from app.services.recommender.instrumentation import (
+    TrainingRun,
+    keras_progress_callback,
+)
 from app.services.recommender.model import SequentialRetrievalModel
 from app.services.recommender.preprocessing import (
     MIN_RATING_FILTER,
     create_tf_datasets,
-    generate_examples_from_user_sequences,
-    get_movie_sequence_per_user,
+    encode_examples,
 )
+from app.services.recommender.registry import publish_serving_segment
+from app.services.recommender.similarity import build_neighbour_artifact
+from app.services.recommender.training_data import load_training_data
+from app.services.recommender.vocabulary import NUM_RESERVED_ROWS, MovieVocabulary
 
 BATCH_SIZE = 4096
 NUM_EPOCHS = 5
@@ -28,112 +40,294 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
-async def train_model(db: AsyncSession):
+async def train_model(
+    db: AsyncSession,
+    run: Optional[TrainingRun] = None,
+    checkpoints: Optional[TrainingCheckpoints] = None,
+    workers: Optional[int] = None,
+) -> Optional[bool]:
+    """Trains and saves the model; returns True once a new model is saved.
+
+    Stage timings and fit progress are recorded in `run` (see instrumentation).
+    With `checkpoints`, the dataset snapshot and per-epoch checkpoints are
+    saved there, and a run that finds them resumes instead of starting over.
+    With more than one of `workers` (default TRAINING_WORKERS), fit runs
+    data-parallel over local processes (see distributed.py).
+    """
+    run = run or TrainingRun()
+    try:
+        trained = await _train_model(
+            db, run, checkpoints, workers or settings.TRAINING_WORKERS
+        )
+    except Exception:
+        run.finish("failed")
+        raise
+    run.finish("trained" if trained else "not_trained")
+    return trained
+
+
+async def _train_model(
+    db: AsyncSession,
+    run: TrainingRun,
+    checkpoints: Optional[TrainingCheckpoints],
+    workers: int,
+) -> Optional[bool]:
     logger.info("Starting recommendation model training process...")
-    logger.info("Fetching ratings data from database...")
+    if workers > 1 and keras.backend.backend() != "tensorflow":
+        logger.warning(
+            f"Distributed training needs the tensorflow backend, not "
+            f"{keras.backend.backend()}; training in this process."
+        )
+        workers = 1
+    if checkpoints is None and workers > 1:
+        # Distributed workers read the dataset snapshot from a run directory
+        checkpoints = TrainingCheckpoints(uuid.uuid4().hex)
+        checkpoints.prepare()
+    snapshot = checkpoints.load_snapshot() if checkpoints else None
+    if snapshot is not None:
+        logger.info(f"Resuming from the dataset snapshot in {checkpoints.path}.")
+    else:
+        snapshot = await _prepare_dataset(db, run)
+        if snapshot is None:
+            return
+        if checkpoints:
+            run.stage("snapshot")
+            checkpoints.save_snapshot(snapshot)
+    vocabulary = snapshot.vocabulary
+    # Nothing reads the DB until publishing, so give the connection back to
+    # the pool for the whole fit; the session checks out a new one later
+    await db.close()
 
-    # crud.rating.get_all_ratings_for_training returns List[Rating ORM objects]
-    # Each Rating object has 'movie_id' which is the internal, auto-incrementing Movie.id
-    raw_ratings_data: List[Rating] = await crud.rating.get_all_ratings_for_training(db)
+    model_path = settings.MODEL_PATH
+    # The model is written next to the real path and moved in place only once
+    # its vocabulary is saved (see _install_model)
+    tmp_model_path = _tmp_model_path(model_path)
+    os.makedirs(os.path.dirname(model_path), exist_ok=True)
+    if workers > 1:
+        # Workers load the dataset snapshot and rank 0 saves the model
+        run.stage("fit")
+        latest = checkpoints.latest()
+        initial_epoch = latest[0] if latest else 0
+        run.count(len(snapshot.train_labels) * (NUM_EPOCHS - initial_epoch))
+        if not fit_distributed(checkpoints, workers, run, tmp_model_path):
+            logger.error("Distributed training failed.")
+            return
+        run.stage("save")
+        try:
+            model = keras.models.load_model(
+                tmp_model_path,
+                custom_objects={"SequentialRetrievalModel": SequentialRetrievalModel},
+            )
+        except Exception as e:
+            logger.error(f"Error loading the distributed model: {e}", exc_info=True)
+            return
+    else:
+        model = _fit(snapshot, run, checkpoints)
+        if model is None:
+            return
 
-    if not raw_ratings_data:
-        logger.warning("No ratings data found in the database. Skipping training.")
-        return
+        run.stage("save")
+        try:
+            logger.info(f"Saving trained model to {tmp_model_path}...")
+            model.save(tmp_model_path)
+            logger.info(f"Model saved successfully.")
+        except Exception as e:
+            logger.error(f"Error saving model: {e}", exc_info=True)
+            return
 
-    # Data for Pandas DataFrame will use the internal Movie.id
-    data_for_pandas = [
-        {
-            "user_id": r.user_id,
-            "movie_id": r.movie_id,  # This is the internal Movie.id
-            "rating": r.rating,
-            "timestamp": r.timestamp,
-        }
-        for r in raw_ratings_data
-    ]
-
-    if not data_for_pandas:
-        logger.warning("No suitable rating data for training. Skipping.")
+    # Post-training artifacts are versioned with the saved model file
+    run.stage("artifacts")
+    try:
+        _install_model(tmp_model_path, model_path, vocabulary)
+    except Exception as e:
+        logger.error(f"Error installing the model: {e}", exc_info=True)
         return
+    if checkpoints:
+        checkpoints.clear()
+
+    try:
+        build_neighbour_artifact(
+            keras.ops.convert_to_numpy(model.candidate_model.embeddings),
+            model_version(model_path),
+        )
+    except Exception as e:
+        logger.error(f"Error building neighbour artifact: {e}", exc_info=True)
 
-    ratings_df = pd.DataFrame(data_for_pandas)
+    if settings.SERVING_MODE == "segment":
+        run.stage("publish")
+        try:
+            # Held-out examples drive the quantization recall check
+            num_eval = settings.QUANTIZATION_EVAL_USERS
+            await publish_serving_segment(
+                db,
+                model,
+                model_version(model_path),
+                vocabulary,
+                eval_contexts=snapshot.test_contexts[:num_eval],
+                eval_labels=snapshot.test_labels[:num_eval].astype(np.int64),
+            )
+        except Exception as e:
+            logger.error(f"Error publishing serving segment: {e}", exc_info=True)
+
+    return True
+
+
+def _tmp_model_path(model_path: str) -> str:
+    # Keras picks the format from the suffix, so keep it
+    root, ext = os.path.splitext(model_path)
+    return f"{root}.tmp{ext}"
+
+
+def _install_model(
+    tmp_model_path: str, model_path: str, vocabulary: MovieVocabulary
+) -> None:
+    """Saves the vocabulary for the new model, then moves the model in place.
+
+    The rename keeps the file's mtime (its version), so a reload never sees
+    the new model file without its vocabulary.
+    """
+    vocabulary.save(model_version(tmp_model_path))
+    os.replace(tmp_model_path, model_path)
+    logger.info(f"Model installed at {model_path}.")
+
+
+def _fit(
+    snapshot: DatasetSnapshot,
+    run: TrainingRun,
+    checkpoints: Optional[TrainingCheckpoints],
+) -> Optional[SequentialRetrievalModel]:
+    """Fits the model in this process; None if building or fitting failed."""
+    run.stage("datasets")
+    run.count(len(snapshot.train_labels) + len(snapshot.test_labels))
+    val_ds = None
+    if len(snapshot.test_labels):
+        val_ds = create_tf_datasets(
+            snapshot.test_contexts, snapshot.test_labels, BATCH_SIZE, is_training=False
+        )
+    else:
+        logger.warning("No test examples after split. Validation will be skipped.")
     logger.info(
-        f"Processed {len(ratings_df)} ratings into DataFrame using internal movie_id."
+        f"Train examples: {len(snapshot.train_labels)}, "
+        f"Test examples: {len(snapshot.test_labels)}"
     )
 
-    ratings_df = ratings_df[ratings_df["rating"] >= MIN_RATING_FILTER]
-    logger.info(
-        f"Filtered to {len(ratings_df)} ratings with rating >= {MIN_RATING_FILTER}."
+    logger.info("Creating TensorFlow datasets...")
+    train_ds = create_tf_datasets(
+        snapshot.train_contexts, snapshot.train_labels, BATCH_SIZE, is_training=True
     )
 
-    if ratings_df.empty:
+    run.stage("build")
+    model, initial_epoch = load_or_build_model(snapshot.vocabulary, checkpoints)
+    if model is None:
+        return
+
+    logger.info("Starting model training...")
+    try:
+        fit_kwargs = {"validation_data": val_ds} if val_ds else {}
+        run.stage("fit")
+        num_train = len(snapshot.train_labels)
+        run.count(num_train * (NUM_EPOCHS - initial_epoch))
+        callbacks = [keras_progress_callback(run, BATCH_SIZE, num_train)]
+        if checkpoints:
+            callbacks.append(keras_checkpoint_callback(checkpoints))
+        history = model.fit(
+            train_ds,
+            epochs=NUM_EPOCHS,
+            initial_epoch=initial_epoch,
+            verbose=1,
+            callbacks=callbacks,
+            **fit_kwargs,
+        )
+        logger.info(f"Model training completed. History: {history.history}")
+    except Exception as e:
+        logger.error(f"Error during model training: {e}", exc_info=True)
+        return
+    return model
+
+
+async def _prepare_dataset(
+    db: AsyncSession, run: TrainingRun
+) -> Optional[DatasetSnapshot]:
+    """Ratings -> examples (cached, see training_data) -> train / test split."""
+    logger.info("Fetching ratings data from database...")
+    data = await load_training_data(db, run)
+    if not len(data.users):
         logger.warning("No ratings data after filtering. Skipping training.")
         return
+    logger.info(
+        f"{len(data.users)} ratings with rating >= {MIN_RATING_FILTER}, "
+        f"{len(data.labels)} examples."
+    )
 
-    logger.info("Generating movie sequences per user...")
-    user_sequences = get_movie_sequence_per_user(ratings_df)
-    if not user_sequences:
-        logger.warning("No user sequences generated.")
+    run.stage("vocabulary")
+    # Embedding rows come from a dense vocabulary of the rated movies, so the
+    # tables don't grow with id gaps, deleted or never-rated movies
+    vocabulary = MovieVocabulary.from_ratings(np.asarray(data.movies))
+    if len(vocabulary) <= NUM_RESERVED_ROWS:
+        logger.error("Empty movie vocabulary. Cannot train model.")
         return
+    logger.info(
+        f"Vocabulary: {len(vocabulary.movie_ids)} movies "
+        f"(min_count={settings.VOCAB_MIN_COUNT}, max_size={settings.VOCAB_MAX_SIZE})."
+    )
 
-    logger.info("Generating examples from user sequences...")
-    examples = generate_examples_from_user_sequences(user_sequences)
-    if not examples:
+    run.stage("encode")
+    contexts, labels = encode_examples(vocabulary, data.contexts, data.labels)
+    run.count(len(labels))
+    if not len(labels):
         logger.warning("No training examples generated.")
         return
-    logger.info(f"Generated {len(examples)} training examples.")
-
-    random.shuffle(examples)
-    split_index = int(TRAIN_DATA_FRACTION * len(examples))
-    train_examples = examples[:split_index]
-    test_examples = examples[split_index:]
+    logger.info(f"Generated {len(labels)} training examples.")
 
-    if not train_examples:
+    order = np.random.default_rng().permutation(len(labels))
+    split_index = int(TRAIN_DATA_FRACTION * len(labels))
+    train, test = order[:split_index], order[split_index:]
+    if not len(train):
         logger.warning("No training examples after split.")
         return
 
-    val_ds = None
-    if test_examples:
-        val_ds = create_tf_datasets(test_examples, BATCH_SIZE, is_training=False)
-    else:
-        logger.warning("No test examples after split. Validation will be skipped.")
-    logger.info(
-        f"Train examples: {len(train_examples)}, Test examples: {len(test_examples)}"
+    return DatasetSnapshot(
+        vocabulary, contexts[train], labels[train], contexts[test], labels[test]
     )
 
-    logger.info("Creating TensorFlow datasets...")
-    train_ds = create_tf_datasets(train_examples, BATCH_SIZE, is_training=True)
 
-    # movies_count is now based on the maximum internal movie_id present in the ratings,
-    # or the overall maximum internal movie_id in the movies table.
-    # This ensures the Embedding layer has enough capacity for all movie IDs the model might see.
-    max_internal_movie_id_from_db = await crud.movie.get_max_internal_movie_id(db)
+def load_or_build_model(
+    vocabulary: MovieVocabulary, checkpoints: Optional[TrainingCheckpoints] = None
+) -> Tuple[Optional[SequentialRetrievalModel], int]:
+    """(model, initial epoch): resumed from the latest checkpoint, or new.
 
-    # Consider also max_movie_id from the actual ratings data being used for training,
-    # as there might be movies in DB not yet in ratings. The embedding layer needs to cover all rated movies.
-    max_internal_movie_id_in_ratings = 0
-    if not ratings_df["movie_id"].empty:
-        max_internal_movie_id_in_ratings = ratings_df["movie_id"].max()
+    Under a distribution strategy, call it inside strategy.scope().
+    """
+    latest = checkpoints.latest() if checkpoints else None
+    if latest is None:
+        return _build_model(vocabulary), 0
+    initial_epoch, checkpoint_path = latest
+    logger.info(f"Resuming training after epoch {initial_epoch}.")
+    model = keras.models.load_model(
+        checkpoint_path,
+        custom_objects={"SequentialRetrievalModel": SequentialRetrievalModel},
+    )
+    return model, initial_epoch
 
-    if max_internal_movie_id_from_db is None and max_internal_movie_id_in_ratings == 0:
-        logger.error("Cannot determine movies_count (max internal movie_id).")
-        return
 
-    movies_count = 0
-    if max_internal_movie_id_from_db is not None:
-        movies_count = max(movies_count, int(max_internal_movie_id_from_db))
-    if max_internal_movie_id_in_ratings > 0:  # Check if there were any ratings
-        movies_count = max(movies_count, int(max_internal_movie_id_in_ratings))
+def _build_model(vocabulary: MovieVocabulary) -> Optional[SequentialRetrievalModel]:
+    # The tables have movies_count + 1 rows: one per vocabulary row
+    movies_count = len(vocabulary) - 1
+    logger.info(f"Determined movies_count (vocabulary rows - 1): {movies_count}")
 
+    embedding_backend, embedding_buckets = resolve_backend(
+        movies_count + 1, settings.EMBEDDING_DIM
+    )
     logger.info(
-        f"Determined movies_count (max internal movie_id) for model: {movies_count}"
+        f"Embedding backend: {embedding_backend} ({embedding_buckets} buckets, "
+        f"{table_rows(embedding_backend, movies_count + 1, embedding_buckets)} "
+        f"rows per table)."
     )
-
-    if movies_count == 0:
-        logger.error("movies_count is 0. Cannot train model.")
-        return
-
     model = SequentialRetrievalModel(
-        movies_count=movies_count, embedding_dimension=settings.EMBEDDING_DIM
+        movies_count=movies_count,
+        embedding_dimension=settings.EMBEDDING_DIM,
+        embedding_backend=embedding_backend,
+        embedding_buckets=embedding_buckets,
     )
     model.compile(optimizer=keras.optimizers.AdamW(learning_rate=LEARNING_RATE))
 
@@ -141,26 +335,9 @@ async def train_model(db: AsyncSession):
         logger.info(
             f"Building model with dummy input shape: (1, {settings.MAX_CONTEXT_LENGTH})"
         )
-        model(tf.zeros((1, settings.MAX_CONTEXT_LENGTH), dtype=tf.int32))
+        model(np.zeros((1, settings.MAX_CONTEXT_LENGTH), dtype=np.int32))
         logger.info("Model built successfully.")
     except Exception as e:
         logger.error(f"Error building model: {e}", exc_info=True)
-        return
-
-    logger.info("Starting model training...")
-    try:
-        fit_kwargs = {"validation_data": val_ds} if val_ds else {}
-        history = model.fit(train_ds, epochs=NUM_EPOCHS, verbose=1, **fit_kwargs)
-        logger.info(f"Model training completed. History: {history.history}")
-    except Exception as e:
-        logger.error(f"Error during model training: {e}", exc_info=True)
-        return
-
-    model_path = settings.MODEL_PATH
-    try:
-        logger.info(f"Saving trained model to {model_path}...")
-        os.makedirs(os.path.dirname(model_path), exist_ok=True)
-        model.save(model_path)
-        logger.info(f"Model saved successfully.")
-    except Exception as e:
-        logger.error(f"Error saving model: {e}", exc_info=True)
+        return None
+    return model
@@ -0,0 +1,258 @@
+"""Columnar cache of the filtered training ratings and their examples.
+
+Extracting every rating and rebuilding every example dominates a training run
+on a large ratings table. The cache keeps them as .npy columns in a directory
+under models_store/training-data/, named after the ratings high-water mark
+(max rating id, max timestamp) it was built from:
+
+- users / movies / timestamps: the ratings that passed MIN_RATING_FILTER;
+- example_users / contexts / labels: the examples built from them, in raw
+  movie ids (vocabulary rows change between runs).
+
+The next run only fetches ratings above the cached max id. It regenerates the
+examples of the users those ratings belong to, plus users whose old ratings
+left the TRAINING_LOOKBACK_DAYS window, and reuses all other examples.
+
+Ratings are insert-only, so the cache is also checked against the row count:
+if ratings were deleted (e.g. an archived partition) or committed late with a
+lower id, the counts no longer add up and the cache is rebuilt.
+"""
+
+import json
+import logging
+import os
+import shutil
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.db import crud
+from app.db.partitions import lookback_start_timestamp
+from app.services.recommender.instrumentation import TrainingRun
+from app.services.recommender.preprocessing import (
+    MAX_CONTEXT_LENGTH,
+    MIN_RATING_FILTER,
+    MIN_SEQUENCE_LENGTH,
+    generate_examples_parallel,
+)
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR = Path(settings.MODEL_PATH).parent / "training-data"
+CACHE_FORMAT = 1
+_CURRENT = "current"
+_COLUMNS = ("users", "movies", "timestamps", "example_users", "contexts", "labels")
+
+
+class TrainingData:
+    """Filtered ratings and the examples built from them (raw movie ids)."""
+
+    def __init__(
+        self,
+        users: np.ndarray,
+        movies: np.ndarray,
+        timestamps: np.ndarray,
+        example_users: np.ndarray,
+        contexts: np.ndarray,
+        labels: np.ndarray,
+    ):
+        self.users = users
+        self.movies = movies
+        self.timestamps = timestamps
+        self.example_users = example_users
+        self.contexts = contexts
+        self.labels = labels
+
+    @classmethod
+    def from_ratings(
+        cls, users: np.ndarray, movies: np.ndarray, timestamps: np.ndarray
+    ) -> "TrainingData":
+        examples = generate_examples_parallel(
+            users, movies, timestamps, scratch_dir=CACHE_DIR
+        )
+        return cls(users, movies, timestamps, *examples)
+
+
+def _params() -> Dict[str, Any]:
+    """Settings the cached columns depend on; a change invalidates the cache."""
+    return {
+        "format": CACHE_FORMAT,
+        "min_rating": MIN_RATING_FILTER,
+        "context_length": MAX_CONTEXT_LENGTH,
+        "min_sequence_length": MIN_SEQUENCE_LENGTH,
+        "lookback_days": settings.TRAINING_LOOKBACK_DAYS,
+    }
+
+
+class TrainingDataCache:
+    """Versioned .npy snapshots of TrainingData; only the latest is kept."""
+
+    def __init__(self, root: Path = CACHE_DIR):
+        self.root = root
+
+    def load(self) -> Optional[Tuple[Dict[str, Any], TrainingData]]:
+        """(meta, memory-mapped data) of the current snapshot, if still valid."""
+        pointer = self.root / _CURRENT
+        if not pointer.exists():
+            return None
+        path = self.root / pointer.read_text().strip()
+        try:
+            meta = json.loads((path / "meta.json").read_text())
+            if meta.get("params") != _params():
+                logger.info("Training data cache built with other settings.")
+                return None
+            columns = [
+                np.load(path / f"{name}.npy", mmap_mode="r") for name in _COLUMNS
+            ]
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not load the training data cache: {e}")
+            return None
+        return meta, TrainingData(*columns)
+
+    def save(self, meta: Dict[str, Any], data: TrainingData) -> None:
+        """Writes a new snapshot directory, then points `current` at it."""
+        name = f"{meta['max_id']}-{meta['max_timestamp']}"
+        path = self.root / name
+        tmp_path = self.root / f".tmp-{name}"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        tmp_path.mkdir(parents=True)
+        for column in _COLUMNS:
+            np.save(tmp_path / f"{column}.npy", getattr(data, column))
+        (tmp_path / "meta.json").write_text(json.dumps({**meta, "params": _params()}))
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(tmp_path, path)
+
+        pointer_tmp = self.root / f".{_CURRENT}.tmp"
+        pointer_tmp.write_text(name)
+        os.replace(pointer_tmp, self.root / _CURRENT)
+        # Readers that mapped an older snapshot keep their (unlinked) files
+        for other in self.root.iterdir():
+            if other.is_dir() and other.name != name:
+                shutil.rmtree(other, ignore_errors=True)
+        logger.info(f"Training data cache saved to {path}.")
+
+
+def _rating_columns(rows: Any) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """(users, movies, timestamps) of the rows passing MIN_RATING_FILTER."""
+    table = np.array(rows, dtype=np.float64).reshape(-1, 4)
+    table = table[table[:, 2] >= MIN_RATING_FILTER]
+    return (
+        table[:, 0].astype(np.int32),
+        table[:, 1].astype(np.int32),
+        table[:, 3].astype(np.int64),
+    )
+
+
+async def load_training_data(
+    db: AsyncSession, run: TrainingRun, use_cache: bool = settings.TRAINING_DATA_CACHE
+) -> TrainingData:
+    """Filtered ratings and examples, fetching only ratings the cache lacks."""
+    run.stage("extract")
+    # With TRAINING_LOOKBACK_DAYS set, only recent ratings (partitions) are scanned
+    since_timestamp = lookback_start_timestamp(settings.TRAINING_LOOKBACK_DAYS)
+    fingerprint = await crud.rating.get_fingerprint(db)
+    cache = TrainingDataCache()
+    cached = cache.load() if use_cache else None
+    if cached is not None:
+        meta, data = cached
+        added = await crud.rating.count_since_id(db, after_id=meta["max_id"])
+        if meta["count"] + added != fingerprint["count"]:
+            logger.info("Ratings were removed since the cache was built; rebuilding.")
+            cached = None
+        elif added == 0:
+            logger.info(f"Training data cache is up to date ({meta['max_id']}).")
+            run.count(0)
+            return _drop_expired(data, since_timestamp)
+
+    after_id = cached[0]["max_id"] if cached else 0
+    # Bounded by the fingerprint, so the new key matches what was fetched
+    rows = await crud.rating.get_training_columns(
+        db,
+        after_id=after_id,
+        max_id=fingerprint["max_id"],
+        since_timestamp=since_timestamp,
+    )
+    run.count(len(rows))
+    logger.info(f"Fetched {len(rows)} ratings with id > {after_id}.")
+
+    run.stage("examples")
+    users, movies, timestamps = _rating_columns(rows)
+    del rows
+    if cached is None:
+        data = TrainingData.from_ratings(users, movies, timestamps)
+        run.count(len(users))
+    else:
+        data, regenerated = _merge(
+            cached[1], users, movies, timestamps, since_timestamp
+        )
+        run.count(regenerated)
+        logger.info(f"Rebuilt the examples of affected users ({regenerated} ratings).")
+
+    if use_cache:
+        try:
+            cache.save(
+                {
+                    "max_id": fingerprint["max_id"],
+                    "max_timestamp": fingerprint["max_timestamp"],
+                    "count": fingerprint["count"],
+                },
+                data,
+            )
+        except OSError as e:
+            logger.warning(f"Could not save the training data cache: {e}")
+    return data
+
+
+def _expired(data: TrainingData, since_timestamp: Optional[int]) -> np.ndarray:
+    if since_timestamp is None:
+        return np.zeros(len(data.users), dtype=bool)
+    return np.asarray(data.timestamps) < since_timestamp
+
+
+def _drop_expired(data: TrainingData, since_timestamp: Optional[int]) -> TrainingData:
+    """Removes ratings that left the lookback window, if any."""
+    expired = _expired(data, since_timestamp)
+    if not expired.any():
+        return data
+    empty = np.zeros(0, dtype=np.int32)
+    return _merge(data, empty, empty, empty.astype(np.int64), since_timestamp)[0]
+
+
+def _merge(
+    cached: TrainingData,
+    users: np.ndarray,
+    movies: np.ndarray,
+    timestamps: np.ndarray,
+    since_timestamp: Optional[int],
+) -> Tuple[TrainingData, int]:
+    """Appends new ratings and regenerates the examples of the users they touch.
+
+    Returns the merged data and the number of ratings examples were rebuilt from.
+    """
+    expired = _expired(cached, since_timestamp)
+    affected = np.union1d(users, np.asarray(cached.users)[expired])
+    kept = ~expired
+    all_users = np.concatenate([cached.users[kept], users])
+    all_movies = np.concatenate([cached.movies[kept], movies])
+    all_timestamps = np.concatenate([cached.timestamps[kept], timestamps])
+
+    rebuild = np.isin(all_users, affected)
+    example_users, contexts, labels = generate_examples_parallel(
+        all_users[rebuild],
+        all_movies[rebuild],
+        all_timestamps[rebuild],
+        scratch_dir=CACHE_DIR,
+    )
+    reused = ~np.isin(cached.example_users, affected)
+    merged = TrainingData(
+        all_users,
+        all_movies,
+        all_timestamps,
+        np.concatenate([cached.example_users[reused], example_users]),
+        np.concatenate([cached.contexts[reused], contexts]),
+        np.concatenate([cached.labels[reused], labels]),
+    )
+    return merged, int(rebuild.sum())
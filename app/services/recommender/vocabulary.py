@@ -0,0 +1,157 @@
+"""Dense movie vocabulary: internal Movie.id <-> embedding row.
+
+Embedding tables have one row per movie in the vocabulary plus two reserved
+rows, so their size follows the number of trainable movies rather than the
+largest Movie.id:
+
+- row 0 (PAD_ROW) pads short contexts;
+- row 1 (OOV_ROW) is shared by movies outside the vocabulary (unseen in
+  training, or under VOCAB_MIN_COUNT); it is never recommended.
+
+Movies are stored sorted by id, so lookups are a binary search. The vocabulary
+is saved next to the model and tagged with the model version like the other
+artifacts (see artifacts.py).
+
+Models trained before the vocabulary existed have no such artifact: their
+row is the Movie.id itself, which IdentityVocabulary reproduces.
+"""
+
+import logging
+from typing import Any, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from app.core.config import settings
+from app.services.recommender.artifacts import (
+    artifact_path,
+    load_versioned_npz,
+    save_npz_atomic,
+)
+
+logger = logging.getLogger(__name__)
+
+VOCABULARY_ARTIFACT = "vocabulary.npz"
+PAD_ROW = 0
+OOV_ROW = 1
+NUM_RESERVED_ROWS = 2
+
+
+class MovieVocabulary:
+    """Maps internal movie ids to embedding rows and back."""
+
+    # Lowest row holding a movie
+    first_row = NUM_RESERVED_ROWS
+
+    def __init__(self, movie_ids: np.ndarray):
+        self.movie_ids = np.unique(np.asarray(movie_ids, dtype=np.int64))
+
+    def __len__(self) -> int:
+        """Number of embedding rows, reserved rows included."""
+        return len(self.movie_ids) + NUM_RESERVED_ROWS
+
+    @classmethod
+    def from_ratings(
+        cls,
+        rated_movie_ids: np.ndarray,
+        min_count: int = settings.VOCAB_MIN_COUNT,
+        max_size: int = settings.VOCAB_MAX_SIZE,
+    ) -> "MovieVocabulary":
+        """Vocabulary of the movies rated at least `min_count` times.
+
+        With `max_size` > 0 only the most rated movies are kept.
+        """
+        movie_ids, counts = np.unique(
+            np.asarray(rated_movie_ids, dtype=np.int64), return_counts=True
+        )
+        keep = (counts >= max(min_count, 1)) & (movie_ids > 0)
+        movie_ids, counts = movie_ids[keep], counts[keep]
+        if max_size > 0 and len(movie_ids) > max_size:
+            movie_ids = movie_ids[np.argsort(-counts, kind="stable")[:max_size]]
+        return cls(movie_ids)
+
+    def lookup(self, movie_ids: Any) -> np.ndarray:
+        """Rows for movie ids (any shape); 0 stays padding, unknown ids -> OOV."""
+        ids = np.asarray(movie_ids, dtype=np.int64)
+        positions = np.searchsorted(self.movie_ids, ids)
+        positions = np.minimum(positions, max(len(self.movie_ids) - 1, 0))
+        found = (
+            self.movie_ids[positions] == ids
+            if len(self.movie_ids)
+            else np.zeros(ids.shape, dtype=bool)
+        )
+        rows = np.where(found, positions + NUM_RESERVED_ROWS, OOV_ROW)
+        return np.where(ids == 0, PAD_ROW, rows).astype(np.int32)
+
+    def row(self, movie_id: int) -> Optional[int]:
+        """Row of one movie, or None if it is not in the vocabulary."""
+        row = int(self.lookup([movie_id])[0])
+        return row if row >= NUM_RESERVED_ROWS else None
+
+    def movie_id(self, row: int) -> Optional[int]:
+        """Movie id of a row, or None for reserved and out-of-range rows."""
+        if not NUM_RESERVED_ROWS <= row < len(self):
+            return None
+        return int(self.movie_ids[row - NUM_RESERVED_ROWS])
+
+    def rekey(self, items: Iterable[Tuple[Any, ...]]) -> List[Tuple[Any, ...]]:
+        """(movie_id, ...) tuples re-keyed by row; other movies are dropped."""
+        items = list(items)
+        if not items:
+            return []
+        rows = self.lookup([item[0] for item in items])
+        return [
+            (int(row), *item[1:])
+            for row, item in zip(rows, items)
+            if row >= NUM_RESERVED_ROWS
+        ]
+
+    def save(self, model_version: str) -> None:
+        path = artifact_path(VOCABULARY_ARTIFACT)
+        save_npz_atomic(
+            path, movie_ids=self.movie_ids, model_version=np.array(model_version)
+        )
+        logger.info(f"Vocabulary of {len(self.movie_ids)} movies saved to {path}.")
+
+    @classmethod
+    def load(cls, model_version: Optional[str]) -> Optional["MovieVocabulary"]:
+        """The vocabulary saved for `model_version`, if there is one."""
+        artifact = load_versioned_npz(artifact_path(VOCABULARY_ARTIFACT), model_version)
+        if artifact is None:
+            return None
+        return cls(artifact["movie_ids"])
+
+
+class IdentityVocabulary(MovieVocabulary):
+    """Rows of a legacy model: row = Movie.id for ids 1..movies_count.
+
+    Row 0 pads and there is no OOV row; ids outside the table become padding,
+    so they are ignored in contexts.
+    """
+
+    first_row = 1
+
+    def __init__(self, movies_count: int):
+        super().__init__(np.arange(1, movies_count + 1))
+        self.movies_count = movies_count
+
+    def __len__(self) -> int:
+        return self.movies_count + 1
+
+    def lookup(self, movie_ids: Any) -> np.ndarray:
+        ids = np.asarray(movie_ids, dtype=np.int64)
+        return np.where((ids > 0) & (ids <= self.movies_count), ids, PAD_ROW).astype(
+            np.int32
+        )
+
+    def row(self, movie_id: int) -> Optional[int]:
+        return movie_id if 0 < movie_id <= self.movies_count else None
+
+    def movie_id(self, row: int) -> Optional[int]:
+        return int(row) if 0 < row <= self.movies_count else None
+
+    def rekey(self, items: Iterable[Tuple[Any, ...]]) -> List[Tuple[Any, ...]]:
+        return [
+            (int(item[0]), *item[1:])
+            for item in items
+            if 0 < item[0] <= self.movies_count
+        ]
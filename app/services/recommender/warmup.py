@@ -0,0 +1,131 @@
+"""Shape-bucketed inference for the query tower, warmed up before serving.
+
+Every inference batch is padded up to the nearest configured bucket size
+(WARMUP_BATCH_SIZES), so only those shapes ever reach the model. On the
+TensorFlow backend each bucket is a concrete `tf.function` with a fixed input
+signature (optionally XLA-compiled with WARMUP_JIT_COMPILE), traced during
+warm-up. On JAX and PyTorch the query tower runs through Keras' predict
+function, which WARMUP_JIT_COMPILE turns into jax.jit / torch.compile, one
+compilation per bucket shape. Requests therefore never trigger tracing or
+compilation.
+
+Batches larger than the biggest bucket are split into chunks of that size.
+Query models that run outside Keras (e.g. the registry's numpy GRU) declare
+`backend = "numpy"` and are simply called, so Keras is never imported for them.
+"""
+
+import logging
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def _keras_backend() -> str:
+    import keras
+
+    return keras.backend.backend()
+
+
+def _to_numpy(value: Any) -> np.ndarray:
+    if isinstance(value, np.ndarray):
+        return value
+    import keras
+
+    return keras.ops.convert_to_numpy(value)
+
+
+def parse_buckets(spec: str) -> List[int]:
+    """Parses "1,8,32" into sorted, unique, positive bucket sizes."""
+    buckets = sorted({int(item) for item in spec.split(",") if item.strip()})
+    buckets = [bucket for bucket in buckets if bucket > 0]
+    return buckets or [1]
+
+
+class BucketedQueryFunction:
+    """Runs the query tower on batches padded to a fixed set of batch sizes."""
+
+    def __init__(
+        self,
+        query_model: Any,
+        context_length: int = settings.MAX_CONTEXT_LENGTH,
+        buckets: Optional[List[int]] = None,
+        jit_compile: bool = settings.WARMUP_JIT_COMPILE,
+    ):
+        self.query_model = query_model
+        self.context_length = context_length
+        self.buckets = buckets or parse_buckets(settings.WARMUP_BATCH_SIZES)
+        self.jit_compile = jit_compile
+        self.backend = getattr(query_model, "backend", None) or _keras_backend()
+        self._functions: Dict[int, Callable] = {}
+        self._compiled = False
+
+    def _trace(self, bucket: int) -> Callable:
+        if self.backend == "numpy":
+            # Runs eagerly; warm-up still primes the allocator and mapped
+            # pages for each bucket shape.
+            return lambda context: self.query_model(context, training=False)
+        if self.backend != "tensorflow":
+            if not self._compiled:
+                self.query_model.compile(jit_compile=self.jit_compile)
+                self._compiled = True
+            return self.query_model.predict_on_batch
+
+        import tensorflow as tf
+
+        function = tf.function(
+            lambda context: self.query_model(context, training=False),
+            jit_compile=self.jit_compile,
+        )
+        concrete = function.get_concrete_function(
+            tf.TensorSpec([bucket, self.context_length], tf.int32)
+        )
+        return lambda context: concrete(tf.constant(context, dtype=tf.int32))
+
+    def _run(self, bucket: int, context: np.ndarray) -> np.ndarray:
+        function = self._functions.get(bucket)
+        if function is None:
+            logger.warning(f"Tracing query function for batch {bucket} on demand.")
+            function = self._functions[bucket] = self._trace(bucket)
+        return _to_numpy(function(context))
+
+    def bucket_for(self, batch_size: int) -> int:
+        for bucket in self.buckets:
+            if bucket >= batch_size:
+                return bucket
+        return self.buckets[-1]
+
+    def __call__(self, context: np.ndarray) -> np.ndarray:
+        """(batch, context_length) int32 ids -> (batch, dim) query embeddings."""
+        largest = self.buckets[-1]
+        outputs = []
+        for start in range(0, len(context), largest):
+            chunk = context[start : start + largest]
+            bucket = self.bucket_for(len(chunk))
+            padded = np.zeros((bucket, self.context_length), dtype=np.int32)
+            padded[: len(chunk)] = chunk
+            outputs.append(self._run(bucket, padded)[: len(chunk)])
+        return np.concatenate(outputs, axis=0)
+
+    def warm_up(self) -> Dict[str, Any]:
+        """Traces (and compiles) every bucket and runs it once, with timings."""
+        started = time.perf_counter()
+        bucket_ms = {}
+        for bucket in self.buckets:
+            bucket_started = time.perf_counter()
+            self._functions[bucket] = self._trace(bucket)
+            self._run(bucket, np.zeros((bucket, self.context_length), dtype=np.int32))
+            elapsed_ms = 1000.0 * (time.perf_counter() - bucket_started)
+            bucket_ms[bucket] = round(elapsed_ms, 1)
+        report = {
+            "backend": self.backend,
+            "jit_compile": self.jit_compile and self.backend != "numpy",
+            "buckets_ms": bucket_ms,
+            "total_ms": round(1000.0 * (time.perf_counter() - started), 1),
+        }
+        logger.info(f"Query function warm-up finished: {report}")
+        return report
@@ -2,7 +2,6 @@ from celery import Celery
 from celery.schedules import crontab
 
 from app.core.config import settings
-from app.db.session import AsyncSessionLocal
 
 # Initialize Celery
 celery_app = Celery(
@@ -14,12 +13,34 @@ celery_app = Celery(
 
 celery_app.conf.task_track_started = True
 celery_app.conf.timezone = "Asia/Tokyo"
+# Late-acked tasks (training) are redelivered when not acked within this
+# window, so it must outlast the longest training run. A run that starts before
+# a dead run is redelivered resumes its checkpoints (see checkpoints.prepare)
+celery_app.conf.broker_transport_options = {
+    "visibility_timeout": settings.TRAINING_LOCK_TIMEOUT_SECONDS
+}
 
 # Celery Beat Schedule
-# This will trigger the training task every day at midnight JST.
+# Training goes through the scheduler (app/worker/scheduler.py): the midnight
+# check retrains if any rating changed, the frequent check retrains early once
+# RETRAIN_MIN_NEW_RATINGS new ratings have accumulated.
 celery_app.conf.beat_schedule = {
     "retrain-recommendation-model-midnight": {
-        "task": "app.worker.tasks.train_recommendation_model_task",
+        "task": "app.worker.tasks.check_training_trigger_task",
         "schedule": crontab(minute="0", hour="0"),  # Every midnight
+        "kwargs": {"min_new_ratings": 1},
+    },
+    # Keeps monthly rating partitions ahead of time and archives expired ones.
+    # No-op unless the ratings table is partitioned.
+    "maintain-rating-partitions-daily": {
+        "task": "app.worker.tasks.maintain_rating_partitions_task",
+        "schedule": crontab(minute="30", hour="23"),
     },
 }
+
+if settings.RETRAIN_MIN_NEW_RATINGS > 0:
+    celery_app.conf.beat_schedule["retrain-recommendation-model-on-new-ratings"] = {
+        "task": "app.worker.tasks.check_training_trigger_task",
+        "schedule": settings.RETRAIN_CHECK_MINUTES * 60,
+        "kwargs": {"min_new_ratings": settings.RETRAIN_MIN_NEW_RATINGS},
+    }
@@ -0,0 +1,268 @@
+"""Consumer-group worker that applies rating events to derived state.
+
+Usage:
+    python -m app.worker.rating_events consume         # run forever
+    python -m app.worker.rating_events lag             # print consumer lag
+    python -m app.worker.rating_events replay --reset  # rebuild derived state
+    python -m app.worker.rating_events replay <id>     # add missed events
+    python -m app.worker.rating_events seek <id>       # move the group offset
+"""
+
+import asyncio
+import logging
+import socket
+import sys
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+import redis.asyncio as aioredis
+from redis.exceptions import ResponseError
+
+from app.core.config import settings
+from app.services.derived_state import DEFAULT_HANDLERS, reset_derived_state
+from app.services.events import decode_rating_event, get_redis
+
+logger = logging.getLogger(__name__)
+
+EventHandler = Callable[[aioredis.Redis, List[Dict[str, Any]]], Awaitable[None]]
+
+# Stream id of the last event each handler applied
+HANDLED_KEY = "rating_events:handled:{handler}"
+
+
+def _stream_id(event_id: str) -> Tuple[int, int]:
+    milliseconds, _, sequence = event_id.partition("-")
+    return int(milliseconds), int(sequence or 0)
+
+
+class RatingEventConsumer:
+    """Reads rating events in batches through a Redis consumer group.
+
+    Events are acknowledged only after every handler has applied the batch.
+    Unacknowledged events (a crashed consumer, a failed handler) are reclaimed
+    before any new event is read; after max_deliveries attempts an event is
+    logged and dropped.
+
+    Each handler keeps a high-water mark, the stream id of the last event it
+    applied, so a retried batch only reaches the handlers that had not
+    applied it yet. That relies on events being applied in stream order, so
+    run one consumer per group.
+    """
+
+    def __init__(
+        self,
+        redis: aioredis.Redis,
+        handlers: Sequence[EventHandler] = DEFAULT_HANDLERS,
+        stream: str = settings.RATING_EVENTS_STREAM,
+        group: str = settings.RATING_EVENTS_GROUP,
+        consumer_name: Optional[str] = None,
+        batch_size: int = settings.RATING_EVENTS_BATCH_SIZE,
+        block_ms: int = 5000,
+        max_deliveries: int = settings.RATING_EVENTS_MAX_DELIVERIES,
+    ):
+        self.redis = redis
+        self.handlers = list(handlers)
+        self.stream = stream
+        self.group = group
+        self.consumer_name = consumer_name or socket.gethostname()
+        self.batch_size = batch_size
+        self.block_ms = block_ms
+        self.max_deliveries = max_deliveries
+
+    async def ensure_group(self, start_id: str = "0") -> None:
+        try:
+            await self.redis.xgroup_create(
+                self.stream, self.group, id=start_id, mkstream=True
+            )
+            logger.info(f"Created consumer group {self.group} on {self.stream}.")
+        except ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    async def _apply(self, entries: List) -> int:
+        events = [decode_rating_event(event_id, fields) for event_id, fields in entries]
+        if not events:
+            return 0
+        for handler in self.handlers:
+            key = HANDLED_KEY.format(handler=handler.__name__)
+            handled = await self.redis.get(key)
+            pending = events
+            if handled is not None:
+                mark = _stream_id(handled)
+                pending = [e for e in events if _stream_id(e["event_id"]) > mark]
+            if not pending:
+                continue
+            await handler(self.redis, pending)
+            await self.redis.set(
+                key, max(pending, key=lambda e: _stream_id(e["event_id"]))["event_id"]
+            )
+        return len(events)
+
+    async def _ack(self, event_ids: List[str]) -> None:
+        if event_ids:
+            await self.redis.xack(self.stream, self.group, *event_ids)
+
+    async def _drop_poisoned(self, entries: List) -> List:
+        """Acknowledges (drops) entries delivered max_deliveries times already."""
+        if not entries:
+            return entries
+        pending = await self.redis.xpending_range(
+            self.stream,
+            self.group,
+            min=entries[0][0],
+            max=entries[-1][0],
+            count=len(entries),
+        )
+        poisoned = {
+            info["message_id"]
+            for info in pending
+            if info["times_delivered"] > self.max_deliveries
+        }
+        if poisoned:
+            logger.error(
+                f"Dropping {len(poisoned)} rating events delivered more than "
+                f"{self.max_deliveries} times: {sorted(poisoned)}"
+            )
+            await self._ack(sorted(poisoned))
+        return [entry for entry in entries if entry[0] not in poisoned]
+
+    async def has_pending(self) -> bool:
+        summary = await self.redis.xpending(self.stream, self.group)
+        return bool(summary["pending"])
+
+    async def reclaim_pending(self) -> int:
+        """Takes over every pending event in the group and applies it, in order.
+
+        Covers events of dead consumers and batches whose handlers failed. The
+        XAUTOCLAIM cursor is followed until the whole pending list was scanned.
+        """
+        applied = 0
+        cursor = "0-0"
+        while True:
+            cursor, entries, *_ = await self.redis.xautoclaim(
+                self.stream,
+                self.group,
+                self.consumer_name,
+                min_idle_time=0,
+                start_id=cursor,
+                count=self.batch_size,
+            )
+            entries = [entry for entry in entries if entry and entry[1]]
+            entries = await self._drop_poisoned(entries)
+            applied += await self._apply(entries)
+            await self._ack([event_id for event_id, _ in entries])
+            if cursor in ("0-0", b"0-0"):
+                break
+        if applied:
+            logger.info(f"Reclaimed {applied} pending rating events.")
+        return applied
+
+    async def process_batch(self, block_ms: Optional[int] = None) -> int:
+        """Reads, applies and acknowledges one batch of new events.
+
+        If a handler raises, the batch stays pending and is retried by
+        reclaim_pending (run_forever does so before reading further).
+        """
+        response = await self.redis.xreadgroup(
+            self.group,
+            self.consumer_name,
+            {self.stream: ">"},
+            count=self.batch_size,
+            block=self.block_ms if block_ms is None else block_ms,
+        )
+        if not response:
+            return 0
+        _, entries = response[0]
+        applied = await self._apply(entries)
+        await self._ack([event_id for event_id, _ in entries])
+        return applied
+
+    async def lag(self) -> Dict[str, Any]:
+        """Entries not yet delivered to the group (lag) and delivered but unacked."""
+        for info in await self.redis.xinfo_groups(self.stream):
+            if info["name"] == self.group:
+                return {
+                    "stream": self.stream,
+                    "group": self.group,
+                    "lag": info.get("lag"),
+                    "pending": info.get("pending"),
+                    "last_delivered_id": info.get("last-delivered-id"),
+                }
+        return {"stream": self.stream, "group": self.group, "lag": None}
+
+    async def replay(
+        self, from_id: str = "-", to_id: str = "+", reset: bool = False
+    ) -> int:
+        """Applies a range of the stream to derived state.
+
+        Does not touch the group offset. Events at or below a handler's
+        high-water mark are skipped, so only events it never applied are added.
+        With reset, every derived key and high-water mark is deleted first and
+        the state is rebuilt from all retained events; a reset needs from_id
+        "-", since a partial replay would leave out everything before it.
+        """
+        if reset and from_id != "-":
+            raise ValueError("A reset replay must start from the first event.")
+        if reset:
+            await reset_derived_state(self.redis)
+            await reset_derived_state(self.redis, [HANDLED_KEY.format(handler="*")])
+        applied = 0
+        start = from_id
+        while True:
+            entries = await self.redis.xrange(
+                self.stream, min=start, max=to_id, count=self.batch_size
+            )
+            if not entries:
+                break
+            applied += await self._apply(entries)
+            # Exclusive start for the next page
+            start = f"({entries[-1][0]}"
+        logger.info(f"Replayed {applied} rating events from {from_id}.")
+        return applied
+
+    async def seek(self, event_id: str) -> None:
+        """Moves the group offset, so the next reads start after `event_id`."""
+        await self.redis.xgroup_setid(self.stream, self.group, event_id)
+
+    async def run_forever(self) -> None:
+        await self.ensure_group()
+        logger.info(
+            f"Consuming {self.stream} as {self.consumer_name} in group {self.group}..."
+        )
+        while True:
+            try:
+                # Older events first: the handlers' high-water marks need order
+                if await self.has_pending():
+                    await self.reclaim_pending()
+                applied = await self.process_batch()
+                if applied:
+                    logger.info(f"Applied {applied} rating events.")
+            except Exception as e:
+                logger.error(f"Error while consuming rating events: {e}", exc_info=True)
+                await asyncio.sleep(1)
+
+
+async def _main(argv: List[str]) -> None:
+    consumer = RatingEventConsumer(get_redis())
+    command = argv[0] if argv else "consume"
+    if command == "consume":
+        await consumer.run_forever()
+    elif command == "lag":
+        await consumer.ensure_group()
+        print(await consumer.lag())
+    elif command == "replay":
+        if argv[1:] == ["--reset"]:
+            await consumer.replay(reset=True)
+        elif len(argv) == 2:
+            await consumer.replay(argv[1])
+        else:
+            raise SystemExit(__doc__)
+    elif command == "seek":
+        await consumer.ensure_group()
+        await consumer.seek(argv[1])
+    else:
+        raise SystemExit(f"Unknown command: {command}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_main(sys.argv[1:]))
@@ -0,0 +1,214 @@
+"""Data-change-aware training scheduler.
+
+- Every trigger (nightly beat, the early new-ratings check, the API) goes
+  through request_training(). A Redis "pending" key collapses triggers into
+  one queued run: while a run is queued, further triggers return its task id.
+- The training task holds a Redis lock, so only one training runs at a time.
+  A queued run that finds the lock taken retries later instead of overlapping.
+  The holder renews the lock from a heartbeat thread, so it outlives any run
+  and expires TRAINING_LOCK_TTL_SECONDS after the holder died.
+- A redelivered run (same task id) gets the lock only once its previous
+  holder stopped heartbeating, then resumes from its checkpoints (see
+  recommender/checkpoints.py). A redelivery that overlaps a run still in
+  progress waits like any other run.
+- After a successful run the ratings fingerprint (count, max timestamp,
+  max id) is stored. Scheduled runs whose fingerprint is unchanged are
+  skipped. The early check enqueues a run once RETRAIN_MIN_NEW_RATINGS
+  ratings were added since the last model.
+"""
+
+import logging
+import os
+import threading
+import uuid
+from typing import Any, Dict, Optional, Tuple
+
+import redis.asyncio as aioredis
+from redis import Redis as SyncRedis
+from redis.exceptions import RedisError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.db import crud
+from app.services.events import get_redis
+from app.worker.celery_app import celery_app
+
+logger = logging.getLogger(__name__)
+
+TRAIN_TASK = "app.worker.tasks.train_recommendation_model_task"
+LOCK_KEY = "training:lock"
+PENDING_KEY = "training:pending"
+FINGERPRINT_KEY = "training:fingerprint"
+
+# Deletes the lock only if it is still ours (it may have expired and been
+# taken by another run meanwhile)
+_RELEASE_LOCK = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+# Extends the lock only if it is still ours
+_RENEW_LOCK = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("expire", KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+
+async def get_trained_fingerprint(
+    redis: Optional[aioredis.Redis] = None,
+) -> Optional[Dict[str, int]]:
+    """Fingerprint of the ratings the current model was trained on."""
+    stored = await (redis or get_redis()).hgetall(FINGERPRINT_KEY)
+    if not stored:
+        return None
+    return {name: int(value) for name, value in stored.items()}
+
+
+async def set_trained_fingerprint(
+    fingerprint: Dict[str, int], redis: Optional[aioredis.Redis] = None
+) -> None:
+    await (redis or get_redis()).hset(FINGERPRINT_KEY, mapping=fingerprint)
+
+
+async def new_ratings_since_training(db: AsyncSession) -> Tuple[bool, int]:
+    """(ratings changed at all, ratings added) since the last trained model."""
+    trained = await get_trained_fingerprint()
+    current = await crud.rating.get_fingerprint(db)
+    if trained is None:
+        return current["count"] > 0, current["count"]
+    added = await crud.rating.count_since_id(db, after_id=trained["max_id"])
+    return current != trained, added
+
+
+async def request_training(
+    force: bool = False, workers: Optional[int] = None
+) -> Tuple[str, bool]:
+    """Enqueues a training run unless one is already queued.
+
+    Returns (task_id, created); created is False when the trigger was folded
+    into the run that is already queued (which keeps its own options).
+    `workers` is clamped to 1..cpu_count.
+    """
+    if workers is not None:
+        workers = max(1, min(workers, os.cpu_count() or 1))
+    redis = get_redis()
+    task_id = str(uuid.uuid4())
+    # Queued runs can wait behind a running one for up to the lock timeout
+    created = await redis.set(
+        PENDING_KEY, task_id, nx=True, ex=settings.TRAINING_LOCK_TIMEOUT_SECONDS * 2
+    )
+    if not created:
+        pending_id = await redis.get(PENDING_KEY)
+        if pending_id:
+            logger.info(f"Training already queued as {pending_id}; trigger folded.")
+            return pending_id, False
+        # The pending run started between SET and GET; queue a new one
+        await redis.set(
+            PENDING_KEY, task_id, ex=settings.TRAINING_LOCK_TIMEOUT_SECONDS * 2
+        )
+    celery_app.send_task(
+        TRAIN_TASK, kwargs={"force": force, "workers": workers}, task_id=task_id
+    )
+    logger.info(f"Queued training run {task_id} (force={force}, workers={workers}).")
+    return task_id, True
+
+
+async def check_for_new_ratings(db: AsyncSession, min_new_ratings: int) -> Any:
+    """Beat entry point: queues a run when enough ratings changed.
+
+    min_new_ratings=1 (the nightly run) retrains on any change.
+    """
+    changed, added = await new_ratings_since_training(db)
+    if not changed or added < min_new_ratings:
+        logger.info(
+            f"Training not needed: changed={changed}, {added} new ratings "
+            f"(threshold {min_new_ratings})."
+        )
+        return None
+    task_id, _ = await request_training()
+    return task_id
+
+
+async def acquire_training_lock(token: Optional[str] = None) -> Optional[str]:
+    """Returns a lock token, or None if a training run holds the lock.
+
+    Keep the lock with a TrainingLockHeartbeat. The lock outlives its holder
+    by at most TRAINING_LOCK_TTL_SECONDS, so a task redelivered after its
+    worker died (same task id) gets it back shortly; while the holder is
+    alive, even the same token is refused.
+    """
+    token = token or str(uuid.uuid4())
+    acquired = await get_redis().set(
+        LOCK_KEY, token, nx=True, ex=settings.TRAINING_LOCK_TTL_SECONDS
+    )
+    return token if acquired else None
+
+
+class TrainingLockHeartbeat:
+    """Renews the training lock every TRAINING_LOCK_HEARTBEAT_SECONDS while open.
+
+    Runs in a thread with its own client, since fit blocks the event loop
+    for whole epochs.
+    """
+
+    def __init__(
+        self,
+        token: str,
+        redis: Optional[SyncRedis] = None,
+        interval: float = settings.TRAINING_LOCK_HEARTBEAT_SECONDS,
+    ):
+        self.token = token
+        self.redis = redis or SyncRedis.from_url(
+            settings.REDIS_URL, decode_responses=True, socket_connect_timeout=2
+        )
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="training-lock-heartbeat", daemon=True
+        )
+
+    def __enter__(self) -> "TrainingLockHeartbeat":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        renew = self.redis.register_script(_RENEW_LOCK)
+        while not self._stop.wait(self.interval):
+            try:
+                renewed = renew(
+                    keys=[LOCK_KEY],
+                    args=[self.token, settings.TRAINING_LOCK_TTL_SECONDS],
+                )
+            except RedisError as e:
+                logger.warning(f"Could not renew the training lock: {e}")
+                continue
+            if not renewed:
+                logger.error("Training lock expired; another run may start.")
+
+
+async def release_training_lock(token: str) -> None:
+    await get_redis().eval(_RELEASE_LOCK, 1, LOCK_KEY, token)
+
+
+async def clear_pending(task_id: Optional[str]) -> None:
+    """Lets new triggers queue a fresh run once this one has started."""
+    redis = get_redis()
+    if task_id and await redis.get(PENDING_KEY) == task_id:
+        await redis.delete(PENDING_KEY)
+
+
+async def get_training_status() -> Dict[str, Any]:
+    redis = get_redis()
+    return {
+        "running": bool(await redis.exists(LOCK_KEY)),
+        "pending_task_id": await redis.get(PENDING_KEY),
+        "trained_fingerprint": await get_trained_fingerprint(redis),
+    }
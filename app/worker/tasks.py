@@ -1,34 +1,18 @@
 import asyncio
 import logging
+from typing import Optional
 
-from app.db.session import AsyncSessionLocal
-from app.services.recommender.train import train_model
+from app.core.config import settings
 from app.worker.celery_app import celery_app
 
-logger = logging.getLogger(__name__)
-
-
-@celery_app.task(name="app.worker.tasks.train_recommendation_model_task")
-def train_recommendation_model_task():
-    """
-    Celery task to trigger the recommendation model training.
-    This task is synchronous from Celery's perspective, but it runs an async function.
-    """
-    logger.info("Received task: train_recommendation_model_task")
+# Task dependencies (the training stack in particular) are imported inside the
+# task bodies: beat and the API import this module only to reference tasks.
 
-    async def _run_training():
-        async with AsyncSessionLocal() as db:
-            try:
-                await train_model(db)
-                logger.info("train_recommendation_model_task completed successfully.")
-            except Exception as e:
-                logger.error(
-                    f"Error during train_recommendation_model_task: {e}", exc_info=True
-                )
+logger = logging.getLogger(__name__)
 
-                raise
 
-    # Run the async function within the synchronous Celery task
+def _run_async(coro):
+    """Runs a coroutine to completion from a synchronous Celery task."""
     # For Celery 5+, asyncio.run might be okay if event loop isn't already running.
     # For older versions or to be safe:
     try:
@@ -40,7 +24,7 @@ def train_recommendation_model_task():
 
         # If running in a context where an event loop is already running (e.g. inside another async framework like FastAPI),
         # this might need adjustment. For standard Celery worker process, this should be fine.
-        loop.run_until_complete(_run_training())
+        return loop.run_until_complete(coro)
     except (
         RuntimeError
     ) as e:  # Handles "Event loop is closed" or "There is no current event loop"
@@ -51,17 +35,134 @@ def train_recommendation_model_task():
             logger.info(
                 "No current event loop or loop closed, creating a new one for the task."
             )
-            asyncio.run(_run_training())
-        else:
-            logger.error(
-                f"RuntimeError in train_recommendation_model_task: {e}", exc_info=True
+            return asyncio.run(coro)
+        logger.error(f"RuntimeError while running async task: {e}", exc_info=True)
+        raise
+
+
+@celery_app.task(
+    bind=True,
+    name="app.worker.tasks.train_recommendation_model_task",
+    max_retries=None,
+    # Acked only once done, so a run whose worker died is redelivered and
+    # resumes from its checkpoints
+    acks_late=True,
+    reject_on_worker_lost=True,
+)
+def train_recommendation_model_task(
+    self, force: bool = False, workers: Optional[int] = None
+):
+    """
+    Celery task to trigger the recommendation model training.
+    This task is synchronous from Celery's perspective, but it runs an async function.
+
+    Only one run trains at a time (see app/worker/scheduler.py); a run that
+    finds another one training is retried later. Unless `force` is set, the
+    run is skipped when the ratings haven't changed since the last model.
+    Stage timings and epoch progress are published as PROGRESS task state and
+    returned as the task result. A redelivered run resumes from the dataset
+    snapshot and epoch checkpoints of its task id. `workers` > 1 trains
+    data-parallel over that many local processes (default TRAINING_WORKERS).
+    """
+    from app.db import crud
+    from app.db.session import AsyncSessionLocal
+    from app.services.recommender.checkpoints import TrainingCheckpoints
+    from app.services.recommender.instrumentation import PROGRESS_STATE, TrainingRun
+    from app.services.recommender.train import train_model
+    from app.worker import scheduler
+
+    logger.info(
+        f"Received task: train_recommendation_model_task "
+        f"(force={force}, workers={workers})"
+    )
+
+    async def _train():
+        await scheduler.clear_pending(self.request.id)
+        checkpoints = TrainingCheckpoints(self.request.id)
+        checkpoints.prepare()
+        async with AsyncSessionLocal() as db:
+            # Taken before training: ratings added meanwhile count as new.
+            # A resumed run keeps the fingerprint of the data it snapshotted.
+            fingerprint = checkpoints.meta.get(
+                "fingerprint"
+            ) or await crud.rating.get_fingerprint(db)
+            trained_fingerprint = await scheduler.get_trained_fingerprint()
+            if not force and fingerprint == trained_fingerprint:
+                logger.info("Ratings unchanged since the last model. Skipping.")
+                checkpoints.clear()
+                return {"status": "unchanged"}
+            checkpoints.update_meta(fingerprint=fingerprint)
+            run = TrainingRun(
+                task_id=self.request.id,
+                report=lambda meta: self.update_state(state=PROGRESS_STATE, meta=meta),
             )
-            raise
+            try:
+                trained = await train_model(db, run, checkpoints, workers)
+                logger.info("train_recommendation_model_task completed successfully.")
+            except Exception as e:
+                logger.error(
+                    f"Error during train_recommendation_model_task: {e}",
+                    exc_info=True,
+                )
+                # Not redelivered: only a worker that died leaves a run to resume
+                checkpoints.clear()
+                raise
+        if trained:
+            await scheduler.set_trained_fingerprint(fingerprint)
+        else:
+            checkpoints.clear()
+        return run.to_dict()
+
+    async def _run_training():
+        token = await scheduler.acquire_training_lock(self.request.id)
+        if token is None:
+            return None
+        try:
+            with scheduler.TrainingLockHeartbeat(token):
+                return await _train()
+        finally:
+            await scheduler.release_training_lock(token)
+
+    # Run the async function within the synchronous Celery task
+    try:
+        outcome = _run_async(_run_training())
     except Exception as e:
         logger.error(
             f"General exception in train_recommendation_model_task: {e}", exc_info=True
         )
         raise
+    if outcome is None:
+        logger.info("Another training run holds the lock. Retrying later.")
+        raise self.retry(countdown=settings.TRAINING_LOCK_RETRY_SECONDS)
+    return outcome
+
+
+@celery_app.task(name="app.worker.tasks.check_training_trigger_task")
+def check_training_trigger_task(min_new_ratings: int = 1):
+    """
+    Celery beat task that queues a training run once at least `min_new_ratings`
+    ratings were added since the last model (1 = any change, the nightly run).
+    """
+    from app.db.session import AsyncSessionLocal
+    from app.worker.scheduler import check_for_new_ratings
+
+    async def _check():
+        async with AsyncSessionLocal() as db:
+            return await check_for_new_ratings(db, min_new_ratings)
+
+    return _run_async(_check())
+
+
+@celery_app.task(name="app.worker.tasks.maintain_rating_partitions_task")
+def maintain_rating_partitions_task():
+    """
+    Celery task that creates upcoming monthly rating partitions and detaches
+    (archives) partitions older than the retention window.
+    """
+    from app.db.partitions import maintain_rating_partitions
+
+    logger.info("Received task: maintain_rating_partitions_task")
+    return _run_async(maintain_rating_partitions())
 
 
 @celery_app.task(name="app.worker.tasks.test_celery")
@@ -0,0 +1,162 @@
+"""Training and inference performance of each Keras backend, jit on and off.
+
+Every (backend, jit) pair runs in its own spawned process, because the Keras
+backend is fixed at import. On synthetic clustered sequences
+(see benchmark_embeddings) each process:
+
+- trains SequentialRetrievalModel with compile(jit_compile=...) and reports
+  steady-state examples/s (the first epoch, with tracing, is a warm-up);
+- serves the query tower through BucketedQueryFunction, as predict.py does,
+  and reports p50 / p99 latency per batch size, for the query tower alone
+  and with top-k retrieval over the candidate table;
+- reports the process peak RSS.
+
+Backends that are not installed, or fail to train with jit, are reported
+instead of aborting the run.
+
+Usage:
+    python -m scripts.benchmark_backends [--backends tensorflow,jax,torch]
+        [--rows 50000] [--users 50000] [--epochs 3] [--batch-sizes 1,32,512]
+"""
+
+import argparse
+import multiprocessing
+import os
+import time
+from typing import Any, Dict, List
+
+import numpy as np
+
+from app.core.config import settings
+from app.services.recommender.instrumentation import peak_rss_mb
+from scripts.benchmark_embeddings import make_sequences
+
+REPEATS = 50
+
+
+def _split(value: str) -> List[str]:
+    return [part for part in value.split(",") if part]
+
+
+def _percentiles(samples: List[float]) -> str:
+    p50, p99 = np.percentile(samples, [50, 99])
+    return f"{p50:7.2f}/{p99:7.2f}"
+
+
+def run_backend(backend: str, jit: bool, args: argparse.Namespace) -> Dict[str, Any]:
+    """Runs in a fresh process whose KERAS_BACKEND is `backend`."""
+    try:
+        import keras
+    except ImportError as e:
+        return {"error": f"unavailable ({e})"}
+    if keras.backend.backend() != backend:
+        return {"error": f"keras picked {keras.backend.backend()}"}
+
+    from app.services.recommender.embeddings import embedding_table
+    from app.services.recommender.model import SequentialRetrievalModel
+    from app.services.recommender.retrieval import top_k
+    from app.services.recommender.warmup import BucketedQueryFunction
+
+    context_length = settings.MAX_CONTEXT_LENGTH
+    sequences = make_sequences(args.rows, args.users, context_length + 1)
+    contexts, labels = sequences[:, :-1], sequences[:, -1]
+    result: Dict[str, Any] = {}
+
+    model = SequentialRetrievalModel(
+        movies_count=args.rows - 1, embedding_dimension=settings.EMBEDDING_DIM
+    )
+    model.compile(
+        optimizer=keras.optimizers.AdamW(learning_rate=0.005), jit_compile=jit
+    )
+    model(np.zeros((1, context_length), dtype=np.int32))
+    try:
+        # Warm-up epoch: tracing / compilation
+        model.fit(contexts, labels, batch_size=args.batch_size, epochs=1, verbose=0)
+        started = time.perf_counter()
+        model.fit(
+            contexts,
+            labels,
+            batch_size=args.batch_size,
+            epochs=args.epochs,
+            verbose=0,
+        )
+        seconds = time.perf_counter() - started
+        result["train_examples_per_s"] = len(labels) * args.epochs / seconds
+    except Exception as e:
+        result["train_error"] = f"{type(e).__name__}: {e}"
+
+    candidates = embedding_table(model.candidate_model)
+    batch_sizes = [int(size) for size in args.batch_sizes]
+    query_function = BucketedQueryFunction(
+        model.query_model, buckets=batch_sizes, jit_compile=jit
+    )
+    try:
+        result["warm_up_ms"] = query_function.warm_up()["total_ms"]
+        latency = {}
+        for size in batch_sizes:
+            batch = contexts[:size]
+            query_ms, end_to_end_ms = [], []
+            for _ in range(REPEATS):
+                started = time.perf_counter()
+                queries = query_function(batch)
+                queried = time.perf_counter()
+                top_k(queries, candidates, 10)
+                finished = time.perf_counter()
+                query_ms.append(1000.0 * (queried - started))
+                end_to_end_ms.append(1000.0 * (finished - started))
+            latency[size] = (query_ms, end_to_end_ms)
+        result["latency"] = latency
+    except Exception as e:
+        result["inference_error"] = f"{type(e).__name__}: {e}"
+
+    result["peak_rss_mb"] = peak_rss_mb()
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--backends", type=_split, default=["tensorflow", "jax", "torch"]
+    )
+    parser.add_argument("--rows", type=int, default=50_000)
+    parser.add_argument("--users", type=int, default=50_000)
+    parser.add_argument("--epochs", type=int, default=3)
+    parser.add_argument("--batch-size", type=int, default=4096)
+    parser.add_argument("--batch-sizes", type=_split, default=["1", "32", "512"])
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context("spawn")
+    print(
+        f"{args.users} sequences, {args.rows} rows, dim {settings.EMBEDDING_DIM}; "
+        f"latency p50/p99 ms over {REPEATS} calls (query tower | with top-10)"
+    )
+    for backend in args.backends:
+        for jit in (False, True):
+            # Spawned processes inherit the environment, and config.py hands
+            # KERAS_BACKEND to Keras before its first import
+            os.environ["KERAS_BACKEND"] = backend
+            with context.Pool(1) as pool:
+                result = pool.apply(run_backend, (backend, jit, args))
+            name = f"{backend:<10} jit={'on ' if jit else 'off'}"
+            if "error" in result:
+                print(f"{name}  {result['error']}")
+                continue
+            training = (
+                f"{result['train_examples_per_s']:9.0f} examples/s"
+                if "train_examples_per_s" in result
+                else f"training failed: {result['train_error']}"
+            )
+            print(f"{name}  train {training}  peak RSS {result['peak_rss_mb']:.0f} MB")
+            if "inference_error" in result:
+                print(f"    inference failed: {result['inference_error']}")
+                continue
+            print(f"    warm-up {result['warm_up_ms']:.0f} ms")
+            for size, (query_ms, end_to_end_ms) in result["latency"].items():
+                print(
+                    f"    batch {size:>4}  {_percentiles(query_ms)} | "
+                    f"{_percentiles(end_to_end_ms)}"
+                )
+
+
+if __name__ == "__main__":
+    main()
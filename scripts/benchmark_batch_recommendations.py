@@ -0,0 +1,100 @@
+"""Throughput of POST /recommendations/batch vs. one GET per user.
+
+Runs against a running API (e.g. `docker compose up`) seeded with MovieLens
+data. Both modes request the same users, count and exclusion settings.
+
+Usage:
+    python -m scripts.benchmark_batch_recommendations \\
+        --email me@example.com --password secret --users 2000
+
+Prints users/second for each mode and the speed-up of the batch endpoint.
+"""
+
+import argparse
+import json
+import logging
+import time
+from typing import List
+
+import httpx
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def _login(base_url: str, email: str, password: str) -> str:
+    response = httpx.post(
+        f"{base_url}/users/login/token",
+        data={"username": email, "password": password},
+        timeout=30,
+    )
+    response.raise_for_status()
+    return response.json()["access_token"]
+
+
+def bench_per_user(
+    client: httpx.Client, base_url: str, user_ids: List[int], count: int
+) -> float:
+    started = time.perf_counter()
+    for user_id in user_ids:
+        response = client.get(
+            f"{base_url}/recommendations/user/{user_id}",
+            params={"count": count},
+            timeout=60,
+        )
+        if response.status_code not in (200, 404):
+            response.raise_for_status()
+    return time.perf_counter() - started
+
+
+def bench_batch(
+    client: httpx.Client, base_url: str, user_ids: List[int], count: int
+) -> float:
+    started = time.perf_counter()
+    received = 0
+    with client.stream(
+        "POST",
+        f"{base_url}/recommendations/batch",
+        json={"user_ids": user_ids, "count": count},
+        timeout=600,
+    ) as response:
+        response.raise_for_status()
+        for line in response.iter_lines():
+            if line:
+                json.loads(line)
+                received += 1
+    elapsed = time.perf_counter() - started
+    if received != len(user_ids):
+        logger.warning(f"Batch returned {received} lines for {len(user_ids)} users.")
+    return elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--base-url", default="http://localhost:8000/api/v1")
+    parser.add_argument("--email", required=True)
+    parser.add_argument("--password", required=True)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--first-user-id", type=int, default=1)
+    parser.add_argument("--count", type=int, default=10)
+    args = parser.parse_args()
+
+    user_ids = list(range(args.first_user_id, args.first_user_id + args.users))
+    token = _login(args.base_url, args.email, args.password)
+    with httpx.Client(headers={"Authorization": f"Bearer {token}"}) as client:
+        # Warm up model loading and connection pools before timing
+        bench_batch(client, args.base_url, user_ids[:10], args.count)
+
+        per_user_seconds = bench_per_user(client, args.base_url, user_ids, args.count)
+        batch_seconds = bench_batch(client, args.base_url, user_ids, args.count)
+
+    per_user_rate = len(user_ids) / per_user_seconds
+    batch_rate = len(user_ids) / batch_seconds
+    print(f"users:     {len(user_ids)}")
+    print(f"per-user:  {per_user_seconds:8.2f} s  {per_user_rate:10.1f} users/s")
+    print(f"batch:     {batch_seconds:8.2f} s  {batch_rate:10.1f} users/s")
+    print(f"speed-up:  {batch_rate / per_user_rate:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
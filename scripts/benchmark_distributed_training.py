@@ -0,0 +1,104 @@
+"""Scaling of data-parallel CPU training over 1, 2 and 4 local workers.
+
+Trains the real SequentialRetrievalModel through fit_distributed (the path
+TRAINING_WORKERS > 1 takes) on synthetic clustered sequences. The global batch
+is the same for every worker count. Per worker count it reports:
+
+- wall time, including process start and cluster setup;
+- steady-state throughput: examples/s averaged over the epochs after the
+  first (the first one includes graph tracing);
+- scaling efficiency: throughput / (workers x single-worker throughput).
+
+Usage:
+    python -m scripts.benchmark_distributed_training [--workers 1,2,4]
+        [--rows 50000] [--users 200000] [--epochs 3] [--batch-size 4096]
+"""
+
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from app.core.config import settings
+from app.services.recommender.checkpoints import DatasetSnapshot, TrainingCheckpoints
+from app.services.recommender.distributed import fit_distributed
+from app.services.recommender.instrumentation import TrainingRun
+from app.services.recommender.vocabulary import MovieVocabulary
+from scripts.benchmark_embeddings import make_sequences
+
+
+class BenchmarkRun(TrainingRun):
+    """Collects fit progress without overwriting the real run metrics file."""
+
+    def publish(self, write: bool = True) -> None:
+        pass
+
+
+def make_snapshot(rows: int, users: int) -> DatasetSnapshot:
+    sequences = make_sequences(rows, users, settings.MAX_CONTEXT_LENGTH + 1)
+    split = int(0.9 * len(sequences))
+    contexts, labels = sequences[:, :-1], sequences[:, -1]
+    # The sequences already hold rows; any vocabulary of the same size will do
+    vocabulary = MovieVocabulary(np.arange(1, rows - 1))
+    return DatasetSnapshot(
+        vocabulary, contexts[:split], labels[:split], contexts[split:], labels[split:]
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--workers",
+        type=lambda value: [int(part) for part in value.split(",")],
+        default=[1, 2, 4],
+    )
+    parser.add_argument("--rows", type=int, default=50_000)
+    parser.add_argument("--users", type=int, default=200_000)
+    parser.add_argument("--epochs", type=int, default=3)
+    parser.add_argument("--batch-size", type=int, default=4096)
+    parser.add_argument("--port", type=int, default=settings.TRAINING_WORKER_PORT)
+    args = parser.parse_args()
+
+    snapshot = make_snapshot(args.rows, args.users)
+    print(
+        f"{len(snapshot.train_labels)} train examples, {args.rows} rows, "
+        f"global batch {args.batch_size}, {args.epochs} epochs"
+    )
+    baseline = None
+    for workers in args.workers:
+        with tempfile.TemporaryDirectory() as tmp:
+            root = Path(tmp)
+            checkpoints = TrainingCheckpoints(f"benchmark-{workers}", root=root)
+            checkpoints.prepare()
+            checkpoints.save_snapshot(snapshot)
+            run = BenchmarkRun()
+            started = time.perf_counter()
+            ok = fit_distributed(
+                checkpoints,
+                workers,
+                run,
+                str(root / "model.keras"),
+                epochs=args.epochs,
+                batch_size=args.batch_size,
+                port=args.port,
+            )
+            seconds = time.perf_counter() - started
+        if not ok:
+            print(f"{workers} workers: training failed")
+            continue
+        history = run.fit.get("history", [])
+        steady = history[1:] or history
+        throughput = float(np.mean([epoch["examples_per_s"] for epoch in steady]))
+        if baseline is None:
+            baseline = throughput / workers
+        print(
+            f"{workers} workers  wall {seconds:8.1f} s  "
+            f"{throughput:10.0f} examples/s  "
+            f"efficiency {throughput / (workers * baseline):6.1%}"
+        )
+
+
+if __name__ == "__main__":
+    main()
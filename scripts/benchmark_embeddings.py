@@ -0,0 +1,146 @@
+"""Full vs hashed vs quotient-remainder embeddings on a synthetic large catalog.
+
+Sequences are drawn from a catalog of clustered movies: every user sticks to
+one cluster and picks popular movies more often. Each backend trains the real
+SequentialRetrievalModel in its own process, for the same number of epochs.
+The script reports:
+
+- the trainable embedding weights (plus AdamW state) per model;
+- the process peak RSS;
+- training throughput (examples/s, validation included) and validation
+  throughput on its own;
+- recall@k of the next movie on held-out sequences.
+
+Usage:
+    python -m scripts.benchmark_embeddings [--rows 500000] [--dim 32]
+        [--budget-mb 8] [--users 20000] [--epochs 1] [--k 10]
+"""
+
+import argparse
+import multiprocessing
+import resource
+import time
+from typing import Dict
+
+import numpy as np
+
+from app.core.config import settings
+
+CLUSTERS = 2000
+
+
+def make_sequences(rows: int, users: int, length: int, seed: int = 0) -> np.ndarray:
+    """(users, length) movie rows; row 0/1 are reserved (padding / OOV)."""
+    rng = np.random.default_rng(seed)
+    movies = np.arange(2, rows)
+    cluster_of = rng.integers(0, CLUSTERS, len(movies))
+    order = np.argsort(cluster_of, kind="stable")
+    bounds = np.searchsorted(cluster_of[order], np.arange(CLUSTERS + 1))
+    sequences = np.zeros((users, length), dtype=np.int32)
+    for user in range(users):
+        cluster = rng.integers(0, CLUSTERS)
+        members = movies[order[bounds[cluster] : bounds[cluster + 1]]]
+        if len(members) == 0:
+            members = movies
+        weights = 1.0 / np.arange(1, len(members) + 1)
+        sequences[user] = rng.choice(members, length, p=weights / weights.sum())
+    return sequences
+
+
+def run_backend(backend: str, buckets: int, args: argparse.Namespace) -> Dict:
+    import keras
+
+    from app.services.recommender.embeddings import embedding_table
+    from app.services.recommender.model import SequentialRetrievalModel
+    from app.services.recommender.retrieval import top_k
+
+    context_length = settings.MAX_CONTEXT_LENGTH
+    sequences = make_sequences(args.rows, args.users, context_length + 1)
+    split = int(0.9 * len(sequences))
+    contexts, labels = sequences[:, :-1], sequences[:, -1]
+
+    model = SequentialRetrievalModel(
+        movies_count=args.rows - 1,
+        embedding_dimension=args.dim,
+        embedding_backend=backend,
+        embedding_buckets=buckets,
+    )
+    model.compile(optimizer=keras.optimizers.AdamW(learning_rate=0.005))
+    model(np.zeros((1, context_length), dtype=np.int32))
+    embedding_bytes = sum(
+        int(np.prod(weight.shape)) * 4
+        for layer in (model.candidate_model, model.query_model.layers[0])
+        for weight in layer.trainable_weights
+    )
+
+    started = time.perf_counter()
+    # Validated every epoch, like train.py
+    model.fit(
+        contexts[:split],
+        labels[:split],
+        validation_data=(contexts[split:], labels[split:]),
+        batch_size=args.batch_size,
+        epochs=args.epochs,
+        verbose=0,
+    )
+    train_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    model.evaluate(
+        contexts[split:], labels[split:], batch_size=args.batch_size, verbose=0
+    )
+    validation_seconds = time.perf_counter() - started
+
+    candidates = embedding_table(model.candidate_model)
+    queries = keras.ops.convert_to_numpy(model.query_model(contexts[split:]))
+    hits = 0
+    for start in range(0, len(queries), 64):
+        results = top_k(queries[start : start + 64], candidates, args.k)
+        for label, result in zip(labels[split + start :], results):
+            hits += any(row == label for row, _ in result)
+
+    return {
+        "backend": backend,
+        "buckets": buckets,
+        # AdamW keeps two slots per weight
+        "embedding_mb": 3 * embedding_bytes / 2**20,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "examples_per_s": split * args.epochs / train_seconds,
+        "validation_examples_per_s": (len(sequences) - split) / validation_seconds,
+        "recall": hits / len(queries),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=500_000)
+    parser.add_argument("--dim", type=int, default=32)
+    parser.add_argument("--budget-mb", type=float, default=8)
+    parser.add_argument("--users", type=int, default=20_000)
+    parser.add_argument("--epochs", type=int, default=1)
+    parser.add_argument("--batch-size", type=int, default=1024)
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+
+    from app.services.recommender.embeddings import resolve_backend
+
+    context = multiprocessing.get_context("spawn")
+    print(f"{args.rows} rows x {args.dim} dims, budget {args.budget_mb} MB per table")
+    for requested in ("full", "hash", "qr"):
+        backend, buckets = resolve_backend(
+            args.rows, args.dim, requested, args.budget_mb
+        )
+        with context.Pool(1) as pool:
+            result = pool.apply(run_backend, (backend, buckets, args))
+        print(
+            f"{result['backend']:<5} buckets {result['buckets']:>8}  "
+            f"weights+optimizer {result['embedding_mb']:8.1f} MB  "
+            f"peak RSS {result['peak_rss_mb']:8.1f} MB  "
+            f"{result['examples_per_s']:9.0f} examples/s  "
+            f"validation {result['validation_examples_per_s']:9.0f} examples/s  "
+            f"recall@{args.k} {result['recall']:.4f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
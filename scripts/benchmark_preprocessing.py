@@ -0,0 +1,97 @@
+"""Scaling of sharded example generation on a synthetic ML-25M-sized dataset.
+
+Builds rating columns shaped like MovieLens 25M (25M ratings, 162k users with
+long-tailed activity, 62k movies), then times:
+
+- generate_examples in one process (the baseline);
+- generate_examples_parallel with each worker count,
+
+and reports the speedup and parallel efficiency against the baseline. The
+parallel timings include writing the rating columns for the workers and
+copying the shard files back, i.e. what a training run pays.
+
+Usage:
+    python -m scripts.benchmark_preprocessing [--ratings 25000000]
+        [--users 162541] [--movies 62423] [--workers 1,2,4,8]
+"""
+
+import argparse
+import os
+import time
+from typing import List, Tuple
+
+import numpy as np
+
+from app.core.config import settings
+
+
+def make_ratings(
+    ratings: int, users: int, movies: int, seed: int = 0
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """(users, movies, timestamps) columns with long-tailed user activity."""
+    rng = np.random.default_rng(seed)
+    activity = rng.pareto(1.2, users) + 1
+    per_user = np.maximum((activity / activity.sum() * ratings).astype(np.int64), 1)
+    per_user[0] += max(ratings - per_user.sum(), 0)
+    user_ids = np.repeat(np.arange(1, users + 1, dtype=np.int32), per_user)[:ratings]
+    popularity = 1.0 / np.arange(1, movies + 1)
+    movie_ids = rng.choice(
+        np.arange(1, movies + 1, dtype=np.int32),
+        len(user_ids),
+        p=popularity / popularity.sum(),
+    )
+    timestamps = rng.integers(789_652_009, 1_574_327_703, len(user_ids))
+    # Stored order doesn't follow users, like rows fetched by id
+    order = rng.permutation(len(user_ids))
+    return user_ids[order], movie_ids[order], timestamps[order]
+
+
+def parse_workers(value: str) -> List[int]:
+    return [int(part) for part in value.split(",") if part]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--ratings", type=int, default=25_000_095)
+    parser.add_argument("--users", type=int, default=162_541)
+    parser.add_argument("--movies", type=int, default=62_423)
+    parser.add_argument(
+        "--workers",
+        type=parse_workers,
+        default=[n for n in (1, 2, 4, 8, 16, 32) if n <= (os.cpu_count() or 1)],
+    )
+    args = parser.parse_args()
+
+    from app.services.recommender.preprocessing import (
+        generate_examples,
+        generate_examples_parallel,
+    )
+
+    # The benchmark always takes the parallel path
+    settings.PREPROCESSING_PARALLEL_MIN_RATINGS = 0
+
+    users, movies, timestamps = make_ratings(args.ratings, args.users, args.movies)
+    print(f"{len(users)} ratings, {args.users} users, {args.movies} movies")
+
+    started = time.perf_counter()
+    baseline = generate_examples(users, movies, timestamps)
+    baseline_seconds = time.perf_counter() - started
+    print(
+        f"in-process     {baseline_seconds:8.2f} s  "
+        f"{len(baseline[2])} examples  (baseline)"
+    )
+
+    for workers in args.workers:
+        started = time.perf_counter()
+        examples = generate_examples_parallel(users, movies, timestamps, workers)
+        seconds = time.perf_counter() - started
+        assert len(examples[2]) == len(baseline[2]), "example counts differ"
+        speedup = baseline_seconds / seconds
+        print(
+            f"{workers:>3} processes  {seconds:8.2f} s  speedup {speedup:5.2f}x  "
+            f"efficiency {speedup / workers:6.1%}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""Local harness for sharded scatter-gather retrieval.
+
+Builds a random candidate table, starts 1..N local shard processes that each
+memory-map their own row range, checks that the merged top-k matches
+single-process retrieval (scores, genre filter and exclusions included) and
+reports latency and throughput for every shard count.
+
+Usage:
+    python -m scripts.benchmark_sharded_retrieval [--rows 200000] [--dim 64]
+        [--max-shards 4] [--batch 32] [--k 100] [--requests 50]
+"""
+
+import argparse
+import multiprocessing
+import statistics
+import tempfile
+import time
+from pathlib import Path
+from typing import List
+
+import numpy as np
+
+from app.services.recommender.retrieval import top_k
+from app.services.recommender.sharding import (
+    RetrievalShard,
+    ShardedRetriever,
+    serve_shard,
+    shard_range,
+)
+
+AUTHKEY = b"benchmark"
+
+
+def _run_shard(table_path: str, index: int, num_shards: int, ready) -> None:
+    table = np.load(table_path, mmap_mode="r")
+    start, stop = shard_range(table.shape[0], index, num_shards)
+    shard = RetrievalShard(table, start, stop)
+    serve_shard(lambda version: shard, ("127.0.0.1", 0), authkey=AUTHKEY, ready=ready)
+
+
+def _start_shards(table_path: str, num_shards: int):
+    context = multiprocessing.get_context("spawn")
+    processes, addresses = [], []
+    for index in range(num_shards):
+        receiver, sender = context.Pipe(duplex=False)
+        process = context.Process(
+            target=_run_shard,
+            args=(table_path, index, num_shards, sender),
+            daemon=True,
+        )
+        process.start()
+        processes.append(process)
+        addresses.append(receiver.recv())
+    return processes, addresses
+
+
+def _check(retriever: ShardedRetriever, table: np.ndarray, args) -> None:
+    rng = np.random.default_rng(1)
+    queries = rng.standard_normal((8, table.shape[1])).astype(np.float32)
+    allowed = rng.random(table.shape[0]) < 0.5
+    excluded = [rng.integers(0, table.shape[0], 20).tolist() for _ in queries]
+    expected = top_k(queries, table, args.k, allowed=allowed, excluded=excluded)
+    actual = retriever(queries, args.k, allowed=allowed, excluded=excluded)
+    for want, got in zip(expected, actual):
+        assert [row for row, _ in want] == [row for row, _ in got], "ids differ"
+        np.testing.assert_allclose(
+            [score for _, score in want], [score for _, score in got], rtol=1e-5
+        )
+
+
+def _measure(retriever, queries: List[np.ndarray], k: int) -> List[float]:
+    timings = []
+    for batch in queries:
+        started = time.perf_counter()
+        retriever(batch, k)
+        timings.append(time.perf_counter() - started)
+    return timings
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--dim", type=int, default=64)
+    parser.add_argument("--max-shards", type=int, default=4)
+    parser.add_argument("--batch", type=int, default=32)
+    parser.add_argument("--k", type=int, default=100)
+    parser.add_argument("--requests", type=int, default=50)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    table = rng.standard_normal((args.rows, args.dim)).astype(np.float32)
+    queries = [
+        rng.standard_normal((args.batch, args.dim)).astype(np.float32)
+        for _ in range(args.requests)
+    ]
+
+    baseline = statistics.median(
+        _measure(lambda batch, k: top_k(batch, table, k), queries, args.k)
+    )
+    print(f"in-process  p50 {1000 * baseline:8.2f} ms")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        table_path = str(Path(tmp) / "candidates.npy")
+        np.save(table_path, table)
+        for num_shards in range(1, args.max_shards + 1):
+            processes, addresses = _start_shards(table_path, num_shards)
+            try:
+                retriever = ShardedRetriever(addresses, args.rows, authkey=AUTHKEY)
+                _check(retriever, table, args)
+                timings = _measure(retriever, queries, args.k)
+                p50 = statistics.median(timings)
+                p95 = sorted(timings)[int(0.95 * (len(timings) - 1))]
+                qps = args.batch * len(timings) / sum(timings)
+                print(
+                    f"{num_shards:2d} shard(s)  p50 {1000 * p50:8.2f} ms  "
+                    f"p95 {1000 * p95:8.2f} ms  {qps:10.0f} queries/s  "
+                    f"speed-up {baseline / p50:5.2f}x"
+                )
+            finally:
+                for process in processes:
+                    process.terminate()
+                    process.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""Import-time benchmark for each process role.
+
+Every role is imported in a fresh interpreter, several times, and the script
+reports the median wall time plus any heavy ML modules that got loaded. The
+API, beat and events roles must stay under the budget without loading
+TensorFlow. The "training" role is shown for comparison.
+
+Usage:
+    python -m scripts.benchmark_startup [--repeat 5] [--budget 1.0] [--importtime]
+
+Exits with status 1 if a fast role is over budget or loads an ML framework.
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+HEAVY_MODULES = ["tensorflow", "keras", "keras_rs", "jax", "torch", "pandas"]
+
+# role -> (modules the process imports at start-up, must be fast)
+ROLES: Dict[str, Tuple[List[str], bool]] = {
+    "api": (["app.main"], True),
+    # Celery beat and worker both load the app plus its `include` modules
+    "celery": (["app.worker.celery_app", "app.worker.tasks"], True),
+    "events": (["app.worker.rating_events"], True),
+    "training": (["app.services.recommender.train"], False),
+}
+
+_SNIPPET = """
+import json, sys, time
+started = time.perf_counter()
+for name in {modules!r}:
+    __import__(name)
+elapsed = time.perf_counter() - started
+print(json.dumps({{
+    "seconds": elapsed,
+    "heavy": [m for m in {heavy!r} if m in sys.modules],
+}}))
+"""
+
+
+def measure(modules: List[str], importtime: bool = False) -> Dict:
+    command = [sys.executable]
+    if importtime:
+        command += ["-X", "importtime"]
+    command += ["-c", _SNIPPET.format(modules=modules, heavy=HEAVY_MODULES)]
+    completed = subprocess.run(
+        command, cwd=PROJECT_ROOT, capture_output=True, text=True, check=True
+    )
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    if importtime:
+        result["slowest"] = _slowest_imports(completed.stderr)
+    return result
+
+
+def _slowest_imports(stderr: str, top: int = 10) -> List[Tuple[str, float]]:
+    """Top modules by cumulative import time from `-X importtime` output."""
+    timings = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        timings.append((name.strip(), int(cumulative) / 1e6))
+    return sorted(timings, key=lambda item: item[1], reverse=True)[:top]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--budget", type=float, default=1.0, help="seconds")
+    parser.add_argument("--importtime", action="store_true")
+    args = parser.parse_args()
+
+    ok = True
+    for role, (modules, must_be_fast) in ROLES.items():
+        runs = [measure(modules) for _ in range(args.repeat)]
+        seconds = statistics.median(run["seconds"] for run in runs)
+        heavy = runs[-1]["heavy"]
+        failed = must_be_fast and (seconds > args.budget or bool(heavy))
+        ok = ok and not failed
+        status = "FAIL" if failed else "ok"
+        print(
+            f"[{status:>4}] {role:<9} {seconds:6.3f} s  "
+            f"heavy modules: {', '.join(heavy) or '-'}"
+        )
+        if args.importtime:
+            for name, cumulative in measure(modules, importtime=True)["slowest"]:
+                print(f"         {cumulative:6.3f} s  {name}")
+
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+"""Query-plan regression check for the hot CRUD queries.
+
+Runs each hot CRUD call against a (seeded) PostgreSQL database, captures the
+SQL it emits, and EXPLAINs every statement with sequential scans disabled
+(see app/db/query_plans.py).
+
+Usage:
+    python -m scripts.check_query_plans
+
+Exits with status 1 if a sequential scan appears in any plan.
+"""
+
+import asyncio
+import logging
+import sys
+
+from app.db.query_plans import explain_seq_scans, hot_queries, sample_ids
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+async def check_query_plans() -> bool:
+    ids = await sample_ids()
+    if ids is None:
+        logger.error("Database has no ratings/movies. Seed it before checking plans.")
+        return False
+
+    all_ok = True
+    for name, query in hot_queries(*ids):
+        for statement, seq_scans in await explain_seq_scans(query):
+            if seq_scans:
+                all_ok = False
+                logger.error(
+                    f"[FAIL] {name}: sequential scan on {', '.join(seq_scans)}\n{statement}"
+                )
+            else:
+                logger.info(f"[OK] {name}")
+    return all_ok
+
+
+if __name__ == "__main__":
+    ok = asyncio.run(check_query_plans())
+    sys.exit(0 if ok else 1)
@@ -14,7 +14,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 try:
     from app.db import crud
     from app.db.models import Movie, Rating, User
-    from app.db.session import AsyncSessionLocal, Base, async_engine
+    from app.db.session import AsyncSessionLocal, create_db_and_tables
     from app.schemas.movie import MovieCreate
     from app.schemas.rating import RatingCreate
     from app.schemas.user import UserCreate
@@ -25,7 +25,7 @@ except ImportError:
     sys.path.insert(0, str(APP_DIR.parent))
     from app.db import crud
     from app.db.models import Movie, Rating, User
-    from app.db.session import AsyncSessionLocal, Base, async_engine
+    from app.db.session import AsyncSessionLocal, create_db_and_tables
     from app.schemas.movie import MovieCreate
     from app.schemas.rating import RatingCreate
     from app.schemas.user import UserCreate
@@ -290,10 +290,9 @@ async def seed_users_and_ratings(db: AsyncSession):
 
 
 async def init_db():
-    async with async_engine.begin() as conn:
-        logger.info("Creating tables if they don't exist (based on current models)...")
-        await conn.run_sync(Base.metadata.create_all)
-    logger.info("Database tables checked/created.")
+    logger.info("Applying database migrations...")
+    await create_db_and_tables()
+    logger.info("Database schema is up to date.")
 
 
 async def seed_database():
@@ -0,0 +1,49 @@
+import os
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app.db.session import run_migrations
+
+
+def pytest_configure(config):
+    config.addinivalue_line(
+        "markers",
+        "postgres: needs the seeded PostgreSQL database at DATABASE_URL "
+        "(run with RUN_POSTGRES_TESTS=true)",
+    )
+
+
+def pytest_collection_modifyitems(config, items):
+    if os.getenv("RUN_POSTGRES_TESTS", "false").lower() == "true":
+        return
+    skip = pytest.mark.skip(reason="RUN_POSTGRES_TESTS is not set")
+    for item in items:
+        if "postgres" in item.keywords:
+            item.add_marker(skip)
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+def sqlite_engine(tmp_path):
+    """Factory of async engines on fresh SQLite files migrated to head."""
+    engines = []
+
+    def make(name: str = "test"):
+        path = tmp_path / f"{name}.db"
+        sync_engine = create_engine(f"sqlite:///{path}")
+        with sync_engine.begin() as conn:
+            run_migrations(conn)
+        sync_engine.dispose()
+        engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+        engines.append(engine)
+        return engine
+
+    yield make
+    for engine in engines:
+        engine.sync_engine.dispose()
@@ -0,0 +1,24 @@
+"""MovieIdCache against a SQLite database."""
+
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+from app.db.models import Movie
+from app.services.catalog import MovieIdCache
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_find_unknown_sees_movies_added_after_loading(sqlite_engine):
+    Session = sessionmaker(sqlite_engine(), class_=AsyncSession)
+    cache = MovieIdCache()
+    async with Session() as db:
+        db.add(Movie(id=1, title="Loaded"))
+        await db.commit()
+        assert await cache.find_unknown(db, [1, 2]) == {2}
+
+        db.add(Movie(id=2, title="Added later"))
+        await db.commit()
+        assert await cache.find_unknown(db, [1, 2, 3]) == {3}
+        assert 2 in await cache.get_ids(db)
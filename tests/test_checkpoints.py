@@ -0,0 +1,59 @@
+"""TrainingCheckpoints.prepare taking over abandoned runs."""
+
+import os
+
+import numpy as np
+
+from app.services.recommender.checkpoints import DatasetSnapshot, TrainingCheckpoints
+from app.services.recommender.vocabulary import MovieVocabulary
+
+
+def make_run(root, run_id, mtime):
+    checkpoints = TrainingCheckpoints(run_id, root=root)
+    checkpoints.path.mkdir(parents=True)
+    examples = np.zeros((2, 3), dtype=np.int32)
+    checkpoints.save_snapshot(
+        DatasetSnapshot(
+            MovieVocabulary(np.array([5, 7])),
+            examples,
+            examples[:, 0],
+            examples,
+            examples[:, 0],
+        )
+    )
+    (checkpoints.path / "epoch-0002.keras").write_bytes(b"")
+    os.utime(checkpoints.path, (mtime, mtime))
+    return checkpoints
+
+
+def test_new_run_resumes_the_newest_abandoned_run(tmp_path):
+    make_run(tmp_path, "old", mtime=1_000)
+    make_run(tmp_path, "dead", mtime=2_000)
+    (tmp_path / "empty").mkdir()
+
+    checkpoints = TrainingCheckpoints("next", root=tmp_path)
+    checkpoints.prepare()
+
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["next"]
+    assert checkpoints.latest()[0] == 2
+    assert checkpoints.load_snapshot().vocabulary.movie_ids.tolist() == [5, 7]
+
+
+def test_redelivered_run_keeps_its_own_checkpoints(tmp_path):
+    make_run(tmp_path, "own", mtime=1_000)
+    make_run(tmp_path, "newer", mtime=2_000)
+
+    checkpoints = TrainingCheckpoints("own", root=tmp_path)
+    checkpoints.prepare()
+
+    assert [path.name for path in tmp_path.iterdir()] == ["own"]
+    assert checkpoints.latest()[0] == 2
+
+
+def test_fresh_start_without_abandoned_runs(tmp_path):
+    checkpoints = TrainingCheckpoints("first", root=tmp_path / "checkpoints")
+    checkpoints.prepare()
+
+    assert checkpoints.path.is_dir()
+    assert checkpoints.latest() is None
+    assert checkpoints.load_snapshot() is None
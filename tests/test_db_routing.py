@@ -0,0 +1,60 @@
+"""Read/write routing of RoutingSession over two SQLite (aiosqlite) databases."""
+
+import pytest
+from sqlalchemy import select
+
+from app.db import crud, session
+from app.db.models import Movie
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def engines(sqlite_engine, monkeypatch):
+    primary = sqlite_engine("primary")
+    replica = sqlite_engine("replica")
+    monkeypatch.setattr(session, "async_engine", primary)
+    monkeypatch.setattr(session, "replica_engine", replica)
+    async with session.AsyncSessionLocal() as db:
+        db.add(Movie(title="Only on the primary"))
+        await db.commit()
+    return primary, replica
+
+
+async def test_writes_go_to_the_primary(engines):
+    primary, replica = engines
+    async with primary.connect() as conn:
+        assert (await conn.execute(select(Movie.id))).all()
+    async with replica.connect() as conn:
+        assert not (await conn.execute(select(Movie.id))).all()
+
+
+async def test_selects_go_to_the_replica(engines):
+    async with session.AsyncSessionLocal() as db:
+        assert await crud.movie.get_multi(db) == []
+
+
+async def test_use_primary_pins_reads(engines):
+    async with session.AsyncSessionLocal() as db:
+        movies = await crud.movie.get_multi(session.use_primary(db))
+    assert [movie.title for movie in movies] == ["Only on the primary"]
+
+
+async def test_reads_after_a_write_stay_on_the_primary(engines):
+    async with session.AsyncSessionLocal() as db:
+        db.add(Movie(title="Second"))
+        await db.flush()
+        movies = await crud.movie.get_multi(db)
+    assert len(movies) == 2
+
+
+async def test_locking_selects_go_to_the_primary(engines):
+    async with session.AsyncSessionLocal() as db:
+        result = await db.execute(select(Movie).with_for_update())
+        assert len(result.scalars().all()) == 1
+
+
+def test_without_a_replica_everything_uses_the_primary(monkeypatch):
+    monkeypatch.setattr(session, "replica_engine", None)
+    routing = session.RoutingSession()
+    assert routing.get_bind(clause=select(Movie)) is session.async_engine.sync_engine
@@ -0,0 +1,57 @@
+"""Two-worker MultiWorkerMirroredStrategy smoke test (spawns processes)."""
+
+import math
+import socket
+
+import numpy as np
+
+from app.core.config import settings
+from app.services.recommender.checkpoints import DatasetSnapshot, TrainingCheckpoints
+from app.services.recommender.distributed import fit_distributed
+from app.services.recommender.instrumentation import TrainingRun
+from app.services.recommender.vocabulary import MovieVocabulary
+
+
+class QuietRun(TrainingRun):
+    def publish(self, write: bool = True) -> None:
+        pass
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("localhost", 0))
+        return sock.getsockname()[1]
+
+
+def test_two_workers_fit_and_save(tmp_path):
+    rng = np.random.default_rng(0)
+    sequences = rng.integers(
+        1, 50, size=(512, settings.MAX_CONTEXT_LENGTH + 1), dtype=np.int32
+    )
+    contexts, labels = sequences[:, :-1], sequences[:, -1]
+    checkpoints = TrainingCheckpoints("smoke", root=tmp_path / "checkpoints")
+    checkpoints.prepare()
+    checkpoints.save_snapshot(
+        DatasetSnapshot(
+            MovieVocabulary(np.arange(1, 50)),
+            contexts[:448],
+            labels[:448],
+            contexts[448:],
+            labels[448:],
+        )
+    )
+    run = QuietRun()
+    model_path = tmp_path / "model.keras"
+
+    assert fit_distributed(
+        checkpoints, 2, run, str(model_path), epochs=2, batch_size=64, port=free_port()
+    )
+
+    assert model_path.exists()
+    assert checkpoints.latest()[0] == 2
+    history = run.fit["history"]
+    assert [epoch["epoch"] for epoch in history] == [1, 2]
+    assert all(math.isfinite(epoch["loss"]) for epoch in history)
+    assert all(math.isfinite(epoch["val_loss"]) for epoch in history)
+    # The workers' memory, reported once they have been reaped
+    assert run.to_dict()["peak_rss_children_mb"] > 0
@@ -0,0 +1,45 @@
+"""SequentialRetrievalModel with a compact (hashed) embedding table."""
+
+import keras
+import numpy as np
+
+from app.core.config import settings
+from app.services.recommender.embeddings import HashedEmbedding
+from app.services.recommender.model import SequentialRetrievalModel
+
+
+def test_validation_does_not_materialise_the_table(monkeypatch):
+    rng = np.random.default_rng(0)
+    sequences = rng.integers(
+        1, 50, size=(64, settings.MAX_CONTEXT_LENGTH + 1), dtype=np.int32
+    )
+    contexts, labels = sequences[:, :-1], sequences[:, -1]
+    model = SequentialRetrievalModel(
+        movies_count=49,
+        embedding_dimension=8,
+        embedding_backend="hash",
+        embedding_buckets=16,
+    )
+    model.compile(optimizer=keras.optimizers.AdamW(learning_rate=0.01))
+    model(contexts[:1])
+
+    materialised = []
+    table = HashedEmbedding.embeddings
+    monkeypatch.setattr(
+        HashedEmbedding,
+        "embeddings",
+        property(lambda layer: materialised.append(layer) or table.fget(layer)),
+    )
+    history = model.fit(
+        contexts[:48],
+        labels[:48],
+        validation_data=(contexts[48:], labels[48:]),
+        batch_size=16,
+        epochs=2,
+        verbose=0,
+    )
+
+    assert materialised == []
+    assert np.isfinite(history.history["val_loss"]).all()
+    assert model.predict(contexts[:2], verbose=0)["predictions"].shape == (2, 10)
+    assert materialised
@@ -0,0 +1,49 @@
+"""Concurrency of load_model_and_mappings."""
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from app.core.config import settings
+from app.services.recommender import predict
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def builds(tmp_path, monkeypatch):
+    model_file = tmp_path / "model.keras"
+    model_file.write_bytes(b"")
+    calls = []
+
+    async def build_state(db, source_path):
+        calls.append(source_path)
+        await asyncio.sleep(0.05)
+        return SimpleNamespace(
+            model_timestamp=source_path.stat().st_mtime,
+            query_function=SimpleNamespace(warm_up=lambda: {}),
+        )
+
+    monkeypatch.setattr(settings, "SERVING_MODE", "keras")
+    monkeypatch.setattr(predict, "_source_path", lambda: model_file)
+    monkeypatch.setattr(predict, "_build_state", build_state)
+    monkeypatch.setattr(predict, "_state", None)
+    monkeypatch.setattr(predict, "_load_lock", asyncio.Lock())
+    return calls
+
+
+async def test_concurrent_loads_share_the_running_one(builds):
+    await asyncio.gather(
+        predict.load_model_and_mappings(None), predict.load_model_and_mappings(None)
+    )
+    assert len(builds) == 1
+    assert predict.is_model_ready()
+
+
+async def test_force_reload_waits_and_reloads(builds):
+    first = asyncio.create_task(predict.load_model_and_mappings(None))
+    await asyncio.sleep(0)
+    await predict.load_model_and_mappings(None, force_reload=True)
+    await first
+    assert len(builds) == 2
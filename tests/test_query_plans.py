@@ -0,0 +1,51 @@
+"""Index usage of the hot CRUD queries (see app/db/query_plans.py).
+
+The EXPLAIN checks need a seeded PostgreSQL database:
+    RUN_POSTGRES_TESTS=true DATABASE_URL=postgresql+asyncpg://... pytest
+"""
+
+import asyncio
+
+import pytest
+
+from app.db.query_plans import (
+    explain_seq_scans,
+    find_seq_scans,
+    hot_queries,
+    sample_ids,
+)
+from app.db.session import async_engine, create_db_and_tables
+
+pytestmark = pytest.mark.anyio
+
+
+def test_find_seq_scans_walks_the_plan():
+    plan = {
+        "Node Type": "Nested Loop",
+        "Plans": [
+            {"Node Type": "Index Scan", "Relation Name": "ratings"},
+            {"Node Type": "Seq Scan", "Relation Name": "movies"},
+        ],
+    }
+    assert find_seq_scans(plan) == ["movies"]
+
+
+@pytest.mark.postgres
+@pytest.mark.parametrize("name", [name for name, _ in hot_queries(1, 1)])
+async def test_hot_query_uses_indexes(name):
+    ids = await sample_ids()
+    if ids is None:
+        pytest.skip("The database has no ratings/movies; seed it first.")
+    plans = await explain_seq_scans(dict(hot_queries(*ids))[name])
+    assert plans
+    for statement, seq_scans in plans:
+        assert seq_scans == [], statement
+
+
+@pytest.mark.postgres
+async def test_concurrent_migrations_are_serialised():
+    # What several uvicorn workers do at start-up
+    await asyncio.gather(*[create_db_and_tables() for _ in range(4)])
+    async with async_engine.connect() as conn:
+        versions = await conn.exec_driver_sql("SELECT version_num FROM alembic_version")
+        assert len(versions.all()) == 1
@@ -0,0 +1,187 @@
+"""RatingEventConsumer against fakeredis."""
+
+from typing import Any, Dict, List
+
+import fakeredis.aioredis
+import pytest
+
+from app.services.derived_state import (
+    get_movie_stats,
+    get_user_history,
+    update_movie_aggregates,
+    update_user_histories,
+)
+from app.services.events import encode_rating_event
+from app.worker.rating_events import HANDLED_KEY, RatingEventConsumer
+
+pytestmark = pytest.mark.anyio
+
+HANDLERS = [update_movie_aggregates, update_user_histories]
+
+
+@pytest.fixture
+async def redis():
+    client = fakeredis.aioredis.FakeRedis(decode_responses=True)
+    yield client
+    await client.aclose()
+
+
+def make_consumer(redis, handlers=HANDLERS, **kwargs) -> RatingEventConsumer:
+    kwargs.setdefault("block_ms", 1)
+    return RatingEventConsumer(
+        redis, handlers=handlers, stream="events", group="group", **kwargs
+    )
+
+
+async def publish(redis, *ratings) -> List[str]:
+    return [
+        await redis.xadd(
+            "events",
+            encode_rating_event(
+                rating_id=rating_id,
+                user_id=user_id,
+                movie_id=movie_id,
+                rating=rating,
+                timestamp=rating_id,
+            ),
+        )
+        for rating_id, (user_id, movie_id, rating) in enumerate(ratings, start=1)
+    ]
+
+
+class FlakyHandler:
+    """Fails its first `failures` calls, then records the events it gets."""
+
+    __name__ = "flaky"
+
+    def __init__(self, failures: int):
+        self.failures = failures
+        self.events: List[Dict[str, Any]] = []
+
+    async def __call__(self, redis, events: List[Dict[str, Any]]) -> None:
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError("handler failed")
+        self.events.extend(events)
+
+
+async def test_process_batch_applies_and_acks(redis):
+    consumer = make_consumer(redis)
+    await consumer.ensure_group()
+    await publish(redis, (1, 10, 4.0), (1, 11, 3.0), (2, 10, 5.0))
+
+    assert await consumer.process_batch() == 3
+    assert await get_movie_stats(redis, 10) == {
+        "num_ratings": 2,
+        "average_rating": 4.5,
+    }
+    assert await get_user_history(redis, 1) == [10, 11]
+    assert (await consumer.lag())["pending"] == 0
+
+
+async def test_failed_batch_is_reclaimed_without_reapplying(redis):
+    flaky = FlakyHandler(failures=1)
+    consumer = make_consumer(redis, handlers=[update_movie_aggregates, flaky])
+    await consumer.ensure_group()
+    await publish(redis, (1, 10, 4.0), (2, 10, 2.0))
+
+    with pytest.raises(RuntimeError):
+        await consumer.process_batch()
+    assert (await consumer.lag())["pending"] == 2
+
+    assert await consumer.reclaim_pending() == 2
+    assert (await consumer.lag())["pending"] == 0
+    assert len(flaky.events) == 2
+    # The first handler had applied the batch before the failure
+    assert (await get_movie_stats(redis, 10))["num_ratings"] == 2
+
+
+async def test_reclaim_follows_cursor(redis):
+    flaky = FlakyHandler(failures=3)
+    consumer = make_consumer(redis, handlers=[flaky], batch_size=2)
+    await consumer.ensure_group()
+    await publish(redis, *[(user_id, 10, 4.0) for user_id in range(6)])
+
+    for _ in range(3):
+        with pytest.raises(RuntimeError):
+            await consumer.process_batch()
+    assert (await consumer.lag())["pending"] == 6
+
+    assert await consumer.reclaim_pending() == 6
+    assert (await consumer.lag())["pending"] == 0
+
+
+async def test_poisoned_events_are_dropped(redis):
+    flaky = FlakyHandler(failures=100)
+    consumer = make_consumer(redis, handlers=[flaky], max_deliveries=2)
+    await consumer.ensure_group()
+    await publish(redis, (1, 10, 4.0))
+
+    with pytest.raises(RuntimeError):
+        await consumer.process_batch()
+    with pytest.raises(RuntimeError):
+        await consumer.reclaim_pending()
+    assert await consumer.reclaim_pending() == 0
+    assert (await consumer.lag())["pending"] == 0
+
+
+async def test_replay_rebuilds_instead_of_double_counting(redis):
+    consumer = make_consumer(redis)
+    await consumer.ensure_group()
+    await publish(redis, (1, 10, 4.0), (2, 10, 2.0))
+    await consumer.process_batch()
+
+    assert await consumer.replay(reset=True) == 2
+    assert await get_movie_stats(redis, 10) == {
+        "num_ratings": 2,
+        "average_rating": 3.0,
+    }
+    assert await get_user_history(redis, 1) == [10]
+
+
+async def test_replay_without_reset_skips_applied_events(redis):
+    consumer = make_consumer(redis)
+    await consumer.ensure_group()
+    event_ids = await publish(redis, (1, 10, 4.0), (2, 10, 2.0), (3, 10, 3.0))
+    await consumer.process_batch()
+    # The movie aggregates lost the last two events
+    await redis.delete("movie_stats:10")
+    await redis.set(HANDLED_KEY.format(handler="update_movie_aggregates"), event_ids[0])
+
+    await consumer.replay(reset=False)
+    assert (await get_movie_stats(redis, 10))["num_ratings"] == 2
+    assert await get_user_history(redis, 3) == [10]
+
+
+async def test_replay_from_an_id_keeps_earlier_state(redis):
+    consumer = make_consumer(redis)
+    await consumer.ensure_group()
+    event_ids = await publish(redis, (1, 10, 4.0), (2, 10, 2.0))
+    await consumer.process_batch()
+
+    assert await consumer.replay(event_ids[1]) == 1
+    assert (await get_movie_stats(redis, 10))["num_ratings"] == 2
+    with pytest.raises(ValueError):
+        await consumer.replay(event_ids[1], reset=True)
+
+
+async def test_handlers_keep_a_high_water_mark(redis):
+    consumer = make_consumer(redis)
+    await consumer.ensure_group()
+    event_ids = await publish(redis, (1, 10, 4.0), (2, 10, 2.0))
+    await consumer.process_batch()
+
+    for handler in HANDLERS:
+        key = HANDLED_KEY.format(handler=handler.__name__)
+        assert await redis.get(key) == event_ids[-1]
+    assert not [key async for key in redis.scan_iter("rating_events:applied:*")]
+
+
+async def test_seek_moves_the_group_offset(redis):
+    consumer = make_consumer(redis)
+    await consumer.ensure_group()
+    event_ids = await publish(redis, (1, 10, 4.0), (2, 11, 2.0))
+
+    await consumer.seek(event_ids[0])
+    assert await consumer.process_batch() == 1
+    assert await get_movie_stats(redis, 10) is None
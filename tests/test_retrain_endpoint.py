@@ -0,0 +1,45 @@
+"""Validation and auth of POST /trigger-retrain-model."""
+
+import os
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import main
+from app.api import deps
+
+
+@pytest.fixture
+def client(monkeypatch):
+    calls = []
+
+    async def request_training(force=False, workers=None):
+        calls.append({"force": force, "workers": workers})
+        return "task-id", True
+
+    monkeypatch.setattr(main, "request_training", request_training)
+    client = TestClient(main.app)
+    client.calls = calls
+    yield client
+    main.app.dependency_overrides.clear()
+
+
+def test_requires_authentication(client):
+    response = client.post("/trigger-retrain-model")
+    assert response.status_code == 401
+    assert client.calls == []
+
+
+@pytest.mark.parametrize("workers", [0, (os.cpu_count() or 1) + 1])
+def test_rejects_out_of_range_workers(client, workers):
+    main.app.dependency_overrides[deps.get_current_active_user] = lambda: object()
+    response = client.post("/trigger-retrain-model", params={"workers": workers})
+    assert response.status_code == 422
+    assert client.calls == []
+
+
+def test_queues_a_run(client):
+    main.app.dependency_overrides[deps.get_current_active_user] = lambda: object()
+    response = client.post("/trigger-retrain-model", params={"workers": 1})
+    assert response.status_code == 200
+    assert client.calls == [{"force": False, "workers": 1}]
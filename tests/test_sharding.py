@@ -0,0 +1,141 @@
+"""Sharded retrieval against local shard servers (one thread per shard)."""
+
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from app.services.recommender.retrieval import top_k
+from app.services.recommender.sharding import (
+    RetrievalShard,
+    ShardedRetriever,
+    ShardVersionError,
+    require_authkey,
+    serve_shard,
+    shard_range,
+)
+
+AUTHKEY = b"test"
+ROWS, DIM = 1000, 16
+
+
+class _Ready:
+    def __init__(self):
+        self.address = None
+        self.event = threading.Event()
+
+    def send(self, address):
+        self.address = address
+        self.event.set()
+
+
+def start_shards(tables, num_shards):
+    """Serves {version: table} from num_shards servers; returns their addresses."""
+    addresses = []
+    for index in range(num_shards):
+        shards = {
+            version: RetrievalShard(table, *shard_range(ROWS, index, num_shards))
+            for version, table in tables.items()
+        }
+
+        def get_shard(version, shards=shards):
+            if version not in shards:
+                raise ShardVersionError(f"no segment {version}")
+            return shards[version]
+
+        ready = _Ready()
+        threading.Thread(
+            target=serve_shard,
+            args=(get_shard, ("127.0.0.1", 0), AUTHKEY, ready),
+            daemon=True,
+        ).start()
+        assert ready.event.wait(5)
+        addresses.append(ready.address)
+    return addresses
+
+
+@pytest.fixture(scope="module")
+def table():
+    return np.random.default_rng(0).standard_normal((ROWS, DIM)).astype(np.float32)
+
+
+@pytest.mark.parametrize("num_shards", [1, 2, 3, 4])
+def test_merged_top_k_matches_single_process(table, num_shards):
+    rng = np.random.default_rng(num_shards)
+    queries = rng.standard_normal((8, DIM)).astype(np.float32)
+    allowed = rng.random(ROWS) < 0.5
+    excluded = [rng.choice(ROWS, 20, replace=False).tolist() for _ in range(8)]
+    retriever = ShardedRetriever(
+        start_shards({"v1": table}, num_shards), ROWS, version="v1", authkey=AUTHKEY
+    )
+
+    sharded = retriever(queries, 25, allowed=allowed, excluded=excluded)
+    expected = top_k(queries, table, 25, allowed=allowed, excluded=excluded)
+    for got, want in zip(sharded, expected):
+        assert [row for row, _ in got] == [row for row, _ in want]
+        np.testing.assert_allclose(
+            [score for _, score in got], [score for _, score in want], rtol=1e-5
+        )
+
+
+def test_shards_serve_the_requested_version(table):
+    other = table[::-1].copy()
+    addresses = start_shards({"v1": table, "v2": other}, 2)
+    queries = table[:2]
+
+    for version, candidates in (("v1", table), ("v2", other)):
+        retriever = ShardedRetriever(addresses, ROWS, version=version, authkey=AUTHKEY)
+        got = retriever(queries, 5)
+        want = top_k(queries, candidates, 5)
+        assert [[row for row, _ in rows] for rows in got] == [
+            [row for row, _ in rows] for rows in want
+        ]
+
+
+def test_version_mismatch_is_rejected(table):
+    addresses = start_shards({"v1": table}, 2)
+    retriever = ShardedRetriever(addresses, ROWS, version="v2", authkey=AUTHKEY)
+    with pytest.raises(RuntimeError, match="no segment v2"):
+        retriever(table[:1], 5)
+    # The connections stay usable after a rejected request
+    retriever.version = "v1"
+    assert len(retriever(table[:1], 5)[0]) == 5
+
+
+def test_sharding_requires_an_authkey(monkeypatch):
+    from app.core.config import settings
+
+    monkeypatch.setattr(settings, "RETRIEVAL_SHARD_AUTHKEY", "")
+    with pytest.raises(ValueError, match="RETRIEVAL_SHARD_AUTHKEY"):
+        require_authkey()
+    with pytest.raises(ValueError):
+        serve_shard(lambda version: None, ("127.0.0.1", 0))
+    with pytest.raises(ValueError):
+        ShardedRetriever([("127.0.0.1", 1)], ROWS)
+
+
+def test_hung_shard_times_out(table):
+    shard = RetrievalShard(table, 0, ROWS)
+    hang = threading.Event()
+
+    def get_shard(version):
+        if hang.is_set():
+            time.sleep(1)
+        return shard
+
+    ready = _Ready()
+    threading.Thread(
+        target=serve_shard,
+        args=(get_shard, ("127.0.0.1", 0), AUTHKEY, ready),
+        daemon=True,
+    ).start()
+    assert ready.event.wait(5)
+    retriever = ShardedRetriever([ready.address], ROWS, authkey=AUTHKEY, timeout=0.2)
+
+    hang.set()
+    with pytest.raises(TimeoutError):
+        retriever(table[:1], 5)
+    # The late answer is dropped with the connection; the next call reconnects
+    hang.clear()
+    assert len(retriever(table[:1], 5)[0]) == 5
@@ -0,0 +1,63 @@
+"""The training lock and its heartbeat, against fakeredis."""
+
+import time
+
+import fakeredis
+import fakeredis.aioredis
+import pytest
+
+from app.core.config import settings
+from app.worker import scheduler
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def server(monkeypatch):
+    server = fakeredis.FakeServer()
+    client = fakeredis.aioredis.FakeRedis(server=server, decode_responses=True)
+    monkeypatch.setattr(scheduler, "get_redis", lambda: client)
+    return server
+
+
+def sync_client(server):
+    return fakeredis.FakeRedis(server=server, decode_responses=True)
+
+
+async def test_live_holder_keeps_the_lock_from_its_own_redelivery(server):
+    assert await scheduler.acquire_training_lock("run-1") == "run-1"
+
+    assert await scheduler.acquire_training_lock("run-1") is None
+    assert await scheduler.acquire_training_lock("run-2") is None
+
+    await scheduler.release_training_lock("run-1")
+    assert await scheduler.acquire_training_lock("run-2") == "run-2"
+
+
+async def test_heartbeat_outlives_the_ttl(server, monkeypatch):
+    monkeypatch.setattr(settings, "TRAINING_LOCK_TTL_SECONDS", 1)
+    token = await scheduler.acquire_training_lock("run-1")
+
+    with scheduler.TrainingLockHeartbeat(
+        token, redis=sync_client(server), interval=0.1
+    ):
+        time.sleep(1.5)
+        assert await scheduler.acquire_training_lock("run-1") is None
+
+    # Heartbeats stopped (the worker died): the redelivered task takes over
+    time.sleep(1.2)
+    assert await scheduler.acquire_training_lock("run-1") == "run-1"
+
+
+async def test_heartbeat_does_not_renew_another_runs_lock(server, monkeypatch):
+    monkeypatch.setattr(settings, "TRAINING_LOCK_TTL_SECONDS", 1)
+    await scheduler.acquire_training_lock("run-1")
+    redis = sync_client(server)
+    redis.set(scheduler.LOCK_KEY, "run-2", ex=100)
+
+    with scheduler.TrainingLockHeartbeat("run-1", redis=redis, interval=0.1):
+        time.sleep(0.3)
+
+    assert redis.get(scheduler.LOCK_KEY) == "run-2"
+    # A renewal would have set the TTL back to 1 s
+    assert redis.ttl(scheduler.LOCK_KEY) > 1
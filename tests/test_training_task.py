@@ -0,0 +1,99 @@
+"""train_recommendation_model_task with a stubbed train_model and fakeredis."""
+
+import functools
+
+import fakeredis
+import fakeredis.aioredis
+import numpy as np
+import pytest
+
+from app.db import crud, session
+from app.services.recommender import checkpoints, train
+from app.services.recommender.checkpoints import DatasetSnapshot, TrainingCheckpoints
+from app.services.recommender.vocabulary import MovieVocabulary
+from app.worker import scheduler
+from app.worker.tasks import train_recommendation_model_task
+
+FINGERPRINT = {"count": 3, "max_timestamp": 30, "max_id": 3}
+
+
+class _Session:
+    async def __aenter__(self):
+        return None
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+
+@pytest.fixture
+def redis(monkeypatch, tmp_path):
+    server = fakeredis.FakeServer()
+    client = fakeredis.aioredis.FakeRedis(server=server, decode_responses=True)
+    monkeypatch.setattr(scheduler, "get_redis", lambda: client)
+    monkeypatch.setattr(
+        scheduler,
+        "TrainingLockHeartbeat",
+        functools.partial(
+            scheduler.TrainingLockHeartbeat,
+            redis=fakeredis.FakeRedis(server=server, decode_responses=True),
+        ),
+    )
+    monkeypatch.setattr(
+        checkpoints,
+        "TrainingCheckpoints",
+        functools.partial(TrainingCheckpoints, root=tmp_path),
+    )
+    monkeypatch.setattr(session, "AsyncSessionLocal", _Session)
+
+    async def get_fingerprint(db):
+        return FINGERPRINT
+
+    monkeypatch.setattr(crud.rating, "get_fingerprint", get_fingerprint)
+    return fakeredis.FakeRedis(server=server, decode_responses=True)
+
+
+def stub_training(monkeypatch, outcome):
+    """train_model that snapshots its dataset, then returns or raises `outcome`."""
+
+    async def train_model(db, run, run_checkpoints, workers=None):
+        examples = np.zeros((2, 3), dtype=np.int32)
+        run_checkpoints.save_snapshot(
+            DatasetSnapshot(
+                MovieVocabulary(np.array([5, 7])),
+                examples,
+                examples[:, 0],
+                examples,
+                examples[:, 0],
+            )
+        )
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    monkeypatch.setattr(train, "train_model", train_model)
+
+
+@pytest.mark.parametrize("outcome", [False, RuntimeError("boom")])
+def test_failed_run_leaves_nothing_to_resume(monkeypatch, tmp_path, redis, outcome):
+    stub_training(monkeypatch, outcome)
+
+    result = train_recommendation_model_task.apply(
+        kwargs={"force": True}, task_id="failed"
+    )
+
+    assert result.failed() == isinstance(outcome, Exception)
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_lock_is_released_after_the_run(monkeypatch, redis):
+    stub_training(monkeypatch, True)
+
+    result = train_recommendation_model_task.apply(
+        kwargs={"force": True}, task_id="done"
+    )
+
+    assert result.successful()
+    assert not redis.exists(scheduler.LOCK_KEY)
+    assert redis.hgetall(scheduler.FINGERPRINT_KEY) == {
+        name: str(value) for name, value in FINGERPRINT.items()
+    }
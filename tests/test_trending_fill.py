@@ -0,0 +1,93 @@
+"""Trending top-up of personalised recommendations."""
+
+import json
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+from app.api.v1.endpoints import recommendations
+from app.db.models import Movie, Rating, User
+from app.schemas.recommendation import RecommendationBatchRequest
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def trending_calls(monkeypatch):
+    calls = []
+
+    async def get_trending_recommendations(db, count, genre=None, exclude_movie_ids=()):
+        calls.append(sorted(exclude_movie_ids))
+        return [{"movie_id": 100 + i} for i in range(count)]
+
+    async def get_rated_movie_ids(db, user_id):
+        return [7, 8]
+
+    monkeypatch.setattr(
+        recommendations, "get_trending_recommendations", get_trending_recommendations
+    )
+    monkeypatch.setattr(
+        recommendations.crud.rating, "get_rated_movie_ids", get_rated_movie_ids
+    )
+    return calls
+
+
+async def test_excludes_recommended_and_watched_movies(trending_calls):
+    user = SimpleNamespace(id=1)
+    filled = await recommendations._fill_with_trending(
+        None, user, [{"movie_id": 3}], count=3
+    )
+    assert trending_calls == [[3, 7, 8]]
+    assert [rec["movie_id"] for rec in filled] == [3, 100, 101]
+
+
+async def test_keeps_watched_movies_when_asked(trending_calls):
+    user = SimpleNamespace(id=1)
+    await recommendations._fill_with_trending(
+        None, user, [], count=2, exclude_watched=False
+    )
+    assert trending_calls == [[]]
+
+
+async def test_batch_excludes_ratings_older_than_the_history(
+    monkeypatch, sqlite_engine
+):
+    Session = sessionmaker(sqlite_engine(), class_=AsyncSession)
+    async with Session() as db:
+        db.add(User(id=1, email="a@example.com", hashed_password="x"))
+        db.add_all(Movie(id=movie_id, title=str(movie_id)) for movie_id in range(1, 6))
+        # Only the two latest ratings fit in the loaded history
+        db.add_all(
+            Rating(user_id=1, movie_id=movie_id, rating=4.0, timestamp=movie_id)
+            for movie_id in (1, 2, 3)
+        )
+        await db.commit()
+
+    async def get_trending_recommendations(db, count, genre=None, exclude_movie_ids=()):
+        ranked = [
+            movie_id for movie_id in range(1, 6) if movie_id not in exclude_movie_ids
+        ]
+        return [{"movie_id": movie_id} for movie_id in ranked[:count]]
+
+    monkeypatch.setattr(recommendations, "AsyncSessionLocal", Session)
+    monkeypatch.setattr(recommendations, "refresh_model_in_background", lambda: None)
+    monkeypatch.setattr(
+        recommendations,
+        "recommend_for_histories",
+        lambda histories, **kwargs: {user_id: [] for user_id in histories},
+    )
+    monkeypatch.setattr(
+        recommendations, "get_trending_recommendations", get_trending_recommendations
+    )
+    monkeypatch.setattr(recommendations.settings, "MAX_CONTEXT_LENGTH", 1)
+
+    request_in = RecommendationBatchRequest(user_ids=[1], count=2)
+    lines = [
+        chunk
+        async for chunk in recommendations._stream_batch_recommendations(request_in)
+    ]
+
+    row = json.loads(lines[0])
+    assert [rec["movie_id"] for rec in row["recommendations"]] == [4, 5]